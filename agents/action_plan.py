@@ -0,0 +1,142 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+# Completed results by action name -> awaitable of this action's result
+ActionFn = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+# Action.timeout default: use the plan's timeout (None means no timeout)
+PLAN_TIMEOUT: Any = object()
+
+
+class ActionSkipped(Exception):
+    """An action was not run because an action it depends on failed."""
+
+
+@dataclass
+class Action:
+    """
+    One per-ticket side effect in an agent's action plan.
+
+    run receives the results of the actions finished so far (by name), so
+    dependents can use them, e.g. the id create_ticket returned. timeout
+    (seconds) overrides the plan's default; None disables it, e.g. for LLM
+    calls that are already bounded by the client's own timeouts and retries.
+    """
+    name: str
+    run: ActionFn
+    depends_on: Sequence[str] = ()
+    timeout: Any = PLAN_TIMEOUT
+
+
+@dataclass
+class ActionResult:
+    """Outcome of one action in a plan"""
+    name: str
+    result: Any = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def status(self) -> str:
+        if self.error is None:
+            return "ok"
+        if isinstance(self.error, ActionSkipped):
+            return "skipped"
+        if isinstance(self.error, asyncio.TimeoutError):
+            return "timeout"
+        return "failed"
+
+
+@dataclass
+class PlanResult:
+    """Per-action outcomes of an executed plan, in declaration order."""
+    actions: Dict[str, ActionResult] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(action.ok for action in self.actions.values())
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """Result of an action, or default if it failed, was skipped or is not in the plan."""
+        action = self.actions.get(name)
+        return action.result if action is not None and action.ok else default
+
+    def unwrap(self, name: str) -> Any:
+        """Result of an action, or raise its error."""
+        action = self.actions[name]
+        if action.error is not None:
+            raise action.error
+        return action.result
+
+    def errors(self) -> Dict[str, str]:
+        """Error message by action name, for every action that did not succeed."""
+        return {name: str(action.error) for name, action in self.actions.items() if not action.ok}
+
+
+async def execute_plan(
+    actions: Sequence[Action],
+    timeout: Optional[float] = None,
+    max_concurrency: Optional[int] = None
+) -> PlanResult:
+    """
+    Run actions as soon as everything they depend on has succeeded, so
+    independent actions overlap. An action that fails or times out does not
+    stop the others; its dependents are skipped. Dependencies must name
+    actions declared earlier in the plan.
+    """
+    plan = PlanResult({action.name: ActionResult(action.name) for action in actions})
+    if len(plan.actions) != len(actions):
+        raise ValueError("Action names in a plan must be unique")
+    seen = set()
+    for action in actions:
+        unknown = [name for name in action.depends_on if name not in seen]
+        if unknown:
+            raise ValueError(f"Action {action.name!r} depends on {unknown[0]!r}, which is not declared before it")
+        seen.add(action.name)
+
+    done: Dict[str, Any] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+    slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def run(action: Action):
+        outcome = plan.actions[action.name]
+        if action.depends_on:
+            await asyncio.wait([tasks[name] for name in action.depends_on])
+            failed = [name for name in action.depends_on if not plan.actions[name].ok]
+            if failed:
+                outcome.error = ActionSkipped(f"skipped: {failed[0]} did not succeed")
+                return
+        limit = timeout if action.timeout is PLAN_TIMEOUT else action.timeout
+        started = time.perf_counter()
+        try:
+            if slots is None:
+                outcome.result = await asyncio.wait_for(action.run(dict(done)), limit)
+            else:
+                async with slots:
+                    outcome.result = await asyncio.wait_for(action.run(dict(done)), limit)
+            done[action.name] = outcome.result
+        except asyncio.TimeoutError:
+            outcome.error = asyncio.TimeoutError(f"{action.name} timed out after {limit}s")
+        except Exception as e:
+            outcome.error = e
+        finally:
+            outcome.elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for action in actions:
+        tasks[action.name] = asyncio.ensure_future(run(action))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        # Cancelled from outside: don't leave side effects running unobserved
+        for task in tasks.values():
+            task.cancel()
+    plan.elapsed = time.perf_counter() - started
+    return plan
@@ -1,12 +1,23 @@
-from typing import Any, Dict, Optional, List
-from agent_auth.credentials import CredentialStore, CredentialType
-from a2a_collaboration.communication import A2ACommunicationBus
-from utils.mcp import MCPClient
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Optional, List, Sequence, Tuple
+from utils.mcp import MCPClient, ToolOperation, ToolResult
 from utils.policy import OPAPolicyClient
 from utils.audit_logging import AuditLogger
-from a2a_collaboration.models import A2AAgent, A2ACapabilities, CollaborationMetadata
-from a2a_collaboration.registry import A2ARegistry
-from .llm import LLMClient, LLMConfig, LLMProvider
+if TYPE_CHECKING:
+    # Auth/A2A stacks are only needed once an agent authenticates or registers
+    from agent_auth.credentials import CredentialStore
+    from a2a_collaboration.communication import A2ACommunicationBus
+    from a2a_collaboration.models import A2AAgent
+    from a2a_collaboration.registry import A2ARegistry
+from .action_plan import Action, PlanResult, execute_plan
+from .llm import BatchResult, LLMClient, LLMConfig, LLMProvider, estimate_tokens, prompt_prefix_key
+from .llm_scheduler import DEFAULT_PRIORITY
+from .llm_hedging import HedgedLLMClient
+from .llm_resilience import LLMError
+from .semantic_cache import get_semantic_cache, ticket_text
+from .ticket_render import DEFAULT_TICKET_FIELDS, TicketRenderer
 # from policy_engine import PolicyClient  # Assume a client for OPA policy evaluation
 
 class BaseAgent:
@@ -14,6 +25,17 @@ class BaseAgent:
     Base class for all IT Helpdesk agents.
     Handles authentication, authorization, communication, MCP proxy, and LLM integration.
     """
+    # TTL (seconds) for cached LLM responses; None uses the cache default, 0 disables
+    llm_cache_ttl: Optional[float] = None
+    # Scheduler priority for this agent's LLM calls; lower values are served first
+    llm_priority: float = DEFAULT_PRIORITY
+    # Ticket fields (and token budget) rendered into this agent's prompts
+    ticket_fields: Sequence[str] = DEFAULT_TICKET_FIELDS
+    ticket_token_budget: int = 600
+    # Default per-action timeout (seconds) and concurrency limit for run_action_plan
+    action_timeout: Optional[float] = 30.0
+    action_concurrency: Optional[int] = None
+
     def __init__(
         self,
         agent_id: str,
@@ -33,18 +55,33 @@ class BaseAgent:
         self.mcp_client = mcp_client
         self.policy_client = policy_client
         self.llm_config = llm_config
-        self.llm_client = LLMClient(self.llm_config)
+        # Optional ordered fallbacks (e.g. OpenAI, then local Ollama) enable hedging/failover
+        fallback_configs = kwargs.get("llm_fallback_configs")
+        if fallback_configs:
+            self.llm_client = HedgedLLMClient([self.llm_config, *fallback_configs])
+        else:
+            self.llm_client = LLMClient(self.llm_config)
         # self.policy_client = policy_client
         self.secret = secret
         self.jwt_token: Optional[str] = None
         self.authenticated = False
         self.extra = kwargs
         self.audit_logger = audit_logger
+        if "llm_cache_ttl" in kwargs:
+            self.llm_cache_ttl = kwargs["llm_cache_ttl"]
+        # Falls back to the process-wide semantic cache (disabled unless configured)
+        self.semantic_cache = kwargs.get("semantic_cache")
+        self.ticket_renderer = TicketRenderer(self.ticket_fields, self.ticket_token_budget)
+
+    def render_ticket(self, ticket: Dict[str, Any]) -> str:
+        """Compact, token-budgeted rendering of a ticket for this agent's prompts."""
+        return self.ticket_renderer.render(ticket)
 
     async def authenticate(self) -> bool:
         """Authenticate the agent and obtain a JWT token."""
         # TODO: Replace with real authentication logic
         # OFor demo: create and validate credential, then generate JWT
+        from agent_auth.credentials import CredentialType
         creds = self.credential_store.get_agent_credentials(self.agent_id)
         if not creds:
             self.credential_store.create_credential(
@@ -76,6 +113,45 @@ class BaseAgent:
         )
         return allowed
 
+    async def authorize_many(
+        self,
+        requests: Sequence[Tuple[str, str, Optional[Dict[str, Any]]]]
+        ) -> List[bool]:
+        """
+        Authorize several (action, resource, context) requests with one OPA
+        query, e.g. an agent's whole per-ticket action plan up front.
+
+        Returns one allow flag per request, in order, and writes a single
+        aggregated policy_decision audit record.
+        """
+        inputs = [
+            {"agent_id": self.agent_id, "action": action, "resource": resource, "context": context or {}}
+            for action, resource, context in requests
+        ]
+        results = await self.policy_client.evaluate_many(inputs)
+        allowed = [bool(result.get("allow", False)) for result in results]
+        ticket_ids = {(input_data["context"] or {}).get("ticket_id") for input_data in inputs}
+        details: Dict[str, Any] = {
+            "decisions": [
+                {"action": input_data["action"], "resource": input_data["resource"],
+                 "context": input_data["context"], "policy_result": result}
+                for input_data, result in zip(inputs, results)
+            ],
+            "allowed": sum(allowed),
+            "denied": len(allowed) - sum(allowed),
+            # Overall outcome, so audit sampling always keeps batches with a denial
+            "policy_result": {"allow": all(allowed)}
+        }
+        if len(ticket_ids) == 1 and None not in ticket_ids:
+            details["ticket_id"] = ticket_ids.pop()
+        await self.audit_logger.log_audit_event(
+            event_type="policy_decision",
+            agent_id=self.agent_id,
+            action="authorize_many",
+            details=details
+        )
+        return allowed
+
     async def send_message(self, recipient_id: str, intent: str, data: Dict[str, Any], **kwargs) -> str:
         """Send a message to another agent via the communication bus."""
         return await self.communication_bus.send_message(
@@ -91,7 +167,7 @@ class BaseAgent:
         raise NotImplementedError
 
     async def call_mcp_tool(self, tool_name: str, operation: str, arguments: Dict[str, Any]) -> Any:
-        result = await self.mcp_client.call_tool(tool_name, operation, arguments)
+        result = await self.mcp_client.call_tool(tool_name, operation, arguments, agent_id=self.agent_id)
         await self.audit_logger.log_audit_event(
             event_type="mcp_call",
             agent_id=self.agent_id,
@@ -100,10 +176,98 @@ class BaseAgent:
         )
         return result
 
+    async def call_mcp_tools(self, operations: Sequence[ToolOperation]) -> List[ToolResult]:
+        """
+        Run an ordered batch of (tool_name, operation, arguments) MCP calls
+        in as few round trips as their dependencies allow; arguments may use
+        ResultRef to take a value from an earlier operation's result:
+
+            created, note = await self.call_mcp_tools([
+                ("freshdesk", "create_ticket", ticket),
+                ("freshdesk", "add_note", {"ticket_id": ResultRef(0, "id"), "note": analysis}),
+            ])
+
+        Returns one ToolResult per operation (use .unwrap() to get the
+        result or raise its error) and writes a single mcp_call audit record.
+        """
+        started = time.perf_counter()
+        results = await self.mcp_client.call_tools(operations, agent_id=self.agent_id)
+        failed = [r for r in results if not r.ok]
+        ticket_ids = {r.arguments.get("ticket_id", r.arguments.get("id")) for r in results if isinstance(r.arguments, dict)}
+        details: Dict[str, Any] = {
+            "operations": [
+                {"action": f"{r.tool_name}.{r.operation}", "arguments": r.arguments, "result": r.result,
+                 **({"error": str(r.error)} if r.error is not None else {})}
+                for r in results
+            ],
+            "succeeded": len(results) - len(failed),
+            "failed": len(failed),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        if failed:
+            # Top-level error, so audit sampling always keeps batches with a failure
+            details["error"] = str(failed[0].error)
+        if len(ticket_ids) == 1 and None not in ticket_ids:
+            details["ticket_id"] = ticket_ids.pop()
+        await self.audit_logger.log_audit_event(
+            event_type="mcp_call",
+            agent_id=self.agent_id,
+            action="call_mcp_tools",
+            details=details
+        )
+        return results
+
+    async def run_action_plan(self, actions: Sequence[Action], ticket_id: Optional[Any] = None) -> PlanResult:
+        """
+        Execute this agent's per-ticket side effects, running every action
+        whose dependencies have succeeded concurrently with the others:
+
+            plan = await self.run_action_plan([
+                Action("note", lambda done: self.call_mcp_tool("freshdesk", "add_note", note)),
+                Action("escalate", lambda done: self.send_message("escalation_manager", "security_incident", data)),
+            ], ticket_id=ticket["id"])
+
+        Failures and timeouts are reported per action in the returned
+        PlanResult (dependents are skipped) and in one action_plan audit record.
+        """
+        plan = await execute_plan(actions, self.action_timeout, self.action_concurrency)
+        errors = plan.errors()
+        details: Dict[str, Any] = {
+            "actions": [
+                {"name": name, "status": action.status, "elapsed_ms": round(action.elapsed * 1000, 2),
+                 **({"error": str(action.error)} if action.error is not None else {})}
+                for name, action in plan.actions.items()
+            ],
+            "elapsed_ms": round(plan.elapsed * 1000, 2),
+            "failed": len(errors)
+        }
+        if errors:
+            # Top-level error, so audit sampling always keeps partially failed plans
+            details["error"] = next(iter(errors.values()))
+        if ticket_id is not None:
+            details["ticket_id"] = ticket_id
+        await self.audit_logger.log_audit_event(
+            event_type="action_plan",
+            agent_id=self.agent_id,
+            action="run_action_plan",
+            details=details
+        )
+        return plan
+
+    def ticket_llm_priority(self, ticket: Optional[Dict[str, Any]]) -> float:
+        """Agent LLM priority, moved ahead half a step per Freshdesk priority level above Low."""
+        try:
+            level = int((ticket or {}).get("priority") or 1)
+        except (TypeError, ValueError):
+            level = 1
+        return self.llm_priority - 0.5 * (min(max(level, 1), 4) - 1)
+
     async def run_llm(
         self, 
         prompt: str, 
-        override_config: Optional[LLMConfig] = None
+        override_config: Optional[LLMConfig] = None,
+        priority: Optional[float] = None,
+        ticket_id: Optional[Any] = None
         ) -> str:
         """
         Call LLM with the given prompt and optional system prompt.
@@ -112,24 +276,35 @@ class BaseAgent:
             prompt: The user prompt to send to the LLM
             system_prompt: Optional system prompt to set context/behavior
             override_config: Optional LLM config to use instead of default
+            priority: Scheduler priority (defaults to the agent's llm_priority)
+            ticket_id: Ticket the call is about, recorded in the audit event
             
         Returns:
             Generated response from the LLM
             
         Raises:
-            Exception: If LLM generation fails or no LLM is configured
+            LLMError: If LLM generation fails (classified, e.g. LLMRateLimitError,
+                CircuitOpenError) after any retries
+            Exception: If no LLM is configured
         """
         if not self.llm_client and not override_config:
             raise Exception("No LLM client configured for this agent")
         
-        # Use override config if provided
+        # Use override config if provided; the SDK client behind it is shared
+        # through the process-wide registry, so this does not open a new pool
         client = self.llm_client
         if override_config:
             client = LLMClient(override_config)
         
+        call_info: Dict[str, Any] = {}
+        if ticket_id is not None:
+            call_info["ticket_id"] = ticket_id
         try:
             # Generate response
-            response = await client.generate(prompt, self.system_prompt)
+            response = await client.generate(
+                prompt, self.system_prompt, call_info=call_info, cache_ttl=self.llm_cache_ttl,
+                priority=self.llm_priority if priority is None else priority
+            )
             
             # Log the LLM call for audit purposes
             await self.audit_logger.log_audit_event(
@@ -141,7 +316,8 @@ class BaseAgent:
                     "model": (override_config or self.llm_config).model,
                     "prompt_length": len(prompt),
                     "response_length": len(response),
-                    "has_system_prompt": bool(self.system_prompt)
+                    "has_system_prompt": bool(self.system_prompt),
+                    **call_info
                 }
             )
             
@@ -155,11 +331,190 @@ class BaseAgent:
                 action="generate_response",
                 details={
                     "error": str(e),
+                    "error_type": type(e).__name__,
                     "provider": (override_config or self.llm_config).provider.value,
-                    "model": (override_config or self.llm_config).model
+                    "model": (override_config or self.llm_config).model,
+                    **call_info
                 }
             )
-            raise Exception(f"LLM generation failed: {str(e)}")
+            if isinstance(e, LLMError):
+                raise
+            raise LLMError(f"LLM generation failed: {str(e)}") from e
+
+    async def run_llm_many(
+        self,
+        prompts: List[str],
+        max_concurrency: int = 8,
+        override_config: Optional[LLMConfig] = None,
+        **kwargs
+        ) -> List[BatchResult]:
+        """
+        Run the LLM over many prompts with bounded, 429-adaptive concurrency.
+
+        Results come back in prompt order; a failed item carries its error in
+        BatchResult.error instead of failing the batch. Extra kwargs are passed
+        to LLMClient.generate_many (e.g. native_batch=True).
+        """
+        if not self.llm_client and not override_config:
+            raise Exception("No LLM client configured for this agent")
+
+        client = LLMClient(override_config) if override_config else self.llm_client
+        config = override_config or self.llm_config
+        started = time.perf_counter()
+        results = await client.generate_many(prompts, self.system_prompt, max_concurrency=max_concurrency, **kwargs)
+        await self.audit_logger.log_audit_event(
+            event_type="llm_call",
+            agent_id=self.agent_id,
+            action="generate_batch",
+            details={
+                "provider": config.provider.value,
+                "model": config.model,
+                "batch_size": len(prompts),
+                "errors": sum(1 for r in results if not r.ok),
+                "max_concurrency": max_concurrency,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+                "has_system_prompt": bool(self.system_prompt)
+            }
+        )
+        return results
+
+    async def run_llm_for_ticket(
+        self,
+        ticket: Dict[str, Any],
+        prompt: str,
+        override_config: Optional[LLMConfig] = None
+        ) -> str:
+        """
+        Run the LLM analysis for a ticket, reusing the analysis of a
+        near-duplicate ticket (by subject and description) when the semantic
+        cache is enabled.
+        """
+        priority = self.ticket_llm_priority(ticket)
+        cache = self.semantic_cache or get_semantic_cache()
+        text = ticket_text(ticket) if cache is not None else ""
+        if not text:
+            return await self.run_llm(prompt, override_config, priority, ticket.get("id"))
+
+        namespace = self.semantic_namespace(override_config or self.llm_config)
+        match = cache.lookup(namespace, text)
+        if match is not None:
+            analysis, similarity = match
+            config = override_config or self.llm_config
+            await self.audit_logger.log_audit_event(
+                event_type="llm_call",
+                agent_id=self.agent_id,
+                action="generate_response",
+                details={
+                    "provider": config.provider.value,
+                    "model": config.model,
+                    "prompt_length": len(prompt),
+                    "response_length": len(analysis),
+                    "has_system_prompt": bool(self.system_prompt),
+                    "ticket_id": ticket.get("id"),
+                    "semantic_cache": "hit",
+                    "similarity": round(similarity, 4)
+                }
+            )
+            return analysis
+
+        analysis = await self.run_llm(prompt, override_config, priority, ticket.get("id"))
+        cache.add(namespace, text, analysis)
+        return analysis
+
+    def semantic_namespace(self, config: LLMConfig) -> str:
+        """Semantic cache namespace: analyses are reused only for the same agent, model and system prompt."""
+        return f"{self.agent_id}:{config.provider.value}:{config.model}:{prompt_prefix_key(self.system_prompt or '')}"
+
+    async def run_llm_stream(
+        self,
+        prompt: str,
+        override_config: Optional[LLMConfig] = None,
+        priority: Optional[float] = None,
+        ticket_id: Optional[Any] = None
+        ) -> AsyncIterator[str]:
+        """
+        Stream the LLM response for the given prompt as text deltas.
+
+        Agents can act on partial output while the rest is still generating,
+        e.g. TriageAgent assigns the ticket as soon as the category line of
+        its analysis is complete.
+
+        The llm_call audit event is written when the stream ends and records
+        time-to-first-token and tokens/sec alongside the usual fields. Cached
+        and coalesced responses arrive as a single delta.
+
+        Raises:
+            LLMError: If LLM generation fails
+            Exception: If no LLM is configured
+        """
+        if not self.llm_client and not override_config:
+            raise Exception("No LLM client configured for this agent")
+
+        client = self.llm_client
+        if override_config:
+            client = LLMClient(override_config)
+        config = override_config or self.llm_config
+
+        started = time.perf_counter()
+        first_token_at = None
+        chunks = []
+        completed = failed = False
+        call_info: Dict[str, Any] = {}
+        if ticket_id is not None:
+            call_info["ticket_id"] = ticket_id
+        try:
+            async for delta in client.generate_stream(
+                prompt, self.system_prompt, self.llm_priority if priority is None else priority,
+                call_info=call_info, cache_ttl=self.llm_cache_ttl
+            ):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                chunks.append(delta)
+                yield delta
+            completed = True
+        except Exception as e:
+            failed = True
+            await self.audit_logger.log_audit_event(
+                event_type="llm_error",
+                agent_id=self.agent_id,
+                action="generate_response",
+                details={
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "provider": config.provider.value,
+                    "model": config.model,
+                    "streamed": True,
+                    "breaker_state": client.breaker.state,
+                    **call_info
+                }
+            )
+            if isinstance(e, LLMError):
+                raise
+            raise LLMError(f"LLM generation failed: {str(e)}") from e
+        finally:
+            if not failed and (completed or first_token_at is not None):
+                # Also reached when the consumer stops early (completed=False)
+                finished = time.perf_counter()
+                response = "".join(chunks)
+                generation_time = finished - (first_token_at or finished)
+                tokens = estimate_tokens(response)
+                await self.audit_logger.log_audit_event(
+                    event_type="llm_call",
+                    agent_id=self.agent_id,
+                    action="generate_response",
+                    details={
+                        "provider": config.provider.value,
+                        "model": config.model,
+                        "prompt_length": len(prompt),
+                        "response_length": len(response),
+                        "has_system_prompt": bool(self.system_prompt),
+                        "streamed": True,
+                        "completed": completed,
+                        "time_to_first_token_ms": round(((first_token_at or finished) - started) * 1000, 2),
+                        "tokens_per_sec": round(tokens / generation_time, 2) if generation_time > 0 else None,
+                        **call_info
+                    }
+                )
 
     async def run_llm_with_tools(
         self, 
@@ -203,8 +558,25 @@ class BaseAgent:
             kwargs["tools"] = available_tools
             kwargs["tool_choice"] = "auto"
         
+        # With llm_fallback_configs, tool calls fail over in order to the next tool-capable
+        # provider (they are not hedged: the raw SDK call bypasses LLMClient.generate)
+        clients = [
+            client for client in getattr(self.llm_client, "clients", [self.llm_client])
+            if client.config.provider in (LLMProvider.OPENAI, LLMProvider.AZURE_OPENAI)
+        ]
         try:
-            response = await self.llm_client._client.chat.completions.create(**kwargs)
+            for index, client in enumerate(clients):
+                try:
+                    response = await client._client.chat.completions.create(**{
+                        **kwargs,
+                        "model": client.config.model,
+                        "temperature": client.config.temperature,
+                        "max_tokens": client.config.max_tokens
+                    })
+                    break
+                except Exception:
+                    if index == len(clients) - 1:
+                        raise
             
             message = response.choices[0].message
             result = {
@@ -235,6 +607,7 @@ class BaseAgent:
     @classmethod
     def from_a2aagent(cls, a2a_agent: A2AAgent, credential_store, communication_bus, mcp_client, policy_client, secret, audit_logger: AuditLogger, **kwargs):
         # Map A2AAgent fields to BaseAgent
+        from a2a_collaboration.models import A2ACapabilities, CollaborationMetadata
         return cls(
             agent_id=a2a_agent.id,
             credential_store=credential_store,
@@ -256,6 +629,7 @@ class BaseAgent:
 
     def register(self, registry: A2ARegistry):
         # Register this agent in the A2ARegistry
+        from a2a_collaboration.models import A2ACapabilities, CollaborationMetadata
         a2a_cap = getattr(self, 'a2a_capabilities', None)
         if not a2a_cap:
             # Fallback: create from fields if not present
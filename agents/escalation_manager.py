@@ -1,4 +1,5 @@
 from typing import Any, Dict
+from .action_plan import Action
 from .base import BaseAgent
 from .system_prompts import SYSTEM_PROMPTS
 
@@ -6,6 +7,14 @@ class EscalationManagerAgent(BaseAgent):
     """
     Agent for managing complex cases and escalations.
     """
+    # Progress checks go stale quickly; only absorb immediate retries
+    llm_cache_ttl = 60.0
+    # Routine monitoring yields to everything else
+    llm_priority = 8.0
+    # Progress lives in the thread, so give it more of the budget
+    ticket_fields = ("id", "subject", "priority", "status", "tags", "description", "conversations")
+    ticket_token_budget = 900
+
     def __init__(self, *a, **kw):
         super().__init__(*a, **kw)
         self.system_prompt = SYSTEM_PROMPTS["escalation_manager_agent"]
@@ -14,17 +23,27 @@ class EscalationManagerAgent(BaseAgent):
         ticket = message.payload.data.get("ticket")
         if not ticket:
             return {"error": "No ticket found in message."}
-        # Monitor progress with LLM
-        progress = await self.run_llm(f"Monitor escalation progress for ticket: {ticket}")
-        reassigned = False
-        if "stalled" in progress.lower():
-            reassigned = True
+
+        async def reassign(done):
+            if "stalled" not in done["progress"].lower():
+                return False
             await self.call_mcp_tool(
                 tool_name="freshdesk",
                 operation="assign_ticket",
                 arguments={"ticket_id": ticket.get("id"), "assignee": "senior_tech_support"}
             )
+            return True
+
+        plan = await self.run_action_plan([
+            # Monitor progress with LLM
+            Action("progress", lambda done: self.run_llm(
+                f"Monitor escalation progress for ticket:\n{self.render_ticket(ticket)}",
+                priority=self.ticket_llm_priority(ticket), ticket_id=ticket.get("id")
+            ), timeout=None),
+            Action("reassign", reassign, depends_on=("progress",))
+        ], ticket_id=ticket.get("id"))
         return {
-            "progress": progress,
-            "reassigned": reassigned
+            "progress": plan.unwrap("progress"),
+            "reassigned": bool(plan.get("reassign")),
+            "failed_actions": plan.errors()
         } 
\ No newline at end of file
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+class FakeRateLimitError(Exception):
+    """Raised by the fake backend to simulate a provider 429."""
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        # Mimic SDK errors, which carry the HTTP response
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = type("FakeResponse", (), {"headers": headers})()
+
+
+class FakeServerError(Exception):
+    """Raised by the fake backend to simulate a provider 5xx."""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ReplayMissError(Exception):
+    """A replayed request has no recording in the cassette."""
+    status_code = 404
+
+
+# Keyword rules used to generate plausible agent output offline
+DEFAULT_RULES: List[Tuple[str, str]] = [
+    (r"malware|phish|suspicious|breach|unauthori[sz]ed", "Security"),
+    (r"vpn|network|wifi|wi-fi|router|dns|connect", "Network"),
+    (r"stalled|escalat|critical|outage", "Escalation"),
+]
+
+
+def request_key(system_prompt: Optional[str], prompt: str) -> str:
+    """Provider-independent identity of a request, used by cassettes."""
+    material = json.dumps([system_prompt or "", prompt], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class FakeLLMBackend:
+    """
+    Local, offline stand-in for a provider SDK client.
+
+    Responses are canned (first matching regex in `responses`) or generated
+    from keyword rules, deterministically per prompt. Latency is either a
+    fixed `latency` or a lognormal time-to-first-token (ttft_median,
+    ttft_sigma) plus per_token_latency per output token. 429s and 5xx
+    errors are injected at the configured rates, and max_concurrent
+    rejects requests beyond that many in flight with a 429.
+    """
+
+    def __init__(
+        self,
+        model: str = "fake",
+        latency: float = 0.05,
+        max_concurrent: Optional[int] = None,
+        ttft_median: Optional[float] = None,
+        ttft_sigma: float = 0.5,
+        per_token_latency: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        retry_after: Optional[float] = None,
+        responses: Optional[Dict[str, str]] = None,
+        seed: Optional[int] = None
+    ):
+        self.model = model
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.ttft_median = ttft_median
+        self.ttft_sigma = ttft_sigma
+        self.per_token_latency = per_token_latency
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.retry_after = retry_after
+        self.responses = [(re.compile(p, re.IGNORECASE), r) for p, r in (responses or {}).items()]
+        self.rng = random.Random(seed)
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+
+    @classmethod
+    def from_params(cls, model: str, params: Optional[Dict[str, Any]] = None) -> "FakeLLMBackend":
+        return cls(model=model, **(params or {}))
+
+    def respond(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        for pattern, response in self.responses:
+            if pattern.search(prompt):
+                return response
+        category = next((c for p, c in DEFAULT_RULES if re.search(p, prompt, re.IGNORECASE)), "Technical Support")
+        digest = request_key(system_prompt, prompt)[:8]
+        return (
+            f"Category: {category}\n"
+            f"Assessment [{self.model}:{digest}]: {prompt[:200]}\n"
+            "Next steps: gather diagnostics, apply the standard runbook, and follow up with the requester."
+        )
+
+    def _ttft(self) -> float:
+        if self.ttft_median is None:
+            return self.latency
+        return self.rng.lognormvariate(math.log(self.ttft_median), self.ttft_sigma)
+
+    def _admit(self):
+        if self.max_concurrent is not None and self.in_flight >= self.max_concurrent:
+            self.errors += 1
+            raise FakeRateLimitError("429 Too Many Requests (fake)", self.retry_after)
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            self.errors += 1
+            raise FakeRateLimitError("429 Too Many Requests (fake)", self.retry_after)
+        if roll < self.rate_limit_rate + self.server_error_rate:
+            self.errors += 1
+            raise FakeServerError("503 Service Unavailable (fake)")
+
+    @staticmethod
+    def _chunks(response: str) -> List[str]:
+        words = response.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    async def generate(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        self._admit()
+        self.in_flight += 1
+        self.calls += 1
+        try:
+            response = self.respond(prompt, system_prompt)
+            await asyncio.sleep(self._ttft() + self.per_token_latency * len(self._chunks(response)))
+            return response
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+        self._admit()
+        self.in_flight += 1
+        self.calls += 1
+        try:
+            await asyncio.sleep(self._ttft())
+            for chunk in self._stream_chunks(prompt, system_prompt):
+                yield chunk
+                if self.per_token_latency:
+                    await asyncio.sleep(self.per_token_latency)
+        finally:
+            self.in_flight -= 1
+
+    def _stream_chunks(self, prompt: str, system_prompt: Optional[str]) -> List[str]:
+        return self._chunks(self.respond(prompt, system_prompt))
+
+
+class Cassette:
+    """
+    JSON-lines recording of LLM interactions keyed by request_key().
+
+    Repeated identical requests are replayed in recorded order; streamed
+    recordings keep their original chunk boundaries.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+
+    def record(self, system_prompt: Optional[str], prompt: str, response: str,
+               chunks: Optional[List[str]] = None, model: Optional[str] = None):
+        entry = {"key": request_key(system_prompt, prompt), "model": model, "response": response}
+        if chunks is not None:
+            entry["chunks"] = chunks
+        self._entries.setdefault(entry["key"], []).append(entry)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def lookup(self, system_prompt: Optional[str], prompt: str) -> Dict[str, Any]:
+        key = request_key(system_prompt, prompt)
+        entries = self._entries.get(key)
+        if not entries:
+            raise ReplayMissError(f"No cassette recording for request {key[:12]} in {self.path}")
+        index = self._cursor.get(key, 0)
+        self._cursor[key] = index + 1
+        return entries[index % len(entries)]
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+
+class ReplayLLMBackend(FakeLLMBackend):
+    """Fake backend that answers from a recorded cassette, byte-for-byte."""
+
+    def __init__(self, model: str = "replay", cassette: str = None, latency: float = 0.0, **kwargs):
+        super().__init__(model=model, latency=latency, **kwargs)
+        self.cassette = Cassette(cassette or os.getenv("LLM_CASSETTE", "llm_cassette.jsonl"))
+
+    def respond(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        return self.cassette.lookup(system_prompt, prompt)["response"]
+
+    def _stream_chunks(self, prompt: str, system_prompt: Optional[str]) -> List[str]:
+        entry = self.cassette.lookup(system_prompt, prompt)
+        return entry.get("chunks") or self._chunks(entry["response"])
+
+
+_recorder: Optional[Cassette] = None
+
+def get_cassette_recorder() -> Optional[Cassette]:
+    """Return the cassette real provider calls are being recorded into, if any."""
+    return _recorder
+
+def set_cassette_recorder(cassette: Optional[Cassette]) -> Optional[Cassette]:
+    """Start (or with None, stop) recording real provider calls; returns the previous recorder."""
+    global _recorder
+    previous, _recorder = _recorder, cassette
+    return previous
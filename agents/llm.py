@@ -1,25 +1,51 @@
+import asyncio
+import datetime
+import hashlib
+import importlib
+import json
+import time
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 from enum import Enum
-try:
-    import openai
-except ImportError:
-    openai = None
-
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
-
-try:
-    import anthropic
-except ImportError:
-    anthropic = None
-
-try:
-    import ollama
-except ImportError:
-    ollama = None
+
+from .fake_llm import FakeLLMBackend, ReplayLLMBackend, get_cassette_recorder
+from .llm_cache import ResponseCache, cache_key, get_response_cache
+from .llm_resilience import (
+    CircuitBreaker, CircuitOpenError, LLMBadRequestError, LLMRateLimitError, RetryPolicy,
+    classify_error, get_circuit_breaker
+)
+from .llm_scheduler import DEFAULT_PRIORITY, LLMScheduler, get_scheduler
+from utils.singleflight import SingleFlight, get_single_flight
+
+# Provider SDKs are imported on first use (see _load_sdk), so a deployment
+# only pays the import cost of the provider it actually talks to
+openai = None
+genai = None
+anthropic = None
+ollama = None
+
+_SDK_MODULES = {
+    "openai": ("openai", "OpenAI library not installed. Run: pip install openai"),
+    "genai": ("google.generativeai", "Google AI library not installed. Run: pip install google-generativeai"),
+    "anthropic": ("anthropic", "Anthropic library not installed. Run: pip install anthropic"),
+    "ollama": ("ollama", "Ollama library not installed. Run: pip install ollama"),
+}
+
+def _load_sdk(name: str):
+    """Import a provider SDK on first use and bind it to its module-level name."""
+    module = globals()[name]
+    if module is None:
+        module_name, hint = _SDK_MODULES[name]
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            raise ImportError(hint)
+        globals()[name] = module
+    return module
+
+# Gemini context caching only accepts prefixes above a minimum size
+GEMINI_MIN_CACHED_TOKENS = 4096
+GEMINI_CACHE_TTL = 3600
 
 class LLMProvider(Enum):
     """Supported LLM providers"""
@@ -28,6 +54,11 @@ class LLMProvider(Enum):
     CLAUDE = "claude"
     OLLAMA = "ollama"
     AZURE_OPENAI = "azure_openai"
+    FAKE = "fake"  # Local offline backend for tests and benchmarks
+    REPLAY = "replay"  # Answers from a recorded cassette (extra_params["cassette"])
+
+# Offline backends that need no SDK, credentials or network
+LOCAL_PROVIDERS = (LLMProvider.FAKE, LLMProvider.REPLAY)
 
 @dataclass
 class LLMConfig:
@@ -40,123 +71,823 @@ class LLMConfig:
     max_tokens: Optional[int] = None
     timeout: int = 30
     extra_params: Optional[Dict[str, Any]] = None
+    # Use provider-side prompt prefix caching for the static system prompt
+    prompt_caching: bool = True
+
+class LLMClientRegistry:
+    """
+    Process-wide registry of shared, connection-pooled provider SDK clients.
+
+    SDK clients are keyed by the connection-relevant parts of an LLMConfig
+    (provider, credentials, endpoint, timeout), so every agent and every
+    override config that talks to the same endpoint reuses one HTTP pool.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        idle_timeout: float = 300.0
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.idle_timeout = idle_timeout
+        self._entries: Dict[Tuple, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def client_key(config: LLMConfig) -> Tuple:
+        """Key of the SDK client serving this config; model and sampling params are not part of it."""
+        key = (config.provider.value, config.api_key, config.base_url, config.timeout)
+        if config.provider == LLMProvider.GEMINI:
+            # GenerativeModel instances are bound to a single model
+            key += (config.model,)
+        elif config.provider in LOCAL_PROVIDERS:
+            # Fake/replay backends are configured entirely through extra_params
+            key += (config.model, json.dumps(config.extra_params or {}, sort_keys=True))
+        return key
+
+    def get(self, config: LLMConfig) -> Any:
+        """Return the shared SDK client for config, creating it on first use."""
+        key = self.client_key(config)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            client, http_client = self._build(config)
+            entry = {"client": client, "http_client": http_client, "timeout": config.timeout}
+            self._entries[key] = entry
+        entry["last_used"] = time.monotonic()
+        return entry["client"]
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _http_client(self, sdk, timeout: int):
+        import httpx
+        factory = getattr(sdk, "DefaultAsyncHttpxClient", None) or httpx.AsyncClient
+        return factory(limits=self._limits(), timeout=timeout)
+
+    def _build(self, config: LLMConfig) -> Tuple[Any, Any]:
+        """Create the SDK client for config; returns (client, owned httpx client or None)."""
+        if config.provider == LLMProvider.OPENAI:
+            openai = _load_sdk("openai")
+            http_client = self._http_client(openai, config.timeout)
+            return openai.AsyncOpenAI(
+                api_key=config.api_key,
+                base_url=config.base_url,
+                timeout=config.timeout,
+                http_client=http_client
+            ), http_client
+
+        elif config.provider == LLMProvider.AZURE_OPENAI:
+            openai = _load_sdk("openai")
+            http_client = self._http_client(openai, config.timeout)
+            return openai.AsyncAzureOpenAI(
+                api_key=config.api_key,
+                azure_endpoint=config.base_url,
+                api_version="2024-02-01",
+                timeout=config.timeout,
+                http_client=http_client
+            ), http_client
+
+        elif config.provider == LLMProvider.GEMINI:
+            genai = _load_sdk("genai")
+            # Gemini manages its own gRPC channel; there is no pool to configure
+            genai.configure(api_key=config.api_key)
+            return genai.GenerativeModel(config.model), None
+
+        elif config.provider == LLMProvider.CLAUDE:
+            anthropic = _load_sdk("anthropic")
+            http_client = self._http_client(anthropic, config.timeout)
+            return anthropic.AsyncAnthropic(
+                api_key=config.api_key,
+                timeout=config.timeout,
+                http_client=http_client
+            ), http_client
+
+        elif config.provider == LLMProvider.OLLAMA:
+            ollama = _load_sdk("ollama")
+            # ollama.AsyncClient forwards extra kwargs to its httpx.AsyncClient
+            client = ollama.AsyncClient(
+                host=config.base_url or "http://localhost:11434",
+                limits=self._limits(),
+                timeout=config.timeout
+            )
+            return client, getattr(client, "_client", None)
+
+        elif config.provider == LLMProvider.FAKE:
+            return FakeLLMBackend.from_params(config.model, config.extra_params), None
+
+        elif config.provider == LLMProvider.REPLAY:
+            return ReplayLLMBackend.from_params(config.model, config.extra_params), None
+
+        raise ValueError(f"Unsupported provider: {config.provider}")
+
+    async def _close_entry(self, entry: Dict[str, Any]):
+        http_client = entry.get("http_client")
+        if http_client is not None:
+            await http_client.aclose()
+
+    async def evict_idle(self, idle_timeout: Optional[float] = None) -> int:
+        """Close clients unused for longer than idle_timeout (never shorter than their request timeout)."""
+        idle_timeout = self.idle_timeout if idle_timeout is None else idle_timeout
+        now = time.monotonic()
+        stale = [
+            key for key, entry in self._entries.items()
+            if now - entry["last_used"] > max(idle_timeout, entry["timeout"])
+        ]
+        for key in stale:
+            await self._close_entry(self._entries.pop(key))
+        self.evictions += len(stale)
+        return len(stale)
+
+    async def aclose(self):
+        """Drain the registry: close every pooled client. Safe to call more than once."""
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            await self._close_entry(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus open clients and open pooled connections."""
+        open_connections = 0
+        for entry in self._entries.values():
+            pool = getattr(getattr(entry.get("http_client"), "_transport", None), "_pool", None)
+            open_connections += len(getattr(pool, "connections", []) or [])
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "open_clients": len(self._entries),
+            "open_connections": open_connections
+        }
+
+
+_client_registry = LLMClientRegistry()
+
+def get_client_registry() -> LLMClientRegistry:
+    """Return the process-wide LLM client registry."""
+    return _client_registry
+
+def set_client_registry(registry: LLMClientRegistry) -> LLMClientRegistry:
+    """Replace the process-wide registry (e.g. to change pool limits); returns the previous one."""
+    global _client_registry
+    previous, _client_registry = _client_registry, registry
+    return previous
+
 
 @dataclass
-class LLMConfig:
-    """Configuration for LLM providers"""
-    provider: LLMProvider
-    model: str
-    api_key: Optional[str] = None
-    base_url: Optional[str] = None
-    temperature: float = 0.7
-    max_tokens: Optional[int] = None
-    timeout: int = 30
-    extra_params: Optional[Dict[str, Any]] = None
+class BatchResult:
+    """Outcome of one prompt in a generate_many batch"""
+    index: int
+    response: Optional[str] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """True if error (or anything it was raised from) is a provider 429."""
+    while error is not None:
+        if isinstance(error, LLMRateLimitError) or getattr(error, "status_code", None) == 429:
+            return True
+        error = error.__cause__
+    return False
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: halves on a 429, grows by one after `window`
+    consecutive successes, never exceeding max_concurrency.
+    """
+
+    def __init__(self, max_concurrency: int, window: Optional[int] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.window = window or self.max_concurrency
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, rate_limited: bool = False):
+        async with self._cond:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.window and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
 
 class LLMClient:
     """Unified LLM client supporting multiple providers"""
     
-    def __init__(self, config: LLMConfig):
+    def __init__(
+        self,
+        config: LLMConfig,
+        registry: Optional[LLMClientRegistry] = None,
+        cache: Optional[ResponseCache] = None,
+        scheduler: Optional[LLMScheduler] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        single_flight: Optional[SingleFlight] = None
+    ):
         self.config = config
-        self._client = None
+        self.registry = registry or get_client_registry()
+        # None falls back to the process-wide cache/scheduler (disabled unless configured)
+        self.cache = cache
+        self.scheduler = scheduler
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or get_circuit_breaker(config.provider.value, config.base_url)
+        # Shared across clients, so identical calls from different agents/workflows coalesce too
+        self.single_flight = single_flight or get_single_flight("llm")
+        self._gemini_models: Dict[str, Tuple[Any, Optional[float]]] = {}
         self._initialize_client()
+
+    @property
+    def _client(self):
+        """Shared SDK client for this config, resolved through the registry."""
+        return self.registry.get(self.config)
     
     def _initialize_client(self):
-        """Initialize the appropriate LLM client based on provider"""
+        """Initialize (or reuse) the pooled SDK client for this config's provider"""
+        self.registry.get(self.config)
+    
+    def _active_scheduler(self) -> Optional[LLMScheduler]:
+        return self.scheduler if self.scheduler is not None else get_scheduler()
+
+    def estimate_request_tokens(self, prompt: str, system_prompt: Optional[str] = None) -> int:
+        """TPM cost of a request: estimated input tokens plus the output token reservation"""
+        return estimate_tokens(prompt) + estimate_tokens(system_prompt) + (self.config.max_tokens or 0)
+
+    async def _wait_for_slot(self, prompt: str, system_prompt: Optional[str], priority: float,
+                             call_info: Optional[Dict[str, Any]] = None):
+        scheduler = self._active_scheduler()
+        if scheduler is None:
+            return
+        waited = await scheduler.acquire(self.config, self.estimate_request_tokens(prompt, system_prompt), priority)
+        if call_info is not None:
+            call_info["queue_wait_ms"] = round(waited * 1000, 2)
+
+    def cache_key(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """Exact-match response cache key for this config and prompt pair"""
+        return cache_key(
+            self.config.provider.value,
+            self.config.model,
+            self.config.temperature,
+            self.config.max_tokens,
+            system_prompt,
+            prompt,
+            self.config.base_url,
+            self.config.extra_params
+        )
+
+    async def generate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        call_info: Optional[Dict[str, Any]] = None,
+        cache_ttl: Optional[float] = None,
+        priority: float = DEFAULT_PRIORITY
+    ) -> str:
+        """
+        Generate response from LLM.
+
+        Exact repeats are served from the response cache when one is configured
+        (cache_ttl=0 bypasses it). Cache misses wait for RPM/TPM budget in the
+        scheduler queue, lower priority values first. If call_info is given it
+        is filled with per-call metadata (cache hit/miss, bytes saved, queue
+        wait) for audit logging.
+
+        Concurrent identical requests (same config and prompts) share one
+        provider call; the callers that joined another's call get
+        call_info["coalesced"] = True.
+        """
+        call_info = {} if call_info is None else call_info
+        cache = self.cache if self.cache is not None else get_response_cache()
+        key = None
+        if cache is not None and cache_ttl != 0:
+            key = self.cache_key(prompt, system_prompt)
+            cached = cache.get(key)
+            call_info["cache"] = "miss" if cached is None else "hit"
+            if cached is not None:
+                call_info["cache_bytes_saved"] = len(cached.encode("utf-8"))
+                return cached
+
+        async def shared() -> str:
+            response = await self._generate(prompt, system_prompt, call_info, priority)
+            if key is not None and response is not None:
+                cache.set(key, response, cache_ttl)
+            return response
+
+        flight_key = key or self.cache_key(prompt, system_prompt)
+        if self.single_flight.in_flight(flight_key):
+            call_info["coalesced"] = True
+        return await self.single_flight.do(flight_key, shared)
+
+    async def _generate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        call_info: Optional[Dict[str, Any]] = None,
+        priority: float = DEFAULT_PRIORITY
+    ) -> str:
+        """
+        Provider call with classified errors, jittered retries of transient
+        failures (honouring Retry-After) and the provider's circuit breaker.
+        """
+        call_info = {} if call_info is None else call_info
+        delay = None
+        attempt = 0
+        last_error = None
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                call_info.update({"retries": max(0, attempt - 1), "breaker_state": self.breaker.state})
+                # A breaker that tripped mid-retry reports the provider error that tripped it
+                raise last_error or CircuitOpenError(
+                    f"Circuit open for {self.breaker.name}", provider=self.config.provider.value
+                )
+            try:
+                await self._wait_for_slot(prompt, system_prompt, priority, call_info)
+            except BaseException:
+                self.breaker.record_cancelled()
+                raise
+            try:
+                response = await self._dispatch(prompt, system_prompt, call_info)
+            except Exception as e:
+                error = last_error = classify_error(e, self.config.provider.value)
+                self.breaker.record_failure(error)
+                attempt += 1
+                if not error.retryable or attempt >= self.retry_policy.max_attempts:
+                    call_info.update({"retries": attempt - 1, "breaker_state": self.breaker.state})
+                    raise error
+                delay = self.retry_policy.next_delay(delay, error.retry_after)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled mid-call, e.g. the losing request of a hedge
+                self.breaker.record_cancelled()
+                raise
+            self.breaker.record_success()
+            call_info.update({"retries": attempt, "breaker_state": self.breaker.state})
+            recorder = get_cassette_recorder()
+            if recorder is not None and self.config.provider not in LOCAL_PROVIDERS:
+                recorder.record(system_prompt, prompt, response, model=self.config.model)
+            return response
+
+    async def _dispatch(
+        self, prompt: str, system_prompt: Optional[str] = None, call_info: Optional[Dict[str, Any]] = None
+    ) -> str:
         if self.config.provider == LLMProvider.OPENAI:
-            if not openai:
-                raise ImportError("OpenAI library not installed. Run: pip install openai")
-            self._client = openai.AsyncOpenAI(
-                api_key=self.config.api_key,
-                base_url=self.config.base_url,
-                timeout=self.config.timeout
-            )
-        
+            return await self._generate_openai(prompt, system_prompt, call_info)
         elif self.config.provider == LLMProvider.AZURE_OPENAI:
-            if not openai:
-                raise ImportError("OpenAI library not installed. Run: pip install openai")
-            self._client = openai.AsyncAzureOpenAI(
-                api_key=self.config.api_key,
-                azure_endpoint=self.config.base_url,
-                api_version="2024-02-01",
-                timeout=self.config.timeout
-            )
-        
+            return await self._generate_azure_openai(prompt, system_prompt, call_info)
         elif self.config.provider == LLMProvider.GEMINI:
-            if not genai:
-                raise ImportError("Google AI library not installed. Run: pip install google-generativeai")
-            genai.configure(api_key=self.config.api_key)
-            self._client = genai.GenerativeModel(self.config.model)
-        
+            return await self._generate_gemini(prompt, system_prompt, call_info)
         elif self.config.provider == LLMProvider.CLAUDE:
-            if not anthropic:
-                raise ImportError("Anthropic library not installed. Run: pip install anthropic")
-            self._client = anthropic.AsyncAnthropic(
-                api_key=self.config.api_key,
-                timeout=self.config.timeout
-            )
-        
+            return await self._generate_claude(prompt, system_prompt, call_info)
         elif self.config.provider == LLMProvider.OLLAMA:
-            if not ollama:
-                raise ImportError("Ollama library not installed. Run: pip install ollama")
-            self._client = ollama.AsyncClient(
-                host=self.config.base_url or "http://localhost:11434"
-            )
-    
-    async def generate(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        """Generate response from LLM"""
+            return await self._generate_ollama(prompt, system_prompt, call_info)
+        elif self.config.provider in LOCAL_PROVIDERS:
+            return await self._client.generate(prompt, system_prompt)
+        else:
+            raise LLMBadRequestError(f"Unsupported provider: {self.config.provider}")
+
+    def _open_stream(
+        self, prompt: str, system_prompt: Optional[str] = None, call_info: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        if self.config.provider in (LLMProvider.OPENAI, LLMProvider.AZURE_OPENAI):
+            return self._stream_openai(prompt, system_prompt, call_info)
+        elif self.config.provider == LLMProvider.GEMINI:
+            return self._stream_gemini(prompt, system_prompt, call_info)
+        elif self.config.provider == LLMProvider.CLAUDE:
+            return self._stream_claude(prompt, system_prompt, call_info)
+        elif self.config.provider == LLMProvider.OLLAMA:
+            return self._stream_ollama(prompt, system_prompt)
+        elif self.config.provider in LOCAL_PROVIDERS:
+            return self._client.stream(prompt, system_prompt)
+        raise LLMBadRequestError(f"Unsupported provider: {self.config.provider}")
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        priority: float = DEFAULT_PRIORITY,
+        call_info: Optional[Dict[str, Any]] = None,
+        cache_ttl: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Generate response from LLM, yielding text deltas as they arrive.
+
+        Shares the response cache and single-flight with generate(): a cache
+        hit, or a call that joins an identical one already in flight, yields
+        the whole response as one delta. call_info is filled as in generate().
+        """
+        call_info = {} if call_info is None else call_info
+        cache = self.cache if self.cache is not None else get_response_cache()
+        key = None
+        if cache is not None and cache_ttl != 0:
+            key = self.cache_key(prompt, system_prompt)
+            cached = cache.get(key)
+            call_info["cache"] = "miss" if cached is None else "hit"
+            if cached is not None:
+                call_info["cache_bytes_saved"] = len(cached.encode("utf-8"))
+                yield cached
+                return
+
+        deltas: asyncio.Queue = asyncio.Queue()
+        leader = False
+
+        async def shared() -> str:
+            nonlocal leader
+            leader = True
+            chunks: List[str] = []
+            async for delta in self._stream(prompt, system_prompt, priority, call_info):
+                chunks.append(delta)
+                deltas.put_nowait(delta)
+            response = "".join(chunks)
+            if key is not None:
+                cache.set(key, response, cache_ttl)
+            return response
+
+        flight = asyncio.ensure_future(self.single_flight.do(key or self.cache_key(prompt, system_prompt), shared))
+        get = None
+        streamed = False
         try:
-            if self.config.provider == LLMProvider.OPENAI:
-                return await self._generate_openai(prompt, system_prompt)
-            elif self.config.provider == LLMProvider.AZURE_OPENAI:
-                return await self._generate_azure_openai(prompt, system_prompt)
-            elif self.config.provider == LLMProvider.GEMINI:
-                return await self._generate_gemini(prompt, system_prompt)
-            elif self.config.provider == LLMProvider.CLAUDE:
-                return await self._generate_claude(prompt, system_prompt)
-            elif self.config.provider == LLMProvider.OLLAMA:
-                return await self._generate_ollama(prompt, system_prompt)
-            else:
-                raise ValueError(f"Unsupported provider: {self.config.provider}")
-        
-        except Exception as e:
-            raise Exception(f"LLM generation failed for {self.config.provider}: {str(e)}")
-    
-    async def _generate_openai(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+            while True:
+                get = asyncio.ensure_future(deltas.get())
+                await asyncio.wait((get, flight), return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    break
+                streamed = True
+                yield get.result()
+            # Our own stream has ended (the rest is queued), or we joined another caller's call
+            get.cancel()
+            while not deltas.empty():
+                streamed = True
+                yield deltas.get_nowait()
+            response = flight.result()
+            if not leader:
+                call_info["coalesced"] = True
+            if not streamed and response:
+                yield response
+        finally:
+            if get is not None:
+                get.cancel()
+            # Only stops waiting; the call carries on if other callers joined it
+            flight.cancel()
+
+    async def _stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        priority: float = DEFAULT_PRIORITY,
+        call_info: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Provider stream with the provider's circuit breaker. Transient failures
+        are retried only until the first delta has been yielded; after that
+        the error is raised to the consumer.
+        """
+        call_info = {} if call_info is None else call_info
+        delay = None
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                call_info.update({"retries": max(0, attempt - 1), "breaker_state": self.breaker.state})
+                raise
+            try:
+                await self._wait_for_slot(prompt, system_prompt, priority, call_info)
+            except BaseException:
+                self.breaker.record_cancelled()
+                raise
+            stream = self._open_stream(prompt, system_prompt, call_info)
+            started = False
+            chunks: List[str] = []
+            try:
+                async for delta in stream:
+                    if delta:
+                        started = True
+                        chunks.append(delta)
+                        yield delta
+            except Exception as e:
+                error = classify_error(e, self.config.provider.value)
+                self.breaker.record_failure(error)
+                attempt += 1
+                if started or not error.retryable or attempt >= self.retry_policy.max_attempts:
+                    call_info.update({"retries": attempt - 1, "breaker_state": self.breaker.state})
+                    raise error
+                delay = self.retry_policy.next_delay(delay, error.retry_after)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled, or the consumer stopped reading (GeneratorExit)
+                if started:
+                    # The provider was answering fine
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_cancelled()
+                raise
+            finally:
+                await stream.aclose()
+            self.breaker.record_success()
+            call_info.update({"retries": attempt, "breaker_state": self.breaker.state})
+            recorder = get_cassette_recorder()
+            if recorder is not None and self.config.provider not in LOCAL_PROVIDERS:
+                recorder.record(system_prompt, prompt, "".join(chunks), chunks=chunks, model=self.config.model)
+            return
+
+    async def generate_many(
+        self,
+        prompts: List[str],
+        system_prompt: Optional[str] = None,
+        max_concurrency: int = 8,
+        max_rate_limit_retries: int = 5,
+        native_batch: bool = False,
+        poll_interval: float = 30.0
+    ) -> List[BatchResult]:
+        """
+        Generate responses for many prompts; results are returned in prompt order.
+
+        Each item succeeds or fails on its own (see BatchResult.error).
+        Concurrency starts at max_concurrency and backs off on provider 429s.
+        With native_batch=True, OpenAI/Azure and Claude requests are routed
+        to the provider's offline batch endpoint instead (cheaper, slower).
+        """
+        if native_batch and self.config.provider in (LLMProvider.OPENAI, LLMProvider.AZURE_OPENAI, LLMProvider.CLAUDE):
+            return await self._generate_native_batch(prompts, system_prompt, poll_interval)
+
+        results: List[Optional[BatchResult]] = [None] * len(prompts)
+        async for result in self.iter_generate_many(prompts, system_prompt, max_concurrency, max_rate_limit_retries):
+            results[result.index] = result
+        return results
+
+    async def iter_generate_many(
+        self,
+        prompts: List[str],
+        system_prompt: Optional[str] = None,
+        max_concurrency: int = 8,
+        max_rate_limit_retries: int = 5
+    ) -> AsyncIterator[BatchResult]:
+        """Like generate_many, but yields BatchResults in completion order."""
+        limiter = AdaptiveConcurrencyLimiter(max_concurrency)
+
+        async def run_one(index: int, prompt: str) -> BatchResult:
+            for attempt in range(max_rate_limit_retries + 1):
+                await limiter.acquire()
+                try:
+                    response = await self.generate(prompt, system_prompt)
+                except Exception as e:
+                    rate_limited = is_rate_limited(e)
+                    await limiter.release(rate_limited=rate_limited)
+                    if not rate_limited or attempt == max_rate_limit_retries:
+                        return BatchResult(index=index, error=e)
+                    await asyncio.sleep(min(0.1 * 2 ** attempt, 5.0))
+                else:
+                    await limiter.release()
+                    return BatchResult(index=index, response=response)
+
+        tasks = [asyncio.ensure_future(run_one(i, p)) for i, p in enumerate(prompts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _generate_native_batch(
+        self, prompts: List[str], system_prompt: Optional[str], poll_interval: float
+    ) -> List[BatchResult]:
+        if self.config.provider == LLMProvider.CLAUDE:
+            batch = await self._client.messages.batches.create(requests=[
+                {"custom_id": str(i), "params": self._claude_kwargs(p, system_prompt)}
+                for i, p in enumerate(prompts)
+            ])
+            while batch.processing_status != "ended":
+                await asyncio.sleep(poll_interval)
+                batch = await self._client.messages.batches.retrieve(batch.id)
+            results = [BatchResult(index=i, error=Exception("Missing batch result")) for i in range(len(prompts))]
+            async for entry in await self._client.messages.batches.results(batch.id):
+                index = int(entry.custom_id)
+                if entry.result.type == "succeeded":
+                    results[index] = BatchResult(index=index, response=entry.result.message.content[0].text)
+                else:
+                    results[index] = BatchResult(index=index, error=Exception(f"Batch item {entry.result.type}"))
+            return results
+
+        # OpenAI / Azure OpenAI Batch API: upload JSONL, poll, download output file
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._openai_batch_body(p, system_prompt)
+            })
+            for i, p in enumerate(prompts)
+        ]
+        upload = await self._client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = await self._client.batches.create(
+            input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            batch = await self._client.batches.retrieve(batch.id)
+        results = [BatchResult(index=i, error=Exception(f"Batch {batch.status}")) for i in range(len(prompts))]
+        if batch.output_file_id:
+            output = await self._client.files.content(batch.output_file_id)
+            for line in output.text.splitlines():
+                entry = json.loads(line)
+                index = int(entry["custom_id"])
+                if entry.get("error"):
+                    results[index] = BatchResult(index=index, error=Exception(str(entry["error"])))
+                else:
+                    body = entry["response"]["body"]
+                    results[index] = BatchResult(index=index, response=body["choices"][0]["message"]["content"])
+        return results
+
+    def _record_usage(self, call_info: Optional[Dict[str, Any]], input_tokens: Optional[int],
+                      cached_tokens: Optional[int], cache_write_tokens: Optional[int] = None):
+        """Report cached vs uncached input tokens from a provider usage block"""
+        if call_info is None or input_tokens is None:
+            return
+        cached_tokens = cached_tokens or 0
+        call_info["input_tokens"] = input_tokens
+        call_info["cached_input_tokens"] = cached_tokens
+        call_info["uncached_input_tokens"] = max(0, input_tokens - cached_tokens)
+        if cache_write_tokens is not None:
+            call_info["cache_write_tokens"] = cache_write_tokens
+
+    def _openai_kwargs(self, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        # The static system prompt always leads so the provider's automatic
+        # prefix cache sees an identical prefix on every call from an agent
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
-        
-        response = await self._client.chat.completions.create(
-            model=self.config.model,
-            messages=messages,
-            temperature=self.config.temperature,
-            max_tokens=self.config.max_tokens,
+        kwargs = {
+            "model": self.config.model,
+            "messages": messages,
+            "temperature": self.config.temperature,
+            "max_tokens": self.config.max_tokens,
             **(self.config.extra_params or {})
-        )
-        return response.choices[0].message.content
+        }
+        if self.config.prompt_caching and system_prompt and self.config.provider == LLMProvider.OPENAI:
+            # Routes requests sharing a system prompt to the same prefix-cache shard
+            kwargs.setdefault("extra_body", {})["prompt_cache_key"] = prompt_prefix_key(system_prompt)
+        return kwargs
     
-    async def _generate_azure_openai(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        return await self._generate_openai(prompt, system_prompt)  # Same API
+    def _openai_batch_body(self, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        # Batch request bodies are raw JSON, so SDK-only extra_body is inlined
+        body = self._openai_kwargs(prompt, system_prompt)
+        body.update(body.pop("extra_body", {}))
+        return body
+
+    async def _generate_openai(self, prompt: str, system_prompt: Optional[str] = None,
+                               call_info: Optional[Dict[str, Any]] = None) -> str:
+        kwargs = self._openai_kwargs(prompt, system_prompt)
+        scheduler = self._active_scheduler()
+        if scheduler is not None:
+            # Raw response exposes the x-ratelimit-* headers for live limit updates
+            raw = await self._client.chat.completions.with_raw_response.create(**kwargs)
+            scheduler.update_from_headers(self.config, raw.headers)
+            response = raw.parse()
+        else:
+            response = await self._client.chat.completions.create(**kwargs)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            self._record_usage(call_info, usage.prompt_tokens, getattr(details, "cached_tokens", 0))
+        return response.choices[0].message.content
     
-    async def _generate_gemini(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+    async def _generate_azure_openai(self, prompt: str, system_prompt: Optional[str] = None,
+                                     call_info: Optional[Dict[str, Any]] = None) -> str:
+        return await self._generate_openai(prompt, system_prompt, call_info)  # Same API
+
+    async def _stream_openai(self, prompt: str, system_prompt: Optional[str] = None,
+                             call_info: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        stream = await self._client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **self._openai_kwargs(prompt, system_prompt)
+        )
+        async for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                # Sent on the final, choice-less chunk
+                details = getattr(usage, "prompt_tokens_details", None)
+                self._record_usage(call_info, usage.prompt_tokens, getattr(details, "cached_tokens", 0))
+
+    async def _gemini_model(self, system_prompt: Optional[str] = None):
+        """
+        GenerativeModel carrying the system prompt as system_instruction.
+
+        System prompts long enough for Gemini context caching are uploaded
+        once as CachedContent and reused until shortly before they expire.
+        """
+        if not system_prompt or not self.config.prompt_caching:
+            return self._client
+        key = prompt_prefix_key(system_prompt)
+        entry = self._gemini_models.get(key)
+        if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+            return entry[0]
+
+        genai = _load_sdk("genai")
+        model, expires_at = None, None
+        if estimate_tokens(system_prompt) >= GEMINI_MIN_CACHED_TOKENS:
+            try:
+                cached = await asyncio.to_thread(
+                    genai.caching.CachedContent.create,
+                    model=f"models/{self.config.model}",
+                    system_instruction=system_prompt,
+                    ttl=datetime.timedelta(seconds=GEMINI_CACHE_TTL)
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+                expires_at = time.monotonic() + GEMINI_CACHE_TTL * 0.9
+            except Exception:
+                model = None
+        if model is None:
+            model = genai.GenerativeModel(self.config.model, system_instruction=system_prompt)
+        self._gemini_models[key] = (model, expires_at)
+        return model
+
+    def _gemini_args(self, prompt: str, system_prompt: Optional[str] = None) -> Tuple[str, Any]:
         full_prompt = prompt
-        if system_prompt:
+        if system_prompt and not self.config.prompt_caching:
             full_prompt = f"{system_prompt}\n\nUser: {prompt}"
-        
+        genai = _load_sdk("genai")
+        generation_config = genai.types.GenerationConfig(
+            temperature=self.config.temperature,
+            max_output_tokens=self.config.max_tokens,
+            **(self.config.extra_params or {})
+        )
+        return full_prompt, generation_config
+    
+    async def _generate_gemini(self, prompt: str, system_prompt: Optional[str] = None,
+                               call_info: Optional[Dict[str, Any]] = None) -> str:
+        full_prompt, generation_config = self._gemini_args(prompt, system_prompt)
+        model = await self._gemini_model(system_prompt)
         # Gemini async generation
-        response = await self._client.generate_content_async(
-            full_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=self.config.temperature,
-                max_output_tokens=self.config.max_tokens,
-                **(self.config.extra_params or {})
+        response = await model.generate_content_async(full_prompt, generation_config=generation_config)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self._record_usage(
+                call_info,
+                getattr(usage, "prompt_token_count", None),
+                getattr(usage, "cached_content_token_count", 0)
             )
-        )
         return response.text
-    
-    async def _generate_claude(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+
+    async def _stream_gemini(self, prompt: str, system_prompt: Optional[str] = None,
+                             call_info: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        full_prompt, generation_config = self._gemini_args(prompt, system_prompt)
+        model = await self._gemini_model(system_prompt)
+        response = await model.generate_content_async(
+            full_prompt, generation_config=generation_config, stream=True
+        )
+        usage = None
+        async for chunk in response:
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            # Chunks without text parts (e.g. safety metadata) raise on .text
+            try:
+                yield chunk.text
+            except ValueError:
+                continue
+        if usage is not None:
+            self._record_usage(
+                call_info,
+                getattr(usage, "prompt_token_count", None),
+                getattr(usage, "cached_content_token_count", 0)
+            )
+
+    def _claude_kwargs(self, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
         kwargs = {
             "model": self.config.model,
             "max_tokens": self.config.max_tokens or 1024,
@@ -164,31 +895,85 @@ class LLMClient:
             "messages": [{"role": "user", "content": prompt}]
         }
         
-        if system_prompt:
+        if system_prompt and self.config.prompt_caching:
+            # Mark the static system prompt as a cacheable prefix
+            kwargs["system"] = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        elif system_prompt:
             kwargs["system"] = system_prompt
         
         if self.config.extra_params:
             kwargs.update(self.config.extra_params)
-        
-        response = await self._client.messages.create(**kwargs)
-        return response.content[0].text
+        return kwargs
     
-    async def _generate_ollama(self, prompt: str, system_prompt: Optional[str] = None) -> str:
-        full_prompt = prompt
-        if system_prompt:
-            full_prompt = f"{system_prompt}\n\nUser: {prompt}"
-        
-        response = await self._client.generate(
-            model=self.config.model,
-            prompt=full_prompt,
-            options={
+    async def _generate_claude(self, prompt: str, system_prompt: Optional[str] = None,
+                               call_info: Optional[Dict[str, Any]] = None) -> str:
+        kwargs = self._claude_kwargs(prompt, system_prompt)
+        scheduler = self._active_scheduler()
+        if scheduler is not None:
+            # Raw response exposes the anthropic-ratelimit-* headers for live limit updates
+            raw = await self._client.messages.with_raw_response.create(**kwargs)
+            scheduler.update_from_headers(self.config, raw.headers)
+            response = raw.parse()
+        else:
+            response = await self._client.messages.create(**kwargs)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            # Anthropic reports uncached input, cache reads and cache writes separately
+            cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+            cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+            self._record_usage(call_info, usage.input_tokens + cache_read + cache_write, cache_read, cache_write)
+        return response.content[0].text
+
+    async def _stream_claude(self, prompt: str, system_prompt: Optional[str] = None,
+                             call_info: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        async with self._client.messages.stream(**self._claude_kwargs(prompt, system_prompt)) as stream:
+            async for text in stream.text_stream:
+                yield text
+            usage = getattr(await stream.get_final_message(), "usage", None)
+        if usage is not None:
+            cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+            cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+            self._record_usage(call_info, usage.input_tokens + cache_read + cache_write, cache_read, cache_write)
+
+    def _ollama_kwargs(self, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        kwargs = {
+            "model": self.config.model,
+            "prompt": prompt,
+            "options": {
                 "temperature": self.config.temperature,
                 "num_predict": self.config.max_tokens,
                 **(self.config.extra_params or {})
             }
-        )
+        }
+        if system_prompt and self.config.prompt_caching:
+            # Passed separately, the system prompt forms a stable templated
+            # prefix that Ollama can reuse from the loaded model's KV cache
+            kwargs["system"] = system_prompt
+        elif system_prompt:
+            kwargs["prompt"] = f"{system_prompt}\n\nUser: {prompt}"
+        return kwargs
+    
+    async def _generate_ollama(self, prompt: str, system_prompt: Optional[str] = None,
+                               call_info: Optional[Dict[str, Any]] = None) -> str:
+        response = await self._client.generate(**self._ollama_kwargs(prompt, system_prompt))
         return response['response']
 
+    async def _stream_ollama(self, prompt: str, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+        async for part in await self._client.generate(stream=True, **self._ollama_kwargs(prompt, system_prompt)):
+            yield part['response']
+
+
+def prompt_prefix_key(system_prompt: str) -> str:
+    """Short stable identifier for a static prompt prefix."""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Cheap provider-independent token estimate (~4 characters per token)."""
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
 
 # Example usage configurations for different LLM providers
 def create_openai_config(api_key: str, model: str = "gpt-4") -> LLMConfig:
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def cache_key(
+    provider: str,
+    model: str,
+    temperature: float,
+    max_tokens: Optional[int],
+    system_prompt: Optional[str],
+    prompt: str,
+    base_url: Optional[str] = None,
+    extra_params: Optional[Dict[str, Any]] = None
+) -> str:
+    """Stable hash of everything that determines an LLM response."""
+    material = json.dumps(
+        [provider, model, temperature, max_tokens, system_prompt or "", prompt, base_url, extra_params or {}],
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Interface for exact-match LLM response caches.
+
+    Implementations store response text under a cache_key() hash with an
+    optional TTL in seconds (None means no expiry, 0 means do not cache).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key: str) -> Tuple[Optional[str], Optional[float]]:
+        """Like get(), plus the seconds the entry has left (None: no expiry)."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def _record(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.bytes_saved += len(value.encode("utf-8"))
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved
+        }
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Persistent response store backed by SQLite (memory-mapped reads), so
+    cached responses survive process restarts.
+
+    Hits don't write: last-use times (for LRU eviction) are collected in
+    memory and written in one transaction every touch_batch hits, before
+    evicting, and on close. Expired rows are deleted when evicting.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = 256 * 1024 * 1024, mmap_size: int = 64 * 1024 * 1024,
+                 touch_batch: int = 256):
+        super().__init__()
+        self.path = path or os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_with_ttl(self, key: str) -> Tuple[Optional[str], Optional[float]]:
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None:
+            return self._record(None), None
+        if row[1] is not None and row[1] <= now:
+            return self._record(None), None
+        self._touched[key] = now
+        if len(self._touched) >= self.touch_batch:
+            self._flush_touched()
+            self._conn.commit()
+        return self._record(row[0]), (row[1] - now if row[1] is not None else None)
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE responses SET last_used = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        if ttl == 0:
+            return
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, value, size, now + ttl if ttl else None, now)
+        )
+        self._evict(now)
+        self._conn.commit()
+
+    def _evict(self, now: float):
+        self._flush_touched()
+        self._conn.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used rows until back under the byte cap
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        self._touched.clear()
+        self._conn.execute("DELETE FROM responses")
+        self._conn.commit()
+
+    def close(self):
+        self._flush_touched()
+        self._conn.commit()
+        self._conn.close()
+
+
+class LRUResponseCache(ResponseCache):
+    """
+    In-memory LRU response cache bounded by entry count and total bytes,
+    optionally read/written through to a persistent store.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        default_ttl: Optional[float] = 3600.0,
+        store: Optional[ResponseCache] = None
+    ):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.store = store
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get_with_ttl(self, key: str) -> Tuple[Optional[str], Optional[float]]:
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at is None or expires_at > now:
+                self._entries.move_to_end(key)
+                return self._record(value), (expires_at - now if expires_at is not None else None)
+            self._remove(key)
+        if self.store is not None:
+            value, ttl = self.store.get_with_ttl(key)
+            if value is not None:
+                # Promote into memory, expiring when the stored entry does
+                self._put(key, value, now + ttl if ttl is not None else None)
+                return self._record(value), ttl
+        return self._record(None), None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl == 0:
+            return
+        self._put(key, value, time.monotonic() + ttl if ttl else None)
+        if self.store is not None:
+            self.store.set(key, value, ttl)
+
+    def _put(self, key: str, value: str, expires_at: Optional[float]):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, expires_at)
+        self.current_bytes += size
+        while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self.current_bytes -= len(value.encode("utf-8"))
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({"entries": len(self._entries), "bytes": self.current_bytes})
+        return stats
+
+
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache, or None when caching is disabled."""
+    return _response_cache
+
+def set_response_cache(cache: Optional[ResponseCache]) -> Optional[ResponseCache]:
+    """Install (or with None, disable) the process-wide response cache; returns the previous one."""
+    global _response_cache
+    previous, _response_cache = _response_cache, cache
+    return previous
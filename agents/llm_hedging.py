@@ -0,0 +1,203 @@
+import asyncio
+import bisect
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from .llm import LLMClient, LLMClientRegistry, LLMConfig
+from .llm_cache import ResponseCache
+from .llm_resilience import LLMError, RetryPolicy
+from .llm_scheduler import DEFAULT_PRIORITY
+
+
+class LatencyHistogram:
+    """
+    Sliding-window latency histogram with log-spaced buckets
+    (10 ms .. ~2 min, 25% apart) for cheap percentile estimates.
+    """
+
+    BOUNDS = [0.01 * 1.25 ** i for i in range(43)]
+
+    def __init__(self, window: int = 500):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        if len(self._samples) == self._samples.maxlen:
+            self.counts[self._samples[0]] -= 1
+        bucket = bisect.bisect_left(self.BOUNDS, seconds)
+        self._samples.append(bucket)
+        self.counts[bucket] += 1
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Upper bound of the bucket holding the pct-th (0..1) sample, or None if empty."""
+        if not self._samples:
+            return None
+        target = pct * len(self._samples)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.BOUNDS[min(bucket, len(self.BOUNDS) - 1)]
+        return self.BOUNDS[-1]
+
+
+class HedgedLLMClient(LLMClient):
+    """
+    LLMClient over an ordered list of provider configs (primary first).
+
+    A request goes to the primary; if it has not answered within the
+    hedge_percentile of that provider's recent latency, a hedged request is
+    fired at the next provider. The first good answer wins and the losers
+    are cancelled. Errors fail over to the next provider immediately.
+    """
+
+    def __init__(
+        self,
+        configs: List[LLMConfig],
+        registry: Optional[LLMClientRegistry] = None,
+        cache: Optional[ResponseCache] = None,
+        hedge_percentile: float = 0.95,
+        initial_hedge_delay: float = 2.0,
+        min_hedge_delay: float = 0.05,
+        max_hedge_delay: float = 30.0,
+        min_samples: int = 20
+    ):
+        if not configs:
+            raise ValueError("HedgedLLMClient needs at least one LLMConfig")
+        # The primary config drives cache keys and audit fields
+        super().__init__(configs[0], registry=registry, cache=cache)
+        # No per-provider retries: an error should fail over, not wait out a backoff
+        self.clients = [LLMClient(c, registry=self.registry, retry_policy=RetryPolicy(max_attempts=1)) for c in configs]
+        self.histograms = [LatencyHistogram() for _ in configs]
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.min_samples = min_samples
+        self.hedges = 0
+        self.wins = [0] * len(configs)
+
+    @staticmethod
+    def provider_label(config: LLMConfig) -> str:
+        return f"{config.provider.value}:{config.model}"
+
+    def hedge_delay(self, index: int) -> float:
+        """Seconds to wait on provider `index` before hedging to the next one."""
+        histogram = self.histograms[index]
+        if len(histogram) < self.min_samples:
+            return self.initial_hedge_delay
+        delay = histogram.percentile(self.hedge_percentile)
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, delay))
+
+    async def _timed(self, index: int, prompt: str, system_prompt: Optional[str], priority: float,
+                     info: Dict[str, Any]) -> str:
+        started = time.perf_counter()
+        try:
+            return await self.clients[index]._generate(prompt, system_prompt, info, priority)
+        finally:
+            # A call cancelled after losing the race (or failed) took at least this long; leaving
+            # it out would bias the window toward fast calls and shrink the hedge delay
+            self.histograms[index].record(time.perf_counter() - started)
+
+    async def _generate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        call_info: Optional[Dict[str, Any]] = None,
+        priority: float = DEFAULT_PRIORITY
+    ) -> str:
+        pending: Dict[asyncio.Task, int] = {}
+        infos: List[Dict[str, Any]] = [{} for _ in self.clients]
+        errors: List[str] = []
+        last_error: Optional[BaseException] = None
+        launched = 0
+        hedges = 0
+        last_launch = 0.0
+
+        def launch():
+            nonlocal launched, last_launch
+            task = asyncio.ensure_future(self._timed(launched, prompt, system_prompt, priority, infos[launched]))
+            pending[task] = launched
+            launched += 1
+            last_launch = time.perf_counter()
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if launched < len(self.clients):
+                    deadline = last_launch + self.hedge_delay(launched - 1)
+                    timeout = max(0.0, deadline - time.perf_counter())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedges += 1
+                    hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    index = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self.wins[index] += 1
+                        if call_info is not None:
+                            # Winner's usage and queue wait, plus the race outcome
+                            call_info.update(infos[index])
+                            call_info.update({
+                                "provider_won": self.provider_label(self.clients[index].config),
+                                "providers_tried": launched,
+                                "hedges": hedges,
+                                "failovers": len(errors)
+                            })
+                        return task.result()
+                    errors.append(f"{self.provider_label(self.clients[index].config)}: {error}")
+                    last_error = error
+                    # Fail over right away instead of waiting for the hedge delay
+                    if launched < len(self.clients):
+                        launch()
+            raise LLMError("All providers failed: " + "; ".join(errors)) from last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        priority: float = DEFAULT_PRIORITY,
+        call_info: Optional[Dict[str, Any]] = None
+    ):
+        """Streams from the first provider that starts successfully (no hedging mid-stream)."""
+        errors = []
+        last_error = None
+        for client in self.clients:
+            started = False
+            info: Dict[str, Any] = {}
+            try:
+                async for delta in client._stream(prompt, system_prompt, priority, info):
+                    started = True
+                    yield delta
+                if call_info is not None:
+                    call_info.update(info)
+                    call_info.update({
+                        "provider_won": self.provider_label(client.config),
+                        "providers_tried": len(errors) + 1,
+                        "failovers": len(errors)
+                    })
+                return
+            except Exception as e:
+                if started:
+                    raise
+                errors.append(f"{self.provider_label(client.config)}: {e}")
+                last_error = e
+        raise LLMError("All providers failed: " + "; ".join(errors)) from last_error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedges": self.hedges,
+            "wins": {self.provider_label(c.config): w for c, w in zip(self.clients, self.wins)},
+            "hedge_delay_s": {self.provider_label(c.config): self.hedge_delay(i) for i, c in enumerate(self.clients)}
+        }
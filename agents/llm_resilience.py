@@ -0,0 +1,203 @@
+import asyncio
+import email.utils
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+class LLMError(Exception):
+    """Classified LLM provider failure."""
+    retryable = False
+
+    def __init__(self, message: str, provider: Optional[str] = None, status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class LLMRateLimitError(LLMError):
+    """429: provider rate limit hit."""
+    retryable = True
+
+
+class LLMOverloadedError(LLMError):
+    """503/529: provider temporarily overloaded."""
+    retryable = True
+
+
+class LLMServerError(LLMError):
+    """Other 5xx responses."""
+    retryable = True
+
+
+class LLMTimeoutError(LLMError):
+    retryable = True
+
+
+class LLMConnectionError(LLMError):
+    retryable = True
+
+
+class LLMAuthError(LLMError):
+    """401/403: bad or missing credentials."""
+
+
+class LLMBadRequestError(LLMError):
+    """4xx other than auth and rate limiting: the request itself is wrong."""
+
+
+class CircuitOpenError(LLMError):
+    """Provider circuit breaker is open; the call was not attempted."""
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+def classify_error(error: BaseException, provider: Optional[str] = None) -> LLMError:
+    """Map an SDK/transport exception onto the LLMError hierarchy."""
+    if isinstance(error, LLMError):
+        return error
+    status = getattr(error, "status_code", None)
+    if status is None and isinstance(getattr(error, "code", None), int):
+        # google.api_core exceptions expose the HTTP status as .code
+        status = error.code
+    name = type(error).__name__
+    message = f"LLM generation failed for {provider}: {error}"
+    retry_after = _retry_after(error)
+
+    if status == 429 or "RateLimit" in name or "ResourceExhausted" in name:
+        cls = LLMRateLimitError
+    elif status in (503, 529) or "Overloaded" in name or "ServiceUnavailable" in name:
+        cls = LLMOverloadedError
+    elif status is not None and status >= 500:
+        cls = LLMServerError
+    elif status in (401, 403) or "Authentication" in name or "PermissionDenied" in name:
+        cls = LLMAuthError
+    elif status is not None and status >= 400:
+        cls = LLMBadRequestError
+    elif isinstance(error, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in name:
+        cls = LLMTimeoutError
+    elif isinstance(error, ConnectionError) or "Connect" in name:
+        cls = LLMConnectionError
+    else:
+        cls = LLMError
+    classified = cls(message, provider=provider, status_code=status, retry_after=retry_after)
+    classified.__cause__ = error
+    return classified
+
+
+class RetryPolicy:
+    """
+    Retry schedule with decorrelated jitter: each delay is drawn from
+    [base_delay, 3 * previous delay], capped at max_delay. A provider
+    Retry-After takes precedence when it is longer.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def next_delay(self, previous: Optional[float], retry_after: Optional[float] = None) -> float:
+        delay = min(self.max_delay, random.uniform(self.base_delay, (previous or self.base_delay) * 3))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    Opens after failure_threshold consecutive retryable failures and fails
+    fast while open. Rate limiting (429) does not count: the provider is up,
+    and callers back off on the 429 itself. After recovery_timeout it lets up to half_open_max_calls
+    trial calls through; a success closes it, a failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may proceed now."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                raise CircuitOpenError(f"Circuit open for {self.name}", provider=self.name)
+            self.state = self.HALF_OPEN
+            self.half_open_calls = 0
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                raise CircuitOpenError(f"Circuit half-open for {self.name}; trial in progress", provider=self.name)
+            self.half_open_calls += 1
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_cancelled(self):
+        """A call let through by before_call ended without an outcome (e.g. a cancelled hedge)."""
+        if self.state == self.HALF_OPEN and self.half_open_calls > 0:
+            # Free the trial slot so the next call can probe the provider
+            self.half_open_calls -= 1
+
+    def record_failure(self, error: LLMError):
+        if not error.retryable or isinstance(error, LLMRateLimitError):
+            # The provider answered; the request was at fault
+            if self.state == self.HALF_OPEN:
+                self.state = self.CLOSED
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+
+
+_breakers: Dict[Tuple[str, Optional[str]], CircuitBreaker] = {}
+
+def get_circuit_breaker(provider: str, base_url: Optional[str] = None) -> CircuitBreaker:
+    """Process-wide breaker shared by every client of one provider endpoint."""
+    key = (provider, base_url)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = CircuitBreaker(provider if not base_url else f"{provider}@{base_url}")
+        _breakers[key] = breaker
+    return breaker
+
+def circuit_breaker_stats() -> Dict[str, Any]:
+    return {breaker.name: breaker.stats() for breaker in _breakers.values()}
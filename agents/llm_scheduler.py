@@ -0,0 +1,173 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+# Lower values are served first
+DEFAULT_PRIORITY = 5.0
+
+
+class TokenBucket:
+    """Continuously refilling token bucket expressed as a per-minute rate."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.per_minute = per_minute
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` can be consumed (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.per_minute
+
+    def consume(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def update(self, per_minute: Optional[float] = None, remaining: Optional[float] = None):
+        """Apply limits reported by the provider."""
+        self._refill()
+        if per_minute:
+            self.per_minute = per_minute
+            self.capacity = per_minute
+        if remaining is not None:
+            self.level = min(self.capacity, remaining)
+
+
+class _Lane:
+    """Buckets and priority queue of waiters for one (provider, model)."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiters: list = []
+        self.wakeup: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class LLMScheduler:
+    """
+    Shared RPM/TPM rate limiter and priority queue in front of provider calls.
+
+    Each (provider, model) lane has a request bucket and a token bucket.
+    Waiting calls are served strictly by priority (then arrival order), so
+    security work and urgent tickets go ahead of routine monitoring.
+    Limits can be refreshed live from provider rate-limit headers.
+    """
+
+    def __init__(self, default_rpm: float = 500, default_tpm: float = 200000,
+                 limits: Optional[Dict[Tuple[str, str], Tuple[float, float]]] = None):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.limits = dict(limits or {})
+        self._lanes: Dict[Tuple[str, str], _Lane] = {}
+        self._seq = itertools.count()
+
+    @staticmethod
+    def lane_key(config) -> Tuple[str, str]:
+        return (config.provider.value, config.model)
+
+    def _lane(self, config) -> _Lane:
+        key = self.lane_key(config)
+        lane = self._lanes.get(key)
+        if lane is None:
+            rpm, tpm = self.limits.get(key, (self.default_rpm, self.default_tpm))
+            lane = _Lane(rpm, tpm)
+            self._lanes[key] = lane
+        return lane
+
+    async def acquire(self, config, tokens: int, priority: float = DEFAULT_PRIORITY) -> float:
+        """Wait for a request slot and `tokens` of TPM budget; returns seconds waited."""
+        lane = self._lane(config)
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        heapq.heappush(lane.waiters, (priority, next(self._seq), future, tokens))
+        self._pump(lane)
+        await future
+        waited = time.monotonic() - enqueued
+        lane.granted += 1
+        lane.total_wait += waited
+        lane.max_wait = max(lane.max_wait, waited)
+        return waited
+
+    def _pump(self, lane: _Lane):
+        if lane.wakeup is not None:
+            lane.wakeup.cancel()
+            lane.wakeup = None
+        while lane.waiters:
+            _, _, future, tokens = lane.waiters[0]
+            if future.done():
+                # Caller was cancelled while queued
+                heapq.heappop(lane.waiters)
+                continue
+            wait = max(lane.requests.time_until(1), lane.tokens.time_until(tokens))
+            if wait > 0:
+                lane.wakeup = asyncio.get_running_loop().call_later(wait, self._pump, lane)
+                return
+            heapq.heappop(lane.waiters)
+            lane.requests.consume(1)
+            lane.tokens.consume(tokens)
+            future.set_result(None)
+
+    def update_from_headers(self, config, headers: Mapping[str, str]):
+        """Refresh a lane's limits from OpenAI- or Anthropic-style rate-limit headers."""
+        def number(*names) -> Optional[float]:
+            for name in names:
+                value = headers.get(name)
+                if value is not None:
+                    try:
+                        return float(value)
+                    except ValueError:
+                        continue
+            return None
+
+        lane = self._lane(config)
+        lane.requests.update(
+            per_minute=number("x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"),
+            remaining=number("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining")
+        )
+        lane.tokens.update(
+            per_minute=number("x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit"),
+            remaining=number("x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining")
+        )
+        if lane.waiters:
+            self._pump(lane)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-lane queue depth, wait times and current limits."""
+        return {
+            f"{provider}:{model}": {
+                "queue_depth": sum(1 for w in lane.waiters if not w[2].done()),
+                "granted": lane.granted,
+                "avg_wait_ms": round(lane.total_wait / lane.granted * 1000, 2) if lane.granted else 0.0,
+                "max_wait_ms": round(lane.max_wait * 1000, 2),
+                "rpm": lane.requests.per_minute,
+                "tpm": lane.tokens.per_minute
+            }
+            for (provider, model), lane in self._lanes.items()
+        }
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+def get_scheduler() -> Optional[LLMScheduler]:
+    """Return the process-wide LLM scheduler, or None when rate limiting is disabled."""
+    return _scheduler
+
+def set_scheduler(scheduler: Optional[LLMScheduler]) -> Optional[LLMScheduler]:
+    """Install (or with None, disable) the process-wide LLM scheduler; returns the previous one."""
+    global _scheduler
+    previous, _scheduler = _scheduler, scheduler
+    return previous
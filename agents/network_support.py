@@ -1,4 +1,5 @@
 from typing import Any, Dict
+from .action_plan import Action
 from .base import BaseAgent
 from .system_prompts import SYSTEM_PROMPTS
 
@@ -6,6 +7,8 @@ class NetworkSupportAgent(BaseAgent):
     """
     Agent for network and connectivity issues.
     """
+    ticket_fields = ("subject", "priority", "tags", "description", "conversations")
+
     def __init__(self, *a, **kw):
         super().__init__(*a, **kw)
         self.system_prompt = SYSTEM_PROMPTS["network_support_agent"]
@@ -14,15 +17,19 @@ class NetworkSupportAgent(BaseAgent):
         ticket = message.payload.data.get("ticket")
         if not ticket:
             return {"error": "No ticket found in message."}
-        # Analyze network issue with LLM
-        analysis = await self.run_llm(f"Diagnose network issue: {ticket}")
-        # Update ticket with network status
-        update_result = await self.call_mcp_tool(
-            tool_name="freshdesk",
-            operation="add_note",
-            arguments={"ticket_id": ticket.get("id"), "note": analysis}
-        )
+        plan = await self.run_action_plan([
+            # Analyze network issue with LLM
+            Action("analyze", lambda done: self.run_llm_for_ticket(
+                ticket, f"Diagnose network issue:\n{self.render_ticket(ticket)}"), timeout=None),
+            # Update ticket with network status
+            Action("record", lambda done: self.call_mcp_tool(
+                tool_name="freshdesk",
+                operation="add_note",
+                arguments={"ticket_id": ticket.get("id"), "note": done["analyze"]}
+            ), depends_on=("analyze",))
+        ], ticket_id=ticket.get("id"))
         return {
-            "analysis": analysis,
-            "update_result": update_result
+            "analysis": plan.unwrap("analyze"),
+            "update_result": plan.get("record"),
+            "failed_actions": plan.errors()
         } 
\ No newline at end of file
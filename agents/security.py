@@ -1,4 +1,5 @@
 from typing import Any, Dict
+from .action_plan import Action
 from .base import BaseAgent
 from .system_prompts import SYSTEM_PROMPTS
 
@@ -6,6 +7,10 @@ class SecurityAgent(BaseAgent):
     """
     Agent for security incidents and compliance.
     """
+    # Security incidents jump the LLM scheduler queue
+    llm_priority = 1.0
+    ticket_fields = ("id", "subject", "email", "priority", "tags", "description", "conversations")
+
     def __init__(self, *a, **kw):
         super().__init__(*a, **kw)
         self.system_prompt = SYSTEM_PROMPTS["security_agent"]
@@ -14,28 +19,32 @@ class SecurityAgent(BaseAgent):
         ticket = message.payload.data.get("ticket")
         if not ticket:
             return {"error": "No ticket found in message."}
-        # Analyze security incident with LLM
-        analysis = await self.run_llm(f"Assess security incident: {ticket}")
-        # Add security incident note
-        await self.call_mcp_tool(
-            tool_name="freshdesk",
-            operation="add_note",
-            arguments={"ticket_id": ticket.get("id"), "note": analysis}
-        )
-        # Update ticket status
-        update_result = await self.call_mcp_tool(
-            tool_name="freshdesk",
-            operation="update_ticket_status",
-            arguments={"ticket_id": ticket.get("id"), "status": "security_review"}
-        )
-        # Coordinate with other agents (stub)
-        coordination = await self.send_message(
-            recipient_id="escalation_manager",
-            intent="security_incident",
-            data={"ticket": ticket}
-        )
+
+        async def record(done):
+            # Add security incident note and update ticket status in one round trip
+            _, update_result = [result.unwrap() for result in await self.call_mcp_tools([
+                ("freshdesk", "add_note", {"ticket_id": ticket.get("id"), "note": done["analyze"]}),
+                ("freshdesk", "update_ticket_status", {"ticket_id": ticket.get("id"), "status": "security_review"})
+            ])]
+            return update_result
+
+        plan = await self.run_action_plan([
+            # Analyze security incident with LLM
+            Action("analyze", lambda done: self.run_llm(
+                f"Assess security incident:\n{self.render_ticket(ticket)}", priority=self.ticket_llm_priority(ticket),
+                ticket_id=ticket.get("id")
+            ), timeout=None),
+            Action("record", record, depends_on=("analyze",)),
+            # Coordinate with other agents (stub); doesn't need the analysis, so it goes out right away
+            Action("escalate", lambda done: self.send_message(
+                recipient_id="escalation_manager",
+                intent="security_incident",
+                data={"ticket": ticket}
+            ))
+        ], ticket_id=ticket.get("id"))
         return {
-            "analysis": analysis,
+            "analysis": plan.unwrap("analyze"),
             "coordinated_with": "escalation_manager",
-            "update_result": update_result
+            "update_result": plan.get("record"),
+            "failed_actions": plan.errors()
         } 
\ No newline at end of file
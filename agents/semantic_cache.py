@@ -0,0 +1,208 @@
+import re
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# NumPy is imported when the first embedder is built, not when agents import this module
+np = None
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("NumPy not installed. Run: pip install numpy")
+        np = numpy
+    return np
+
+
+def ticket_text(ticket: Dict[str, Any]) -> str:
+    """Text used to compare tickets: subject plus description."""
+    return f"{ticket.get('subject') or ''}\n{ticket.get('description') or ''}".strip()
+
+
+class HashedNgramEmbedder:
+    """
+    Dependency-light text embedder: word unigrams/bigrams and character
+    n-grams hashed into a fixed-size, L2-normalised float32 vector.
+    """
+
+    def __init__(self, dim: int = 1024, char_ngrams: Tuple[int, int] = (3, 5)):
+        _require_numpy()
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+
+    def _features(self, text: str) -> Iterable[str]:
+        text = re.sub(r"\s+", " ", text.lower()).strip()
+        words = re.findall(r"[a-z0-9]+", text)
+        yield from ("w:" + w for w in words)
+        yield from ("b:" + a + " " + b for a, b in zip(words, words[1:]))
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                for i in range(len(padded) - n + 1):
+                    yield "c:" + padded[i:i + n]
+
+    def embed(self, text: str) -> "np.ndarray":
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            # Use one hash bit as the sign to keep collisions unbiased
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts: List[str]) -> "np.ndarray":
+        matrix = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = self.embed(text)
+        return matrix
+
+
+class _VectorIndex:
+    """
+    Matrix of unit vectors with per-entry expiry and LRU slot reuse once
+    full (expired slots first). Rows are allocated on demand, doubling up
+    to capacity.
+    """
+
+    INITIAL_ROWS = 64
+
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        rows = min(capacity, self.INITIAL_ROWS)
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.last_used = np.zeros(rows, dtype=np.int64)
+        self.expires_at = np.full(rows, np.inf)
+        self.values: List[Any] = [None] * rows
+        self.size = 0
+
+    def _grow(self):
+        rows = min(self.capacity, 2 * len(self.values))
+        vectors = np.zeros((rows, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        last_used = np.zeros(rows, dtype=np.int64)
+        last_used[:self.size] = self.last_used[:self.size]
+        expires_at = np.full(rows, np.inf)
+        expires_at[:self.size] = self.expires_at[:self.size]
+        self.vectors, self.last_used, self.expires_at = vectors, last_used, expires_at
+        self.values.extend([None] * (rows - len(self.values)))
+
+    def search(self, queries: "np.ndarray", now: float) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Best unexpired (slot, cosine similarity) for each query row."""
+        if self.size == 0:
+            n = len(queries)
+            return np.full(n, -1), np.full(n, -1.0, dtype=np.float32)
+        scores = queries @ self.vectors[:self.size].T
+        scores[:, self.expires_at[:self.size] <= now] = -1.0
+        best = scores.argmax(axis=1)
+        return best, scores[np.arange(len(queries)), best]
+
+    def insert(self, vector: "np.ndarray", value: Any, tick: int, now: float, ttl: Optional[float]) -> bool:
+        """Store vector/value; returns True if an unexpired entry was evicted."""
+        if self.size == len(self.values) < self.capacity:
+            self._grow()
+        evicted = False
+        if self.size == len(self.values):
+            expired = self.expires_at <= now
+            slot = int(np.where(expired, -1, self.last_used).argmin())
+            evicted = not expired[slot]
+        else:
+            slot = self.size
+            self.size += 1
+        self.vectors[slot] = vector
+        self.values[slot] = value
+        self.last_used[slot] = tick
+        self.expires_at[slot] = np.inf if ttl is None else now + ttl
+        return evicted
+
+
+class SemanticCache:
+    """
+    Near-duplicate cache for ticket analyses.
+
+    Keeps one vector index per namespace (see BaseAgent.semantic_namespace)
+    and returns a previous analysis when a new ticket's cosine similarity to
+    a cached ticket reaches the threshold. Entries expire after ttl seconds
+    (None keeps them until evicted).
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_entries_per_agent: int = 10000,
+        embedder: Optional[HashedNgramEmbedder] = None,
+        ttl: Optional[float] = 86400.0
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries_per_agent = max_entries_per_agent
+        self.embedder = embedder or HashedNgramEmbedder()
+        self._indexes: Dict[str, _VectorIndex] = {}
+        self._tick = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _index(self, namespace: str) -> _VectorIndex:
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = _VectorIndex(self.embedder.dim, self.max_entries_per_agent)
+            self._indexes[namespace] = index
+        return index
+
+    def lookup(self, namespace: str, text: str) -> Optional[Tuple[Any, float]]:
+        """Return (cached value, similarity) for the closest match, or None."""
+        return self.lookup_many(namespace, [text])[0]
+
+    def lookup_many(self, namespace: str, texts: List[str]) -> List[Optional[Tuple[Any, float]]]:
+        """Vectorized lookup of a batch of texts against one agent's index."""
+        index = self._index(namespace)
+        slots, scores = index.search(self.embedder.embed_many(texts), time.monotonic())
+        results: List[Optional[Tuple[Any, float]]] = []
+        for slot, score in zip(slots.tolist(), scores.tolist()):
+            if slot >= 0 and score >= self.threshold:
+                self._tick += 1
+                index.last_used[slot] = self._tick
+                self.hits += 1
+                results.append((index.values[slot], score))
+            else:
+                self.misses += 1
+                results.append(None)
+        return results
+
+    def add(self, namespace: str, text: str, value: Any):
+        self.add_many(namespace, [text], [value])
+
+    def add_many(self, namespace: str, texts: List[str], values: List[Any]):
+        index = self._index(namespace)
+        now = time.monotonic()
+        for vector, value in zip(self.embedder.embed_many(texts), values):
+            self._tick += 1
+            if index.insert(vector, value, self._tick, now, self.ttl):
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": {ns: index.size for ns, index in self._indexes.items()}
+        }
+
+
+_semantic_cache: Optional[SemanticCache] = None
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, or None when disabled."""
+    return _semantic_cache
+
+def set_semantic_cache(cache: Optional[SemanticCache]) -> Optional[SemanticCache]:
+    """Install (or with None, disable) the process-wide semantic cache; returns the previous one."""
+    global _semantic_cache
+    previous, _semantic_cache = _semantic_cache, cache
+    return previous
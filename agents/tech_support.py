@@ -1,4 +1,5 @@
 from typing import Any, Dict
+from .action_plan import Action
 from .base import BaseAgent
 from .system_prompts import SYSTEM_PROMPTS
 
@@ -6,6 +7,8 @@ class TechnicalSupportAgent(BaseAgent):
     """
     Agent for hardware/software troubleshooting. Can consult NetworkSupportAgent.
     """
+    ticket_fields = ("subject", "priority", "type", "tags", "description", "conversations")
+
     def __init__(self, *a, **kw):
         super().__init__(*a, **kw)
         self.system_prompt = SYSTEM_PROMPTS["tech_support_agent"]
@@ -14,31 +17,30 @@ class TechnicalSupportAgent(BaseAgent):
         ticket = message.payload.data.get("ticket")
         if not ticket:
             return {"error": "No ticket found in message."}
-        # Analyze ticket with LLM
-        analysis = await self.run_llm(f"Troubleshoot this ticket: {ticket}")
-        # If network issue detected, consult NetworkSupportAgent
+
+        actions = [
+            # Analyze ticket with LLM
+            Action("analyze", lambda done: self.run_llm_for_ticket(
+                ticket, f"Troubleshoot this ticket:\n{self.render_ticket(ticket)}"), timeout=None),
+            # Mark the ticket in progress while the LLM works on it
+            Action("update_status", lambda done: self.call_mcp_tool(
+                "freshdesk", "update_ticket_status", {"ticket_id": ticket.get("id"), "status": "in_progress"})),
+            # Add troubleshooting note
+            Action("annotate", lambda done: self.call_mcp_tool(
+                "freshdesk", "add_note", {"ticket_id": ticket.get("id"), "note": done["analyze"]}
+            ), depends_on=("analyze",))
+        ]
+        # If network issue detected, consult NetworkSupportAgent alongside the analysis
         if "network" in ticket.get("description", "").lower():
-            consult_result = await self.send_message(
+            actions.append(Action("consult_network", lambda done: self.send_message(
                 recipient_id="network_support_agent",
                 intent="consult",
                 data={"ticket": ticket}
-            )
-        else:
-            consult_result = None
-        # Update ticket status
-        update_result = await self.call_mcp_tool(
-            tool_name="freshdesk",
-            operation="update_ticket_status",
-            arguments={"ticket_id": ticket.get("id"), "status": "in_progress"}
-        )
-        # Add troubleshooting note
-        await self.call_mcp_tool(
-            tool_name="freshdesk",
-            operation="add_note",
-            arguments={"ticket_id": ticket.get("id"), "note": analysis}
-        )
+            )))
+        plan = await self.run_action_plan(actions, ticket_id=ticket.get("id"))
         return {
-            "analysis": analysis,
-            "consulted_network": bool(consult_result),
-            "update_result": update_result
+            "analysis": plan.unwrap("analyze"),
+            "consulted_network": bool(plan.get("consult_network")),
+            "update_result": plan.get("update_status"),
+            "failed_actions": plan.errors()
         } 
\ No newline at end of file
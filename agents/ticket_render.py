@@ -0,0 +1,121 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .llm import estimate_tokens
+
+DEFAULT_TICKET_FIELDS = ("id", "subject", "priority", "status", "type", "tags", "description", "conversations")
+
+# Freshdesk numeric codes rendered as words the model understands
+PRIORITY_NAMES = {1: "Low", 2: "Medium", 3: "High", 4: "Urgent"}
+STATUS_NAMES = {2: "Open", 3: "Pending", 4: "Resolved", 5: "Closed"}
+
+TRUNCATION_MARK = " [...]"
+
+
+def normalize_whitespace(text: Any) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, preferring a word boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, max_tokens * 4 - len(TRUNCATION_MARK))
+    cut = text[:limit]
+    if " " in cut[limit // 2:]:
+        cut = cut[:cut.rfind(" ")]
+    return cut + TRUNCATION_MARK
+
+
+class TicketRenderer:
+    """
+    Renders a ticket dict into a compact prompt block for an agent.
+
+    Only allowlisted fields are kept, whitespace is normalised, and the
+    description and conversation thread are trimmed to a token budget
+    (latest thread entries are kept first). Token counts before (raw dict
+    repr, as previously pasted into prompts) and after are accumulated.
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[str] = DEFAULT_TICKET_FIELDS,
+        max_tokens: int = 600,
+        description_tokens: int = 350
+    ):
+        self.fields = tuple(fields)
+        self.max_tokens = max_tokens
+        self.description_tokens = description_tokens
+        self.renders = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def _value(self, field: str, value: Any) -> Optional[str]:
+        if value is None or value == "" or value == []:
+            return None
+        if field == "priority":
+            return PRIORITY_NAMES.get(value, normalize_whitespace(value))
+        if field == "status":
+            return STATUS_NAMES.get(value, normalize_whitespace(value))
+        if isinstance(value, (list, tuple, set)):
+            return ", ".join(normalize_whitespace(v) for v in value)
+        if isinstance(value, dict):
+            return ", ".join(f"{k}={normalize_whitespace(v)}" for k, v in value.items() if v not in (None, ""))
+        return normalize_whitespace(value)
+
+    def _thread(self, conversations: List[Any], budget: int) -> List[str]:
+        lines: List[str] = []
+        for entry in reversed(conversations or []):
+            if isinstance(entry, dict):
+                body = entry.get("body_text") or entry.get("body") or ""
+                author = "Agent" if entry.get("private") or entry.get("incoming") is False else "Requester"
+            else:
+                body, author = entry, "Message"
+            line = f"- {author}: {normalize_whitespace(body)}"
+            cost = estimate_tokens(line)
+            if cost > budget:
+                if budget > 20:
+                    lines.append(truncate_to_tokens(line, budget))
+                break
+            lines.append(line)
+            budget -= cost
+        return list(reversed(lines))
+
+    def render_with_counts(self, ticket: Dict[str, Any]) -> Tuple[str, int, int]:
+        """Render ticket; returns (text, tokens before, tokens after)."""
+        lines: List[str] = []
+        for field in self.fields:
+            if field in ("description", "conversations"):
+                continue
+            value = self._value(field, ticket.get(field))
+            if value is not None:
+                lines.append(f"{field.replace('_', ' ').capitalize()}: {value}")
+
+        if "description" in self.fields and ticket.get("description"):
+            description = truncate_to_tokens(normalize_whitespace(ticket["description"]), self.description_tokens)
+            lines.append(f"Description: {description}")
+
+        remaining = self.max_tokens - estimate_tokens("\n".join(lines))
+        if "conversations" in self.fields and ticket.get("conversations") and remaining > 0:
+            thread = self._thread(ticket["conversations"], remaining)
+            if thread:
+                lines.append("Thread (oldest first):")
+                lines.extend(thread)
+
+        text = "\n".join(lines)
+        before, after = estimate_tokens(str(ticket)), estimate_tokens(text)
+        self.renders += 1
+        self.tokens_before += before
+        self.tokens_after += after
+        return text, before, after
+
+    def render(self, ticket: Dict[str, Any]) -> str:
+        return self.render_with_counts(ticket)[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "renders": self.renders,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_before - self.tokens_after
+        }
@@ -1,11 +1,26 @@
-from typing import Any, Dict
+import re
+from typing import Any, Dict, Tuple
+from .action_plan import Action
 from .base import BaseAgent
+from .semantic_cache import get_semantic_cache
 from .system_prompts import SYSTEM_PROMPTS
 
+CATEGORY_LINE = re.compile(r"\W*category\W*?[:\-][\s*_]*(\w+)", re.IGNORECASE)
+
+# Ticket category -> specialist agent it is assigned to
+ASSIGNEES = {
+    "software": "tech_support_agent",
+    "hardware": "network_support_agent",
+}
+
 class TriageAgent(BaseAgent):
     """
     Agent responsible for initial ticket triage: analyzes, categorizes, and assigns tickets.
     """
+    # New tickets are triaged ahead of specialist follow-up work
+    llm_priority = 3.0
+    ticket_fields = ("id", "subject", "email", "priority", "status", "type", "tags", "description", "conversations")
+
     def __init__(self, *a, **kw):
         super().__init__(*a, **kw)
         self.system_prompt = SYSTEM_PROMPTS["triage_agent"]
@@ -15,30 +30,64 @@ class TriageAgent(BaseAgent):
         ticket = message.payload.data.get("ticket")
         if not ticket:
             return {"error": "No ticket found in message."}
-        # Create ticket in Freshdesk
-        created = await self.call_mcp_tool("freshdesk", "create_ticket", ticket)
-        # Analyze ticket with LLM
-        analysis = await self.run_llm(f"Analyze and categorize this ticket: {ticket}")
-        # For demo, pretend to extract category and assignee
-        category = "software" if "software" in ticket.get("description", "").lower() else "hardware"
-        assignee = "tech_support_agent" if category == "software" else "network_support_agent"
-        # Add initial note
-        await self.call_mcp_tool("freshdesk", "add_note", {"ticket_id": created.get("id", ticket.get("id")), "note": analysis})
-        # Assign ticket (stub)
-        assign_result = await self.call_mcp_tool(
-            tool_name="freshdesk",
-            operation="assign_ticket",
-            arguments={"ticket_id": created.get("id", ticket.get("id")), "assignee": assignee}
-        )
-        # Send update message (stub)
-        await self.send_message(
-            recipient_id=assignee,
-            intent="ticket_assigned",
-            data={"ticket": ticket, "category": category}
+        prompt = (
+            "Analyze and categorize this ticket. Start with a line 'Category: software' or "
+            f"'Category: hardware'.\n{self.render_ticket(ticket)}"
         )
+
+        async def analyze(done):
+            if self.semantic_cache is not None or get_semantic_cache() is not None:
+                # Near-duplicate tickets reuse a whole cached analysis
+                return await self.run_llm_for_ticket(ticket, prompt)
+            analysis = ""
+            async for delta in self.run_llm_stream(
+                prompt, priority=self.ticket_llm_priority(ticket), ticket_id=ticket.get("id")
+            ):
+                analysis += delta
+            return analysis
+
+        async def annotate(done):
+            # Add the initial note and assign the ticket Freshdesk created, in one round trip
+            _, assignee = self.route(done["analyze"], ticket)
+            ticket_id = (done["create_ticket"] or {}).get("id", ticket.get("id"))
+            _, assign_result = [result.unwrap() for result in await self.call_mcp_tools([
+                ("freshdesk", "add_note", {"ticket_id": ticket_id, "note": done["analyze"]}),
+                ("freshdesk", "assign_ticket", {"ticket_id": ticket_id, "assignee": assignee})
+            ])]
+            return assign_result
+
+        async def notify(done):
+            category, assignee = self.route(done["analyze"], ticket)
+            # Send update message (stub)
+            return await self.send_message(
+                recipient_id=assignee,
+                intent="ticket_assigned",
+                data={"ticket": ticket, "category": category}
+            )
+
+        # Create the ticket in Freshdesk while the LLM analyzes it
+        plan = await self.run_action_plan([
+            Action("analyze", analyze, timeout=None),
+            Action("create_ticket", lambda done: self.call_mcp_tool("freshdesk", "create_ticket", ticket)),
+            Action("annotate", annotate, depends_on=("analyze", "create_ticket")),
+            Action("notify", notify, depends_on=("annotate",))
+        ], ticket_id=ticket.get("id"))
+        analysis = plan.unwrap("analyze")
+        category, assignee = self.route(analysis, ticket)
         return {
             "analysis": analysis,
             "category": category,
             "assigned_to": assignee,
-            "assign_result": assign_result
-        } 
\ No newline at end of file
+            "assign_result": plan.get("annotate"),
+            "failed_actions": plan.errors()
+        }
+
+    def route(self, analysis: str, ticket: Dict[str, Any]) -> Tuple[str, str]:
+        """(category, assignee) from the analysis' 'Category: ...' line, or from keywords if it names neither."""
+        match = CATEGORY_LINE.match(analysis)
+        if match and match.group(1).lower() in ASSIGNEES:
+            category = match.group(1).lower()
+        else:
+            # For demo, pretend to extract category and assignee
+            category = "software" if "software" in ticket.get("description", "").lower() else "hardware"
+        return category, ASSIGNEES[category]
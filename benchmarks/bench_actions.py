@@ -0,0 +1,122 @@
+"""
+Per-ticket latency of each agent's receive_message run serially (one
+action and one MCP round trip at a time, as the agents used to await
+them) against the concurrent action-plan executor with batched MCP
+calls, using the fake LLM and a fake MCP proxy and message bus that
+inject per-call latency. For agents that update the ticket status, the
+status column is the p50 time until that update has landed.
+
+    python -m benchmarks.bench_actions --tickets 40 --mcp-latency 0.08 --ttft 0.3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from agents.llm import LLMConfig, LLMProvider
+from utils.audit_logging import AuditLogger
+from utils.freshdesk_init_data import tickets as SAMPLE_TICKETS
+
+from .bench_agents import AGENTS, LatencyMCP, make_message
+
+
+class TimedMCP(LatencyMCP):
+    """LatencyMCP that notes when each ticket's first call of each operation completed."""
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.completed = {}
+
+    async def _call(self, tool_name, operation, arguments, idempotency_key=None):
+        result = await super()._call(tool_name, operation, arguments, idempotency_key)
+        self.completed.setdefault((arguments.get("ticket_id"), operation), time.perf_counter())
+        return result
+
+
+class LatencyBus:
+    """A2A bus stand-in whose send_message takes latency seconds."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    async def send_message(self, *a, **k):
+        await asyncio.sleep(self.latency)
+        return "sent"
+
+
+def llm_config(args) -> LLMConfig:
+    return LLMConfig(
+        provider=LLMProvider.FAKE,
+        model="fake-bench",
+        extra_params={"ttft_median": args.ttft, "ttft_sigma": 0.0, "per_token_latency": args.per_token, "seed": args.seed}
+    )
+
+
+async def measure(agent, tickets):
+    latencies, status_latencies = [], []
+
+    async def one(ticket):
+        t0 = time.perf_counter()
+        result = await agent.receive_message(make_message(ticket))
+        latencies.append(time.perf_counter() - t0)
+        status_at = agent.mcp_client.completed.get((ticket["id"], "update_ticket_status"))
+        if status_at is not None:
+            status_latencies.append(status_at - t0)
+        return len(result.get("failed_actions") or {})
+
+    failures = sum(await asyncio.gather(*(one(t) for t in tickets)))
+    latencies.sort()
+    status_p50 = statistics.median(status_latencies) if status_latencies else None
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1], status_p50, failures
+
+
+async def run(args):
+    audit_logger = AuditLogger(log_file=os.path.join(tempfile.mkdtemp(), "audit.log"), to_stdout=False)
+    bus = LatencyBus(args.bus_latency)
+    config = llm_config(args)
+    tickets = [
+        dict(SAMPLE_TICKETS[i % len(SAMPLE_TICKETS)], id=str(i),
+             # Make every other tech support ticket need a network consult
+             description=SAMPLE_TICKETS[i % len(SAMPLE_TICKETS)].get("description", "") + (" network" if i % 2 else ""))
+        for i in range(args.tickets)
+    ]
+    print(f"{'agent':22s} {'serial p50':>11s} {'concurrent p50':>15s} {'p95 serial/concurrent':>24s}  saved"
+          f"  {'status p50 serial/concurrent':>28s}")
+    failed = 0
+    for agent_id, cls in AGENTS:
+        results = {}
+        for mode, concurrency in (("serial", 1), ("concurrent", None)):
+            mcp = TimedMCP(args.mcp_latency, args.jitter, args.seed, serial=concurrency == 1)
+            agent = cls(agent_id, None, bus, mcp, None, config, secret="bench", audit_logger=audit_logger)
+            agent.action_concurrency = concurrency
+            # Fresh ticket ids per run so the LLM response cache can't help either mode
+            batch = [dict(t, id=f"{mode}-{t['id']}", subject=f"{mode} {t.get('subject', '')}") for t in tickets]
+            results[mode] = await measure(agent, batch)
+        (s50, s95, ss, sf), (c50, c95, cs, cf) = results["serial"], results["concurrent"]
+        status = f"{ss * 1000:.1f}/{cs * 1000:.1f}ms" if ss is not None and cs is not None else "-"
+        print(f"{agent_id:22s} {s50 * 1000:9.1f}ms {c50 * 1000:13.1f}ms "
+              f"{s95 * 1000:10.1f}/{c95 * 1000:.1f}ms {round((1 - c50 / s50) * 100):11d}%  {status:>28s}"
+              + (f"  failed actions={sf}/{cf}" if sf or cf else ""))
+        failed += sf + cf
+    await audit_logger.aclose()
+    if failed:
+        # Timings of runs whose actions failed don't measure the plan
+        raise SystemExit(f"{failed} actions failed")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=40)
+    parser.add_argument("--mcp-latency", type=float, default=0.08, help="seconds per MCP tool call")
+    parser.add_argument("--jitter", type=float, default=0.02, help="+/- uniform jitter on MCP latency (s)")
+    parser.add_argument("--bus-latency", type=float, default=0.05, help="seconds per A2A send_message")
+    parser.add_argument("--ttft", type=float, default=0.3, help="fake LLM time-to-first-token (s)")
+    parser.add_argument("--per-token", type=float, default=0.0, help="fake LLM seconds per output token")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
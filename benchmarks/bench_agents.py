@@ -0,0 +1,137 @@
+"""
+Offline agent benchmark: runs tickets through all five agents against the
+fake LLM provider with a realistic latency profile, so it can run in CI
+without provider credentials.
+
+    python -m benchmarks.bench_agents --tickets 50 --ttft 0.4 --per-token 0.01
+    python -m benchmarks.bench_agents --cassette session.jsonl   # replay a recorded session
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from agents.escalation_manager import EscalationManagerAgent
+from agents.llm import LLMConfig, LLMProvider
+from agents.network_support import NetworkSupportAgent
+from agents.security import SecurityAgent
+from agents.tech_support import TechnicalSupportAgent
+from agents.triage import TriageAgent
+from utils.audit_logging import AuditLogger
+from utils.freshdesk_init_data import tickets as SAMPLE_TICKETS
+from utils.mcp import MCPClient
+
+AGENTS = [
+    ("triage_agent", TriageAgent),
+    ("tech_support_agent", TechnicalSupportAgent),
+    ("network_support_agent", NetworkSupportAgent),
+    ("security_agent", SecurityAgent),
+    ("escalation_manager", EscalationManagerAgent),
+]
+
+
+class DummyDep:
+    """In-process stand-in for credentials, bus and OPA."""
+    def get_agent_credentials(self, agent_id): return ["dummy"]
+    def create_credential(self, **kwargs): return "dummy"
+    async def send_message(self, *a, **k): return "sent"
+    async def evaluate(self, input_data): return {"allow": True}
+
+
+class LatencyMCP(MCPClient):
+    """MCP proxy stand-in: every tool call takes latency (+/- jitter) seconds and echoes its arguments."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 1, serial: bool = False):
+        # No proxy to negotiate JSON-RPC batches with, so batches are pipelined
+        super().__init__(base_url="http://mcp.invalid", batch=False)
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        # serial=True: one round trip per operation, even within a call_tools batch
+        self.serial = serial
+
+    async def _send(self, wave, agent_id=None):
+        if not self.serial:
+            return await super()._send(wave, agent_id)
+        for item in wave:
+            await super()._send([item], agent_id)
+
+    async def delay(self):
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+    async def _call(self, tool_name, operation, arguments, idempotency_key=None):
+        # Below call_tool, so caching and request coalescing still apply
+        await self.delay()
+        return {"id": arguments.get("ticket_id", arguments.get("id", "1")), "operation": operation}
+
+
+def make_message(ticket):
+    class Msg: pass
+    msg = Msg(); msg.payload = Msg(); msg.payload.data = {"ticket": ticket}
+    return msg
+
+
+async def run(args):
+    if args.cassette:
+        llm_config = LLMConfig(provider=LLMProvider.REPLAY, model="replay", extra_params={"cassette": args.cassette})
+    else:
+        llm_config = LLMConfig(
+            provider=LLMProvider.FAKE,
+            model="fake-bench",
+            extra_params={
+                "ttft_median": args.ttft,
+                "ttft_sigma": args.sigma,
+                "per_token_latency": args.per_token,
+                "server_error_rate": args.error_rate,
+                "seed": args.seed
+            }
+        )
+    log_file = os.path.join(tempfile.mkdtemp(), "audit.log")
+    audit_logger = AuditLogger(log_file=log_file, to_stdout=False)
+    dep = DummyDep()
+    agents = {
+        agent_id: cls(agent_id, dep, dep, LatencyMCP(), dep, llm_config, secret="bench", audit_logger=audit_logger)
+        for agent_id, cls in AGENTS
+    }
+    tickets = [dict(SAMPLE_TICKETS[i % len(SAMPLE_TICKETS)], id=str(i)) for i in range(args.tickets)]
+
+    for agent_id, agent in agents.items():
+        latencies, failures = [], 0
+        start = time.perf_counter()
+
+        async def one(ticket):
+            nonlocal failures
+            t0 = time.perf_counter()
+            try:
+                await agent.receive_message(make_message(ticket))
+                latencies.append(time.perf_counter() - t0)
+            except Exception:
+                failures += 1
+
+        await asyncio.gather(*(one(t) for t in tickets))
+        elapsed = time.perf_counter() - start
+        ordered = sorted(latencies) or [0.0]
+        print(f"{agent_id:22s} p50={statistics.median(ordered) * 1000:7.1f}ms "
+              f"p95={ordered[int(len(ordered) * 0.95) - 1] * 1000:7.1f}ms "
+              f"throughput={len(tickets) / elapsed:6.1f} tickets/s failures={failures}")
+    await audit_logger.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=50)
+    parser.add_argument("--ttft", type=float, default=0.4, help="median time-to-first-token (s)")
+    parser.add_argument("--sigma", type=float, default=0.4, help="lognormal sigma of TTFT")
+    parser.add_argument("--per-token", type=float, default=0.005, help="seconds per output token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="simulated 5xx rate")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cassette", help="replay a recorded cassette instead of the fake profile")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
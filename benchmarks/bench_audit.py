@@ -0,0 +1,99 @@
+"""
+Audit logging throughput: the group-commit AuditLogger at each durability
+level against the previous lock + open/write/close-per-event implementation.
+
+    python -m benchmarks.bench_audit --events 20000 --concurrency 64
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from utils.audit_logging import DURABILITY_LEVELS, AuditLogger
+
+
+class LegacyAuditLogger:
+    """The pre-group-commit implementation, kept here as the baseline."""
+
+    def __init__(self, log_file: str, to_stdout: bool = True):
+        self.log_file = log_file
+        self.to_stdout = to_stdout
+        self._lock = asyncio.Lock()
+
+    async def log_audit_event(self, event_type: str, agent_id: str, action: str, details: dict):
+        entry = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "event_type": event_type,
+            "agent_id": agent_id,
+            "action": action,
+            "details": details
+        }
+        line = json.dumps(entry)
+        async with self._lock:
+            if self.log_file:
+                with open(self.log_file, "a") as f:
+                    f.write(line + "\n")
+            if self.to_stdout:
+                print("[AUDIT]", line)
+
+    async def aclose(self):
+        pass
+
+
+async def drive(audit, events: int, concurrency: int):
+    """Log `events` events from `concurrency` workers; returns (events/s, p99 call latency)."""
+    latencies = []
+    details = {"ticket_id": "T1", "resource": "freshdesk", "result": {"status": "ok", "id": 42}}
+
+    async def worker(count):
+        for _ in range(count):
+            t0 = time.perf_counter()
+            await audit.log_audit_event("mcp_call", "triage_agent", "create_ticket", details)
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    per_worker = events // concurrency
+    await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+    await audit.aclose()
+    elapsed = time.perf_counter() - start
+    return per_worker * concurrency / elapsed, statistics.quantiles(latencies, n=100)[98]
+
+
+async def run(args):
+    directory = tempfile.mkdtemp()
+    cases = [("legacy", lambda path: LegacyAuditLogger(path, to_stdout=args.stdout))]
+    for level in DURABILITY_LEVELS:
+        cases.append((f"group commit/{level}", lambda path, level=level: AuditLogger(
+            log_file=path, to_stdout=args.stdout, durability=level,
+            batch_size=args.batch_size, flush_interval=args.flush_interval
+        )))
+
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, factory in cases:
+            path = os.path.join(directory, f"{name.replace('/', '_')}.log")
+            events = args.legacy_events if name == "legacy" else args.events
+            results.append((name, *await drive(factory(path), events, args.concurrency)))
+    baseline = results[0][1]
+    for name, rate, p99 in results:
+        print(f"{name:24s}: {rate:10.0f} events/s  p99 log call={p99 * 1e6:8.1f}us  ({rate / baseline:5.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--legacy-events", type=int, default=5000, help="events for the slower baseline")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    parser.add_argument("--stdout", action="store_true", help="also echo events to stdout (sent to /dev/null)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
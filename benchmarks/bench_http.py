@@ -0,0 +1,112 @@
+"""
+Per-call latency of MCP tool calls with a new httpx.AsyncClient per call
+(the previous MCPClient behaviour) against the shared pooled HTTPTransport,
+using a local keep-alive HTTP/1.1 stand-in for the MCP proxy.
+
+    python -m benchmarks.bench_http --calls 500 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from utils.http_transport import HTTPTransport
+from utils.mcp import MCPClient
+
+
+class StandInServer:
+    """Minimal keep-alive HTTP server answering every POST with an MCP-style result."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.connections = 0
+        self.requests = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                body = json.dumps({"result": {"id": self.requests, "status": "ok"}}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n")
+                if not head.startswith(b"HEAD "):
+                    writer.write(body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+class PerCallClient(MCPClient):
+    """MCPClient as it was: a fresh httpx.AsyncClient (pool, handshake) for every call."""
+
+    async def call_tool(self, tool_name, operation, arguments, agent_id=None):
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.base_url}/mcp/tools/call",
+                json={"method": "call", "params": {"name": tool_name, "operation": operation, "arguments": arguments}},
+                headers={"Authorization": f"Bearer {self.token}"}
+            )
+            response.raise_for_status()
+            return response.json().get("result")
+
+
+async def measure(client: MCPClient, calls: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            t0 = time.perf_counter()
+            await client.call_tool("freshdesk", "get_ticket", {"ticket_id": i})
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1], calls / elapsed
+
+
+async def run(args):
+    server = StandInServer(args.delay)
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    base_url = f"http://127.0.0.1:{listener.sockets[0].getsockname()[1]}"
+
+    transport = HTTPTransport(max_keepalive_connections=args.concurrency)
+    await transport.warm_up([base_url])
+    cases = [("per-call client", PerCallClient(base_url)), ("pooled transport", MCPClient(base_url, transport=transport))]
+    for name, client in cases:
+        connections = server.connections
+        p50, p95, rate = await measure(client, args.calls, args.concurrency)
+        print(f"{name:18s}: p50={p50 * 1000:7.2f}ms p95={p95 * 1000:7.2f}ms "
+              f"{rate:8.0f} calls/s  connections opened={server.connections - connections}")
+    await transport.aclose()
+    listener.close()
+    await listener.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--delay", type=float, default=0.0, help="server-side processing time per call (s)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
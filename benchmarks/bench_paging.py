@@ -0,0 +1,94 @@
+"""
+Time to first ticket, total time and peak memory of the polling loop's
+ticket fetch: one list_tickets call returning the whole backlog (the
+previous fetch_new_tickets) against MCPClient.iter_tool walking cursor
+pages with prefetch and incremental parsing. The MCP stand-in streams
+responses at a fixed bandwidth after a per-request latency.
+
+    python -m benchmarks.bench_paging --tickets 5000 --page-size 100
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+import httpx
+
+from utils.http_transport import HTTPTransport
+from utils.mcp import MCPClient
+
+
+class SlowBody(httpx.AsyncByteStream):
+    def __init__(self, body: bytes, bandwidth: float, chunk_size: int = 16384):
+        self.body, self.bandwidth, self.chunk_size = body, bandwidth, chunk_size
+
+    async def __aiter__(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            await asyncio.sleep(self.chunk_size / self.bandwidth)
+            yield self.body[start:start + self.chunk_size]
+
+
+def stand_in(tickets: int, latency: float, bandwidth: float):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        arguments = json.loads(request.content)["params"]["arguments"]
+        start = int(arguments.get("cursor", 0))
+        end = min(tickets, start + arguments["per_page"]) if "per_page" in arguments else tickets
+        result = {"tickets": [
+            {"id": i, "subject": f"Ticket {i}", "description": "VPN disconnects every few minutes. " * 8,
+             "status": "open", "priority": i % 4}
+            for i in range(start, end)
+        ]}
+        if end < tickets:
+            result["next_cursor"] = str(end)
+        await asyncio.sleep(latency)
+        return httpx.Response(200, stream=SlowBody(json.dumps({"result": result}).encode(), bandwidth))
+    return handler
+
+
+async def measure(name: str, tickets, work: float):
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = None
+    count = 0
+    async for ticket in tickets():
+        if first is None:
+            first = time.perf_counter() - started
+        count += 1
+        await asyncio.sleep(work)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name:20s}: first ticket {first * 1000:8.1f}ms  all {count} in {elapsed * 1000:8.1f}ms  "
+          f"peak memory {peak / 2 ** 20:6.1f}MiB")
+
+
+async def run(args):
+    transport = HTTPTransport(transport=httpx.MockTransport(stand_in(args.tickets, args.latency, args.bandwidth)))
+    client = MCPClient(base_url="http://mcp.invalid", transport=transport)
+
+    async def whole_list():
+        result = await client.call_tool("freshdesk", "list_tickets", {"status": "open"})
+        for ticket in result.get("tickets", []):
+            yield ticket
+
+    def paged():
+        return client.iter_tool("freshdesk", "list_tickets", {"status": "open"}, page_size=args.page_size)
+
+    await measure("call_tool (1 page)", whole_list, args.work)
+    await measure("iter_tool (paged)", paged, args.work)
+    await transport.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02, help="stand-in latency per request (s)")
+    parser.add_argument("--bandwidth", type=float, default=20e6, help="stand-in response bandwidth (bytes/s)")
+    parser.add_argument("--work", type=float, default=0.0002, help="processing time per ticket (s)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Semantic cache benchmark: lookup latency and hit rate on synthetic tickets.
+
+Seeds one agent's index with tens of thousands of synthetic tickets derived
+from the Freshdesk sample data, then queries reworded near-duplicates (which
+should hit) and unrelated tickets (which should miss).
+
+    python -m benchmarks.bench_semantic_cache --entries 20000 --queries 2000
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+
+from agents.semantic_cache import SemanticCache, ticket_text
+from utils.freshdesk_init_data import tickets as SAMPLE_TICKETS
+
+FILLERS = ["please help", "urgent", "since this morning", "again", "for the whole team",
+           "thanks", "asap", "on my laptop", "after the update", "from home"]
+PEOPLE = ["Sarah", "Michael", "Emma", "James", "Lisa", "David", "Rachel", "Tom"]
+
+
+def synthetic_ticket(rng: random.Random, i: int) -> dict:
+    base = rng.choice(SAMPLE_TICKETS)
+    extra = " ".join(rng.sample(FILLERS, 2))
+    return {
+        "id": f"SYN{i}",
+        "subject": base["subject"],
+        "description": f"{rng.choice(PEOPLE)} here. {base['description']} {extra} (ref {i})"
+    }
+
+
+def reworded(rng: random.Random, ticket: dict) -> dict:
+    words = ticket["description"].split()
+    # Drop a couple of words and append a new filler
+    for _ in range(2):
+        words.pop(rng.randrange(len(words)))
+    return {"subject": ticket["subject"], "description": " ".join(words) + " " + rng.choice(FILLERS)}
+
+
+def unrelated(rng: random.Random) -> dict:
+    gibberish = lambda n: " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(n))
+    return {"subject": gibberish(5), "description": gibberish(40)}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cache = SemanticCache(threshold=args.threshold, max_entries_per_agent=args.entries)
+    seeded = [synthetic_ticket(rng, i) for i in range(args.entries)]
+
+    start = time.perf_counter()
+    cache.add_many("triage_agent", [ticket_text(t) for t in seeded], [f"analysis {t['id']}" for t in seeded])
+    build_s = time.perf_counter() - start
+
+    near = [ticket_text(reworded(rng, rng.choice(seeded))) for _ in range(args.queries)]
+    far = [ticket_text(unrelated(rng)) for _ in range(args.queries)]
+
+    single_ms = []
+    for text in near[:min(500, len(near))]:
+        t0 = time.perf_counter()
+        cache.lookup("triage_agent", text)
+        single_ms.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    near_results = cache.lookup_many("triage_agent", near)
+    batch_ms = (time.perf_counter() - t0) * 1000 / len(near)
+    far_results = cache.lookup_many("triage_agent", far)
+
+    print(f"index entries          : {args.entries}")
+    print(f"index build            : {build_s:.2f}s ({build_s / args.entries * 1e6:.0f} us/entry)")
+    print(f"single lookup p50/p99  : {statistics.median(single_ms):.3f} / {percentile(single_ms, 99):.3f} ms")
+    print(f"batch lookup per query : {batch_ms:.3f} ms")
+    print(f"near-duplicate hit rate: {sum(r is not None for r in near_results) / len(near):.1%}")
+    print(f"unrelated false hits   : {sum(r is not None for r in far_results) / len(far):.1%}")
+
+
+if __name__ == "__main__":
+    main()
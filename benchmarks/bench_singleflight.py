@@ -0,0 +1,73 @@
+"""
+Request coalescing under load: concurrent workers handle tickets drawn
+from a small hot set, each reading the ticket through MCP and running the
+same LLM analysis for it, with and without single-flight deduplication.
+Uses the fake LLM and the latency-injecting MCP stand-in.
+
+    python -m benchmarks.bench_singleflight --workers 64 --requests 2000 --hot 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from agents.llm import LLMClient, LLMConfig, LLMProvider
+from utils.singleflight import SingleFlight
+
+from .bench_agents import LatencyMCP
+
+
+class NoCoalescing(SingleFlight):
+    """Baseline: every call executes."""
+
+    async def do(self, key, fn):
+        self.calls += 1
+        self.executions += 1
+        return await fn()
+
+
+async def measure(flight_factory, args):
+    mcp = LatencyMCP(args.mcp_latency)
+    mcp.single_flight = flight_factory("mcp")
+    config = LLMConfig(provider=LLMProvider.FAKE, model=f"fake-sf-{id(mcp)}",
+                       extra_params={"latency": args.llm_latency, "seed": args.seed})
+    llm = LLMClient(config, single_flight=flight_factory("llm"))
+    rng = random.Random(args.seed)
+    tickets = [rng.randrange(args.hot) for _ in range(args.requests)]
+    queue = asyncio.Queue()
+    for ticket_id in tickets:
+        queue.put_nowait(ticket_id)
+
+    async def worker():
+        while not queue.empty():
+            ticket_id = queue.get_nowait()
+            ticket = await mcp.call_tool("freshdesk", "get_ticket", {"ticket_id": ticket_id})
+            await llm.generate(f"Analyze and categorize ticket {ticket['id']}", "triage")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.workers)))
+    elapsed = time.perf_counter() - started
+    return elapsed, mcp.single_flight.stats(), llm.single_flight.stats()
+
+
+async def run(args):
+    for name, factory in (("no coalescing", NoCoalescing), ("single-flight", SingleFlight)):
+        elapsed, mcp_stats, llm_stats = await measure(factory, args)
+        print(f"{name:14s}: {args.requests / elapsed:7.0f} tickets/s  "
+              f"MCP calls={mcp_stats['executions']:5d} (coalescing ratio {mcp_stats['coalescing_ratio']:.2f})  "
+              f"LLM calls={llm_stats['executions']:5d} (coalescing ratio {llm_stats['coalescing_ratio']:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--hot", type=int, default=20, help="number of distinct tickets")
+    parser.add_argument("--mcp-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
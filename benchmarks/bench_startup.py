@@ -0,0 +1,110 @@
+"""
+Cold-start cost of the entry points: import time of the agent modules and
+time-to-first-ticket for demo_app.py and integrated_orchestration.py.
+
+Every sample runs in a fresh interpreter. LLM calls go to the local fake
+provider and MCP/OPA/A2A calls are stubbed, so only startup work is timed.
+
+    python -m benchmarks.bench_startup --runs 7
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TARGETS = ["agents.llm", "agents.base", "demo_app", "integrated_orchestration"]
+
+# Runs in the child interpreter; prints one JSON line
+CHILD = r'''
+import asyncio, json, sys, time
+start = time.perf_counter()
+target, first_ticket = sys.argv[1], sys.argv[2] == "1"
+module = __import__(target)
+imported = time.perf_counter()
+sdks = sorted(m for m in ("openai", "anthropic", "google.generativeai", "ollama", "numpy") if m in sys.modules)
+result = {"import_s": imported - start, "sdks": sdks}
+
+class Bus:
+    async def send_message(self, *a, **k): return "sent"
+
+async def allow(input_data): return {"allow": True}
+
+TICKET = {"id": "T1", "subject": "VPN drops", "description": "VPN disconnects every few minutes."}
+
+async def call_tool(tool_name, operation, arguments, agent_id=None):
+    return {"tickets": [TICKET]} if operation == "list_tickets" else {"id": "T1"}
+
+async def iter_tool(tool_name, operation, arguments=None, **kwargs):
+    yield TICKET
+
+async def first_ticket_demo():
+    async for ticket in module.iter_new_tickets():
+        await module.process_ticket(ticket)
+        break
+    return "T1" in module.processed_ticket_ids
+
+async def first_ticket_orchestration():
+    agent = module.agent_instances["triage_agent"]
+    msg = type("Msg", (), {"payload": type("Payload", (), {"data": {"ticket": {"id": "T1", "description": "Laptop not booting."}}})})()
+    return "category" in await agent.receive_message(msg)
+
+if first_ticket:
+    module.audit_logger.to_stdout = False
+    module.mcp_client.call_tool = call_tool
+    module.mcp_client.iter_tool = iter_tool
+    module.policy_client.evaluate = allow
+    for agent in getattr(module, "agent_instances", {}).values():
+        agent.communication_bus = Bus()
+    if hasattr(module, "triage_agent"):
+        module.triage_agent.communication_bus = Bus()
+    run = first_ticket_demo if target == "demo_app" else first_ticket_orchestration
+    result["ok"] = asyncio.run(run())
+    result["first_ticket_s"] = time.perf_counter() - start
+print(json.dumps(result))
+'''
+
+
+def sample(target: str, first_ticket: bool, env: dict) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, target, "1" if first_ticket else "0"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure(target: str, first_ticket: bool, runs: int, env: dict) -> str:
+    samples = [sample(target, first_ticket, env) for _ in range(runs)]
+    failed = next((s for s in samples if "error" in s), None)
+    if failed:
+        return f"unavailable ({failed['error']})"
+    key = "first_ticket_s" if first_ticket else "import_s"
+    median = statistics.median(s[key] for s in samples) * 1000
+    sdks = ", ".join(samples[0]["sdks"]) or "none"
+    return f"{median:8.1f} ms   heavy modules loaded: {sdks}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement (median reported)")
+    parser.add_argument("--provider", default="fake", help="LLM_PROVIDER for the entry points")
+    args = parser.parse_args()
+
+    env = dict(os.environ, LLM_PROVIDER=args.provider, LLM_MODEL="fake-startup",
+               AUDIT_LOG_FILE=os.devnull, PYTHONDONTWRITEBYTECODE="1")
+    print("import time")
+    for target in IMPORT_TARGETS:
+        print(f"  {target:26s}: {measure(target, False, args.runs, env)}")
+    print("time to first ticket (process start -> first ticket handled)")
+    for target in ("demo_app", "integrated_orchestration"):
+        print(f"  {target:26s}: {measure(target, True, args.runs, env)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
 import asyncio
 import os
-from utils.mcp import MCPClient
-from utils.policy import OPAPolicyClient
+import time
+from utils.mcp import IdempotencyJournal, MCPClient, MCPReadCache, MCPRetryPolicy
+from utils.singleflight import single_flight_stats
+from utils.http_transport import HTTPTransport, get_transport, set_transport
+from utils.policy import OPAPolicyClient, PolicyDecisionCache
+from utils.policy_engine import LocalPolicyEngine
 from utils.audit_logging import AuditLogger
+from utils.audit_policy import AuditPolicy
 from agents.triage import TriageAgent
 from agents.tech_support import TechnicalSupportAgent
 from agents.network_support import NetworkSupportAgent
@@ -10,12 +15,13 @@ from agents.security import SecurityAgent
 from agents.escalation_manager import EscalationManagerAgent
 from agent_auth.credentials import CredentialStore
 from a2a_collaboration.communication import A2ACommunicationBus
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict
 import logging
 
 # --- Config ---
 FRESHDESK_TOOL_NAME = "freshdesk"
 POLL_INTERVAL = int(os.getenv("TICKET_POLL_INTERVAL", 10000))  # seconds
+TICKET_PAGE_SIZE = int(os.getenv("TICKET_PAGE_SIZE", 100))  # tickets per list_tickets page
 
 # --- Logging setup ---
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s %(message)s')
@@ -24,13 +30,58 @@ logger = logging.getLogger("demo_app")
 # --- Setup dependencies ---
 credential_store = CredentialStore()
 communication_bus = A2ACommunicationBus(registry=None)  # Replace with real registry if needed
-mcp_client = MCPClient()
-policy_client = OPAPolicyClient()
-audit_logger = AuditLogger()
+# One pooled, keep-alive HTTP transport shared by MCP and OPA calls
+set_transport(HTTPTransport(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 100)),
+    max_connections_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 0)) or None
+))
+# Serve Freshdesk reads (ticket lists, lookups) from a write-invalidated cache; MCP_CACHE=0 disables.
+# Writes are retried with idempotency keys; with MCP_JOURNAL_PATH set, writes confirmed before a
+# restart (within MCP_JOURNAL_TTL seconds) are not re-sent when their tickets are processed again
+mcp_client = MCPClient(
+    cache=MCPReadCache.from_env() if os.getenv("MCP_CACHE", "1") != "0" else None,
+    retry_policy=MCPRetryPolicy(max_attempts=int(os.getenv("MCP_RETRY_ATTEMPTS", 4))),
+    journal=IdempotencyJournal(os.environ["MCP_JOURNAL_PATH"]) if os.getenv("MCP_JOURNAL_PATH") else None
+)
+# Reuse OPA decisions for repeated (agent, action, resource) inputs; with
+# POLICY_BUNDLE set, decide in process from the synced bundle first
+policy_client = OPAPolicyClient(
+    cache=PolicyDecisionCache(
+        ttl=float(os.getenv("POLICY_CACHE_TTL", 60)),
+        negative_ttl=float(os.getenv("POLICY_CACHE_NEGATIVE_TTL", 5)),
+        revision_check_interval=float(os.getenv("POLICY_REVISION_CHECK_INTERVAL", 10))
+    ),
+    local=LocalPolicyEngine() if os.getenv("POLICY_BUNDLE") else None
+)
+# Sampling, slow/failed-ticket trace retention and payload caps come from AUDIT_* env vars
+audit_logger = AuditLogger(policy=AuditPolicy.from_env())
 
 # Dummy LLM config for demo
-from agents.llm import LLMConfig, LLMProvider
-llm_config = LLMConfig(provider=LLMProvider.GEMINI, model="gemini-pro", temperature=0.2)
+from agents.llm import LLMConfig, LLMProvider, get_client_registry
+from agents.llm_cache import LRUResponseCache, SQLiteResponseCache, set_response_cache
+from agents.semantic_cache import SemanticCache, set_semantic_cache
+from agents.llm_scheduler import LLMScheduler, set_scheduler
+llm_config = LLMConfig(
+    provider=LLMProvider(os.getenv("LLM_PROVIDER", LLMProvider.GEMINI.value)),
+    model=os.getenv("LLM_MODEL", "gemini-pro"),
+    temperature=0.2
+)
+
+# Serve retried/repeated prompts from cache; persist across restarts if LLM_CACHE_PATH is set
+set_response_cache(LRUResponseCache(
+    store=SQLiteResponseCache() if os.getenv("LLM_CACHE_PATH") else None
+))
+# Keep ticket bursts inside provider RPM/TPM budgets instead of triggering 429 storms
+set_scheduler(LLMScheduler(
+    default_rpm=float(os.getenv("LLM_RPM_LIMIT", 500)),
+    default_tpm=float(os.getenv("LLM_TPM_LIMIT", 200000))
+))
+# Reuse analyses of near-duplicate tickets when a similarity threshold is configured
+if os.getenv("SEMANTIC_CACHE_THRESHOLD"):
+    set_semantic_cache(SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD")),
+        ttl=float(os.getenv("SEMANTIC_CACHE_TTL", 86400))
+    ))
 
 # --- Instantiate agents ---
 triage_agent = TriageAgent(
@@ -87,46 +138,75 @@ escalation_agent = EscalationManagerAgent(
 # --- Track processed tickets ---
 processed_ticket_ids = set()
 
-async def fetch_new_tickets() -> list:
-    """Fetch new/unassigned tickets from Freshdesk via MCP."""
+async def iter_new_tickets() -> AsyncIterator[Dict[str, Any]]:
+    """Yield new/unassigned Freshdesk tickets via MCP as their pages stream in."""
+    logger.info("Fetching new/unassigned tickets from Freshdesk...")
+    fetched = 0
     try:
-        logger.info("Fetching new/unassigned tickets from Freshdesk...")
-        result = await mcp_client.call_tool(
+        async for ticket in mcp_client.iter_tool(
             tool_name=FRESHDESK_TOOL_NAME,
             operation="list_tickets",
-            arguments={"status": "open", "assigned": False}
-        )
-        tickets = result.get("tickets", []) if result else []
-        logger.info(f"Fetched {len(tickets)} tickets from Freshdesk.")
-        return tickets
+            arguments={"status": "open", "assigned": False},
+            page_size=TICKET_PAGE_SIZE
+        ):
+            fetched += 1
+            if ticket.get("id") not in processed_ticket_ids:
+                yield ticket
     except Exception as e:
         logger.error(f"Failed to fetch tickets: {e}")
-        return []
+    logger.info(f"Fetched {fetched} tickets from Freshdesk.")
 
 async def process_ticket(ticket: Dict[str, Any]):
     ticket_id = ticket.get("id")
     logger.info(f"Processing ticket {ticket_id}: {ticket.get('subject')}")
+    started = time.perf_counter()
+    failed = False
     try:
         triage_result = await triage_agent.receive_message(
             type("Msg", (), {"payload": type("Payload", (), {"data": {"ticket": ticket}})})()
         )
+        failed_actions = triage_result.get("failed_actions")
+        if failed_actions:
+            # Leave it unprocessed so the next poll retries it; with MCP_JOURNAL_PATH set,
+            # writes that did go through are not repeated
+            failed = True
+            logger.error(f"Ticket {ticket_id} not fully processed, failed actions: {failed_actions}")
+            return
         logger.info(f"[TRIAGE] Ticket {ticket_id} categorized as {triage_result['category']} and assigned to {triage_result['assigned_to']}")
         processed_ticket_ids.add(ticket_id)
     except Exception as e:
+        failed = True
         logger.error(f"Error processing ticket {ticket_id}: {e}")
+    finally:
+        await audit_logger.end_trace(ticket_id, (time.perf_counter() - started) * 1000, failed)
 
 async def main():
     logger.info("[DEMO] Starting IT Helpdesk Agent Orchestration Demo...")
-    while True:
-        tickets = await fetch_new_tickets()
-        new_tickets = [t for t in tickets if t.get("id") not in processed_ticket_ids]
-        if new_tickets:
-            logger.info(f"Found {len(new_tickets)} new ticket(s) to process.")
-        for ticket in new_tickets:
-            await process_ticket(ticket)
-        if not new_tickets:
-            logger.info("No new tickets. Waiting...")
-        await asyncio.sleep(POLL_INTERVAL)
+    # Open MCP/OPA connections before the first ticket needs them
+    await get_transport().warm_up([mcp_client.base_url, policy_client.opa_url])
+    try:
+        while True:
+            # Triage starts with the first ticket of the first page, while later pages are still arriving
+            new_tickets = 0
+            async for ticket in iter_new_tickets():
+                new_tickets += 1
+                await process_ticket(ticket)
+            if new_tickets:
+                logger.info(f"Processed {new_tickets} new ticket(s).")
+                logger.info(f"Policy decision cache: {policy_client.stats()}")
+                logger.info(f"MCP client: {mcp_client.stats()}")
+                logger.info(f"Request coalescing: {single_flight_stats()}")
+            if not new_tickets:
+                logger.info("No new tickets. Waiting...")
+            await get_client_registry().evict_idle()
+            await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        # Close pooled LLM/HTTP connections, stop bundle sync and drain audit events on shutdown
+        await get_client_registry().aclose()
+        await policy_client.aclose()
+        await mcp_client.aclose()
+        await get_transport().aclose()
+        await audit_logger.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -1,21 +1,47 @@
 import asyncio
+import os
 from a2a_collaboration.registry import A2ARegistry
 from a2a_collaboration.session_manager import A2ASessionManager
 from a2a_collaboration.orchestration import A2AOrchestrationEngine, WorkflowStage, A2AWorkflow, SessionType
-from utils.policy import OPAPolicyClient
+from utils.policy import OPAPolicyClient, PolicyDecisionCache
+from utils.policy_engine import LocalPolicyEngine
 from agents.triage import TriageAgent
 from agents.tech_support import TechnicalSupportAgent
 from agents.network_support import NetworkSupportAgent
 from agents.security import SecurityAgent
 from agents.escalation_manager import EscalationManagerAgent
-from utils.mcp import MCPClient
+from utils.mcp import IdempotencyJournal, MCPClient, MCPReadCache, MCPRetryPolicy
+from utils.singleflight import single_flight_stats
+from utils.http_transport import HTTPTransport, get_transport, set_transport
 from utils.audit_logging import AuditLogger
+from agents.llm import LLMConfig, LLMProvider
 
 # --- 1. Setup registry, session manager, policy client ---
 registry = A2ARegistry()
 session_manager = A2ASessionManager(registry)
-policy_client = OPAPolicyClient()
-mcp_client = MCPClient()
+# Reuse OPA decisions for repeated (agent, action, resource) inputs; with
+# POLICY_BUNDLE set, decide in process from the synced bundle first
+policy_client = OPAPolicyClient(
+    cache=PolicyDecisionCache(
+        ttl=float(os.getenv("POLICY_CACHE_TTL", 60)),
+        negative_ttl=float(os.getenv("POLICY_CACHE_NEGATIVE_TTL", 5)),
+        revision_check_interval=float(os.getenv("POLICY_REVISION_CHECK_INTERVAL", 10))
+    ),
+    local=LocalPolicyEngine() if os.getenv("POLICY_BUNDLE") else None
+)
+# One pooled, keep-alive HTTP transport shared by MCP and OPA calls
+set_transport(HTTPTransport(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", 100)),
+    max_connections_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 0)) or None
+))
+# Serve Freshdesk reads (ticket lists, lookups) from a write-invalidated cache; MCP_CACHE=0 disables.
+# Writes are retried with idempotency keys; with MCP_JOURNAL_PATH set, writes confirmed before a
+# restart (within MCP_JOURNAL_TTL seconds) are not re-sent when their tickets are processed again
+mcp_client = MCPClient(
+    cache=MCPReadCache.from_env() if os.getenv("MCP_CACHE", "1") != "0" else None,
+    retry_policy=MCPRetryPolicy(max_attempts=int(os.getenv("MCP_RETRY_ATTEMPTS", 4))),
+    journal=IdempotencyJournal(os.environ["MCP_JOURNAL_PATH"]) if os.getenv("MCP_JOURNAL_PATH") else None
+)
 
 # --- 2. Instantiate real agent classes ---
 # For demo, use dummy deps for comm/mcp
@@ -29,13 +55,18 @@ credential_store = DummyDep()
 communication_bus = DummyDep()
 
 audit_logger = AuditLogger()
+llm_config = LLMConfig(
+    provider=LLMProvider(os.getenv("LLM_PROVIDER", LLMProvider.GEMINI.value)),
+    model=os.getenv("LLM_MODEL", "gemini-pro"),
+    temperature=0.2
+)
 
 agent_instances = {
-    "triage_agent": TriageAgent("triage_agent", credential_store, communication_bus, mcp_client, policy_client, secret="triage_secret", audit_logger=audit_logger),
-    "tech_support_agent": TechnicalSupportAgent("tech_support_agent", credential_store, communication_bus, mcp_client, policy_client, secret="tech_secret", audit_logger=audit_logger),
-    "network_support_agent": NetworkSupportAgent("network_support_agent", credential_store, communication_bus, mcp_client, policy_client, secret="network_secret", audit_logger=audit_logger),
-    "security_agent": SecurityAgent("security_agent", credential_store, communication_bus, mcp_client, policy_client, secret="security_secret", audit_logger=audit_logger),
-    "escalation_manager": EscalationManagerAgent("escalation_manager", credential_store, communication_bus, mcp_client, policy_client, secret="escalation_secret", audit_logger=audit_logger),
+    "triage_agent": TriageAgent("triage_agent", credential_store, communication_bus, mcp_client, policy_client, llm_config, secret="triage_secret", audit_logger=audit_logger),
+    "tech_support_agent": TechnicalSupportAgent("tech_support_agent", credential_store, communication_bus, mcp_client, policy_client, llm_config, secret="tech_secret", audit_logger=audit_logger),
+    "network_support_agent": NetworkSupportAgent("network_support_agent", credential_store, communication_bus, mcp_client, policy_client, llm_config, secret="network_secret", audit_logger=audit_logger),
+    "security_agent": SecurityAgent("security_agent", credential_store, communication_bus, mcp_client, policy_client, llm_config, secret="security_secret", audit_logger=audit_logger),
+    "escalation_manager": EscalationManagerAgent("escalation_manager", credential_store, communication_bus, mcp_client, policy_client, llm_config, secret="escalation_secret", audit_logger=audit_logger),
 }
 
 # --- 3. Register agents in registry ---
@@ -182,6 +213,9 @@ orchestration_engine.register_workflow(workflow_network)
 orchestration_engine.register_workflow(workflow_security)
 
 async def main():
+    # Open MCP/OPA connections before the first workflow needs them
+    await get_transport().warm_up([mcp_client.base_url, policy_client.opa_url])
+
     # Ticket Triage Workflow
     session_id = await session_manager.create_session(
         initiator_id="triage_agent",
@@ -220,6 +254,14 @@ async def main():
     await asyncio.sleep(2)
     status_security = orchestration_engine.get_execution_status(execution_id_security)
     print("Security Workflow execution status:", status_security)
+    print("Policy decision cache:", policy_client.stats())
+    print("MCP client:", mcp_client.stats())
+    print("Request coalescing:", single_flight_stats())
+    # Stop bundle sync, close pooled connections and drain buffered audit events
+    await policy_client.aclose()
+    await mcp_client.aclose()
+    await get_transport().aclose()
+    await audit_logger.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
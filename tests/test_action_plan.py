@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from agents.action_plan import Action, execute_plan
+
+
+def sleeper(delay, value=None, error=None):
+    async def run(done):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return value
+    return run
+
+
+@pytest.mark.asyncio
+async def test_independent_actions_run_concurrently_and_dependents_see_results():
+    seen = {}
+
+    async def record(done):
+        seen.update(done)
+        return done["analyze"] + "!"
+
+    started = time.perf_counter()
+    plan = await execute_plan([
+        Action("analyze", sleeper(0.05, "analysis")),
+        Action("notify", sleeper(0.05, "sent")),
+        Action("record", record, depends_on=("analyze",)),
+    ])
+    elapsed = time.perf_counter() - started
+    assert plan.ok and plan.unwrap("record") == "analysis!"
+    assert seen["analyze"] == "analysis"
+    assert elapsed < 0.09  # analyze and notify overlapped
+
+
+@pytest.mark.asyncio
+async def test_failures_and_timeouts_are_reported_per_action():
+    plan = await execute_plan([
+        Action("create", sleeper(0, error=RuntimeError("MCP error: down"))),
+        Action("note", sleeper(0, "noted"), depends_on=("create",)),
+        Action("slow", sleeper(1.0, "late"), timeout=0.02),
+        Action("notify", sleeper(0, "sent")),
+    ], timeout=5)
+    assert not plan.ok
+    assert {name: action.status for name, action in plan.actions.items()} == {
+        "create": "failed", "note": "skipped", "slow": "timeout", "notify": "ok"}
+    assert plan.get("notify") == "sent" and plan.get("note") is None
+    assert set(plan.errors()) == {"create", "note", "slow"}
+    with pytest.raises(RuntimeError):
+        plan.unwrap("create")
+    with pytest.raises(ValueError):
+        await execute_plan([Action("note", sleeper(0), depends_on=("create",))])
+
+
+@pytest.mark.asyncio
+async def test_security_agent_overlaps_escalation_with_analysis(tmp_path):
+    from agents.llm import LLMConfig, LLMProvider
+    from agents.security import SecurityAgent
+    from utils.audit_logging import AuditLogger
+    from utils.mcp import MCPClient
+
+    class SlowMCP(MCPClient):
+        async def call_tool(self, tool_name, operation, arguments, agent_id=None):
+            await asyncio.sleep(0.05)
+            return {"operation": operation, **arguments}
+
+    class SlowBus:
+        async def send_message(self, **kwargs):
+            await asyncio.sleep(0.05)
+            return "sent"
+
+    log_file = str(tmp_path / "audit.log")
+    audit = AuditLogger(log_file=log_file, to_stdout=False)
+    llm_config = LLMConfig(provider=LLMProvider.FAKE, model="fake",
+                           extra_params={"ttft_median": 0.05, "ttft_sigma": 0, "per_token_latency": 0})
+    agent = SecurityAgent("security_agent", None, SlowBus(), SlowMCP(batch=False), None, llm_config,
+                          secret="s", audit_logger=audit)
+
+    class Msg:
+        pass
+    msg = Msg(); msg.payload = Msg(); msg.payload.data = {"ticket": {"id": "T9", "description": "malware"}}
+    started = time.perf_counter()
+    result = await agent.receive_message(msg)
+    elapsed = time.perf_counter() - started
+    await audit.aclose()
+    assert result["update_result"]["status"] == "security_review" and result["failed_actions"] == {}
+    # analysis then the pipelined note+status (~0.1s); the escalation message overlaps them
+    assert elapsed < 0.145
+    with open(log_file) as f:
+        plans = [json.loads(line) for line in f if '"action_plan"' in line]
+    assert len(plans) == 1 and plans[0]["details"]["ticket_id"] == "T9"
+    assert [a["name"] for a in plans[0]["details"]["actions"]] == ["analyze", "record", "escalate"]
+
+
+@pytest.mark.asyncio
+async def test_tech_support_agent_updates_status_without_waiting_for_the_analysis(tmp_path):
+    from agents.llm import LLMConfig, LLMProvider
+    from agents.tech_support import TechnicalSupportAgent
+    from utils.audit_logging import AuditLogger
+    from utils.mcp import MCPClient
+
+    finished = {}
+
+    class SlowMCP(MCPClient):
+        async def call_tool(self, tool_name, operation, arguments, agent_id=None):
+            await asyncio.sleep(0.05)
+            finished[operation] = time.perf_counter()
+            return {"operation": operation, **arguments}
+
+    audit = AuditLogger(log_file=str(tmp_path / "audit.log"), to_stdout=False)
+    llm_config = LLMConfig(provider=LLMProvider.FAKE, model="fake",
+                           extra_params={"ttft_median": 0.15, "ttft_sigma": 0, "per_token_latency": 0})
+    agent = TechnicalSupportAgent("tech_support_agent", None, None, SlowMCP(batch=False), None, llm_config,
+                                  secret="s", audit_logger=audit)
+
+    class Msg:
+        pass
+    msg = Msg(); msg.payload = Msg(); msg.payload.data = {"ticket": {"id": "T4", "description": "laptop fan noise"}}
+    started = time.perf_counter()
+    result = await agent.receive_message(msg)
+    await audit.aclose()
+    assert result["update_result"]["status"] == "in_progress" and result["failed_actions"] == {}
+    # The status update lands while the LLM is still analyzing; only the note waits for it
+    assert finished["update_ticket_status"] - started < 0.1
+    assert finished["add_note"] - started >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_triage_agent_streams_its_analysis_through_the_response_cache(tmp_path):
+    from agents.llm import LLMConfig, LLMProvider
+    from agents.llm_cache import LRUResponseCache
+    from agents.triage import TriageAgent
+    from utils.audit_logging import AuditLogger
+    from utils.mcp import MCPClient
+
+    calls = []
+
+    class RecordingMCP(MCPClient):
+        async def call_tool(self, tool_name, operation, arguments, agent_id=None):
+            calls.append(operation)
+            return {"id": "FD-9"} if operation == "create_ticket" else {"operation": operation, **arguments}
+
+    class Bus:
+        async def send_message(self, **kwargs):
+            return "sent"
+
+    log_file = str(tmp_path / "audit.log")
+    audit = AuditLogger(log_file=log_file, to_stdout=False)
+    llm_config = LLMConfig(provider=LLMProvider.FAKE, model="fake", extra_params={
+        "ttft_median": 0.01, "ttft_sigma": 0, "per_token_latency": 0.001,
+        "responses": {"toner": "Category: Software\nThe print driver is rejecting the toner cartridge."}
+    })
+    agent = TriageAgent("triage_agent", None, Bus(), RecordingMCP(batch=False), None, llm_config,
+                        secret="s", audit_logger=audit)
+    agent.llm_client.cache = LRUResponseCache()
+
+    class Msg:
+        pass
+    def message(ticket_id):
+        msg = Msg(); msg.payload = Msg()
+        msg.payload.data = {"ticket": {"id": ticket_id, "description": "Printer refuses the new toner"}}
+        return msg
+    # Two identical tickets at once share one stream; a third is served from the response cache
+    results = await asyncio.gather(agent.receive_message(message("T3")), agent.receive_message(message("T3")))
+    results.append(await agent.receive_message(message("T3")))
+    await audit.aclose()
+    for result in results:
+        # The analysis' category line wins over the keyword fallback (which would say hardware)
+        assert result["category"] == "software" and result["assigned_to"] == "tech_support_agent"
+        assert result["analysis"].startswith("Category: Software\n")
+        assert result["assign_result"]["ticket_id"] == "FD-9" and not result["failed_actions"]
+    assert calls.count("add_note") == 3 and calls.count("assign_ticket") == 3
+    with open(log_file) as f:
+        llm_calls = [json.loads(line)["details"] for line in f if '"llm_call"' in line]
+    assert all(c["streamed"] and c["ticket_id"] == "T3" for c in llm_calls)
+    assert [c["cache"] for c in llm_calls] == ["miss", "miss", "hit"]
+    assert sum(1 for c in llm_calls if c.get("coalesced")) == 1
+    assert all(c["retries"] == 0 for c in llm_calls if not c.get("coalesced") and c["cache"] == "miss")
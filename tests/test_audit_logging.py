@@ -0,0 +1,150 @@
+import asyncio
+import gzip
+import json
+import os
+
+import pytest
+
+from utils.audit_logging import AuditLogger
+from utils.audit_policy import AuditPolicy, BlobStore
+from utils.audit_store import SegmentedAuditStore
+
+
+def read_events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.asyncio
+async def test_audit_events_are_group_committed(tmp_path):
+    log_file = str(tmp_path / "audit.log")
+    audit = AuditLogger(log_file=log_file, to_stdout=False, batch_size=50, flush_interval=0.5)
+    await asyncio.gather(*(
+        audit.log_audit_event("mcp_call", "triage_agent", "create_ticket", {"n": i}) for i in range(120)
+    ))
+    await audit.flush()
+    events = read_events(log_file)
+    assert [e["details"]["n"] for e in events] == list(range(120))
+    assert audit.stats()["batches"] <= 4
+    await audit.aclose()
+
+
+@pytest.mark.asyncio
+async def test_audit_close_drains_queue(tmp_path):
+    log_file = str(tmp_path / "audit.log")
+    audit = AuditLogger(log_file=log_file, to_stdout=False, durability="fsync", flush_interval=10)
+    for i in range(10):
+        await audit.log_audit_event("llm_call", "security_agent", "generate", {"n": i})
+    await audit.aclose()
+    assert len(read_events(log_file)) == 10
+    assert audit.stats()["events_written"] == 10
+    # Logging after close starts a fresh writer and appends to the same file
+    await audit.log_audit_event("llm_call", "security_agent", "generate", {"n": 10})
+    await audit.aclose()
+    assert len(read_events(log_file)) == 11
+
+
+@pytest.mark.asyncio
+async def test_audit_bounded_queue_backpressure(tmp_path):
+    log_file = str(tmp_path / "audit.log")
+    dropping = AuditLogger(log_file=log_file, to_stdout=False, max_queue=5, overflow="drop")
+    for i in range(20):
+        await dropping.log_audit_event("policy_decision", "triage_agent", "read", {"n": i})
+    assert dropping.stats()["events_dropped"] == 15
+    await dropping.aclose()
+    assert len(read_events(log_file)) == 5
+
+    blocking = AuditLogger(log_file=log_file, to_stdout=False, max_queue=5, batch_size=2)
+    for i in range(20):
+        await blocking.log_audit_event("policy_decision", "triage_agent", "read", {"n": i})
+    await blocking.aclose()
+    assert blocking.stats()["events_dropped"] == 0
+    assert len(read_events(log_file)) == 25
+
+
+def test_audit_rejects_unknown_durability():
+    with pytest.raises(ValueError):
+        AuditLogger(durability="sometimes")
+
+
+@pytest.mark.asyncio
+async def test_audit_store_rotates_and_queries_by_index(tmp_path):
+    store = SegmentedAuditStore(str(tmp_path), max_segment_bytes=4096, compression="gzip", block_bytes=1024)
+    audit = AuditLogger(to_stdout=False, store=store, batch_size=20)
+    for i in range(200):
+        agent = "security_agent" if i % 4 == 0 else "triage_agent"
+        await audit.log_audit_event("mcp_call", agent, "add_note", {"arguments": {"ticket_id": i % 10, "note": "x" * 40}})
+    await audit.aclose()
+
+    stats = store.stats()
+    assert stats["sealed_segments"] >= 3
+    events = list(store.query(agent_id="security_agent", ticket_id=4))
+    assert len(events) == 10
+    assert all(e["agent_id"] == "security_agent" and e["details"]["arguments"]["ticket_id"] == 4 for e in events)
+    assert len(list(store.query())) == 200
+
+    # A reader on the same directory sees everything, and sealed segments are plain gzip
+    reader = SegmentedAuditStore(str(tmp_path), read_only=True)
+    assert len(list(reader.query(event_type="mcp_call", limit=15))) == 15
+    sealed = sorted(p for p in os.listdir(tmp_path) if p.endswith(".gz"))[0]
+    with gzip.open(tmp_path / sealed) as f:
+        assert json.loads(f.readline())["event_type"] == "mcp_call"
+
+
+def test_audit_store_recovers_unsealed_segments(tmp_path):
+    first = SegmentedAuditStore(str(tmp_path), compression="gzip")
+    first.append([json.dumps({"timestamp": "2026-10-17T10:00:00", "agent_id": "a", "event_type": "llm_call",
+                              "details": {"ticket_id": "T1"}})])
+    first.rotate()
+    first.append([json.dumps({"timestamp": "2026-10-17T11:00:00", "agent_id": "b", "event_type": "llm_call",
+                              "details": {"ticket_id": "T2"}})])
+    first.close()
+
+    second = SegmentedAuditStore(str(tmp_path), compression="gzip")
+    assert [e["agent_id"] for e in second.query(since="2026-10-17T10:30:00")] == ["b"]
+    assert [e["agent_id"] for e in second.query(ticket_id="T1")] == ["a"]
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_audit_policy_samples_but_keeps_denials_and_failed_traces(tmp_path):
+    log_file = str(tmp_path / "audit.log")
+    policy = AuditPolicy(sample_rates={"policy_decision": 0.0, "mcp_call": 0.0}, slow_ticket_ms=1000)
+    audit = AuditLogger(log_file=log_file, to_stdout=False, policy=policy)
+    for ticket in ("fast", "slow", "denied"):
+        await audit.log_audit_event("mcp_call", "triage_agent", "create_ticket", {"arguments": {"ticket_id": ticket}})
+        await audit.log_audit_event("policy_decision", "triage_agent", "read",
+                                    {"context": {"ticket_id": ticket}, "policy_result": {"allow": ticket != "denied"}})
+    await audit.log_audit_event("policy_decision", "triage_agent", "read", {"policy_result": {"allow": True}})
+    await audit.end_trace("fast", duration_ms=50)
+    await audit.end_trace("slow", duration_ms=5000)
+    await audit.end_trace("denied", duration_ms=50)
+    await audit.aclose()
+
+    kept = [(e["event_type"], (e["details"].get("arguments") or e["details"].get("context") or {}).get("ticket_id"))
+            for e in read_events(log_file)]
+    assert ("policy_decision", "denied") in kept and ("mcp_call", "denied") in kept
+    assert ("policy_decision", "slow") in kept and ("mcp_call", "slow") in kept
+    assert not any(ticket == "fast" for _, ticket in kept)
+    assert len(kept) == 4
+    assert policy.stats()["tail_kept"] == 3
+
+
+@pytest.mark.asyncio
+async def test_audit_policy_caps_payloads_into_blob_store(tmp_path):
+    log_file = str(tmp_path / "audit.log")
+    blobs = BlobStore(str(tmp_path / "blobs"))
+    policy = AuditPolicy(max_payload_bytes=1024, max_field_bytes=256, blob_store=blobs)
+    audit = AuditLogger(log_file=log_file, to_stdout=False, policy=policy)
+    tickets = {"tickets": [{"id": i, "subject": "x" * 50} for i in range(100)]}
+    for agent in ("triage_agent", "escalation_manager"):
+        await audit.log_audit_event("mcp_call", agent, "list_tickets", {"arguments": {"status": "open"}, "result": tickets})
+    await audit.aclose()
+
+    events = read_events(log_file)
+    assert all(len(json.dumps(e["details"])) <= 1024 for e in events)
+    # Large values are replaced where they sit; small siblings are kept as-is
+    placeholder = events[0]["details"]["result"]["tickets"]
+    assert events[0]["details"]["arguments"] == {"status": "open"}
+    assert blobs.get(placeholder["blob"]) == tickets["tickets"]
+    assert blobs.blobs_written == 1 and blobs.duplicates == 1
@@ -0,0 +1,412 @@
+import asyncio
+import time
+
+import pytest
+
+from agents.llm import LLMClient, LLMClientRegistry, LLMConfig, LLMProvider
+from agents.llm_hedging import HedgedLLMClient
+from agents.fake_llm import Cassette, FakeLLMBackend, FakeRateLimitError, FakeServerError, set_cassette_recorder
+from agents.llm_resilience import (
+    CircuitBreaker, CircuitOpenError, LLMBadRequestError, LLMError, LLMOverloadedError, RetryPolicy
+)
+from agents.llm_scheduler import LLMScheduler
+from agents.llm_cache import LRUResponseCache, SQLiteResponseCache
+from agents.semantic_cache import SemanticCache, ticket_text
+from agents.ticket_render import TicketRenderer
+
+class FakeHttpClient:
+    def __init__(self): self.closed = False
+    async def aclose(self): self.closed = True
+
+def make_registry(**kw):
+    registry = LLMClientRegistry(**kw)
+    registry._build = lambda config: (object(), FakeHttpClient())
+    return registry
+
+def test_registry_shares_clients_across_models():
+    registry = make_registry()
+    a = LLMClient(LLMConfig(provider=LLMProvider.OPENAI, model="gpt-4", api_key="k"), registry)
+    b = LLMClient(LLMConfig(provider=LLMProvider.OPENAI, model="gpt-4o", api_key="k", temperature=0.1), registry)
+    c = LLMClient(LLMConfig(provider=LLMProvider.OPENAI, model="gpt-4", api_key="other"), registry)
+    assert a._client is b._client
+    assert a._client is not c._client
+    stats = registry.stats()
+    assert stats["misses"] == 2 and stats["open_clients"] == 2
+
+@pytest.mark.asyncio
+async def test_registry_evicts_idle_and_drains():
+    registry = make_registry()
+    config = LLMConfig(provider=LLMProvider.CLAUDE, model="m", timeout=0)
+    registry.get(config)
+    entry = next(iter(registry._entries.values()))
+    assert await registry.evict_idle(idle_timeout=0) == 1
+    assert entry["http_client"].closed
+    registry.get(config)
+    await registry.aclose()
+    assert registry.stats()["open_clients"] == 0
+
+@pytest.mark.asyncio
+async def test_generate_stream_yields_openai_deltas():
+    class Delta:
+        def __init__(self, content): self.choices = [type("C", (), {"delta": type("D", (), {"content": content})()})()]
+    async def chunks():
+        for text in ["Category: ", None, "network"]:
+            yield Delta(text)
+    class Completions:
+        async def create(self, **kwargs):
+            assert kwargs["stream"] is True
+            return chunks()
+    sdk = type("SDK", (), {"chat": type("Chat", (), {"completions": Completions()})()})()
+    registry = LLMClientRegistry()
+    registry._build = lambda config: (sdk, None)
+    client = LLMClient(LLMConfig(provider=LLMProvider.OPENAI, model="gpt-4"), registry)
+    assert [d async for d in client.generate_stream("hi")] == ["Category: ", "network"]
+
+def test_lru_cache_enforces_byte_cap_and_persists(tmp_path):
+    store = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache = LRUResponseCache(max_bytes=10, store=store)
+    cache.set("a", "12345")
+    cache.set("b", "678901")
+    assert "a" not in cache._entries and cache.current_bytes == 6
+    # Evicted from memory but still served from the persistent store
+    assert cache.get("a") == "12345"
+    store.close()
+    assert SQLiteResponseCache(str(tmp_path / "cache.sqlite3")).get("b") == "678901"
+
+def test_sqlite_cache_batches_last_use_updates(tmp_path):
+    store = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=10, touch_batch=100)
+    store.set("old", "12345")
+    store.set("new", "12345")
+    changes = store._conn.total_changes
+    assert store.get("old") == "12345"
+    # The hit wrote nothing, but still counts for eviction: "new" is now least recently used
+    assert store._conn.total_changes == changes
+    store.set("third", "1")
+    assert store.get("old") == "12345" and store.get("new") is None
+    store.close()
+
+def test_lru_cache_keeps_the_store_expiry_when_promoting(tmp_path):
+    store = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"))
+    store.set("k", "stored", ttl=0.05)
+    cache = LRUResponseCache(store=store)
+    assert cache.get("k") == "stored"
+    assert cache._entries["k"][1] is not None
+    time.sleep(0.06)
+    assert cache.get("k") is None
+    store.close()
+
+@pytest.mark.asyncio
+async def test_generate_serves_repeats_from_cache():
+    calls = []
+    registry = make_registry()
+    client = LLMClient(LLMConfig(provider=LLMProvider.OPENAI, model="gpt-4"), registry, cache=LRUResponseCache())
+    async def fake_generate(prompt, system_prompt=None, *args):
+        calls.append(prompt)
+        return "answer"
+    client._generate = fake_generate
+    first, second = {}, {}
+    assert await client.generate("p", "sys", call_info=first) == "answer"
+    assert await client.generate("p", "sys", call_info=second) == "answer"
+    assert await client.generate("p", "sys", cache_ttl=0) == "answer"
+    assert first["cache"] == "miss" and second == {"cache": "hit", "cache_bytes_saved": 6}
+    assert len(calls) == 2
+
+def test_cache_key_covers_endpoint_and_extra_params():
+    registry = make_registry()
+    def key(**config):
+        return LLMClient(LLMConfig(provider=LLMProvider.OPENAI, model="gpt-4", **config), registry).cache_key("p", "sys")
+    assert key() == key(extra_params={})
+    assert key(base_url="http://a.test") != key(base_url="http://b.test")
+    assert key(extra_params={"top_p": 0.1}) != key(extra_params={"top_p": 0.9})
+    assert key(extra_params={"top_p": 0.1, "seed": 1}) == key(extra_params={"seed": 1, "top_p": 0.1})
+
+def test_semantic_cache_matches_near_duplicates_per_agent():
+    cache = SemanticCache(threshold=0.8, max_entries_per_agent=2)
+    vpn = {"subject": "Unable to connect to company VPN", "description": "Authentication error every time I connect."}
+    cache.add("triage_agent", ticket_text(vpn), "vpn analysis")
+    reworded = {"subject": "Unable to connect to the company VPN", "description": "Authentication error each time I connect!"}
+    printer = {"subject": "Printer queue stuck", "description": "Jobs never leave the queue on floor 3."}
+    hit, miss = cache.lookup_many("triage_agent", [ticket_text(reworded), ticket_text(printer)])
+    assert hit[0] == "vpn analysis" and miss is None
+    assert cache.lookup("network_support_agent", ticket_text(reworded)) is None
+    cache.add("triage_agent", ticket_text(printer), "printer analysis")
+    cache.add("triage_agent", "something else entirely", "other")
+    assert cache.stats()["evictions"] == 1
+
+@pytest.mark.asyncio
+async def test_semantic_cache_is_scoped_to_model_and_system_prompt_and_expires(tmp_path):
+    from agents.base import BaseAgent
+    from utils.audit_logging import AuditLogger
+
+    cache = SemanticCache(threshold=0.8, ttl=0.2)
+    agent = BaseAgent("triage_agent", None, None, None, None, LLMConfig(provider=LLMProvider.FAKE, model="fake"),
+                      secret="s", semantic_cache=cache,
+                      audit_logger=AuditLogger(log_file=str(tmp_path / "audit.log"), to_stdout=False))
+    agent.system_prompt = "Triage tickets."
+    ticket = {"subject": "VPN down", "description": "Cannot connect to the VPN from home."}
+    first = await agent.run_llm_for_ticket(ticket, "Analyze: VPN down")
+    assert await agent.run_llm_for_ticket(ticket, "Analyze: VPN down (again)") == first
+    other_model = LLMConfig(provider=LLMProvider.FAKE, model="other")
+    assert await agent.run_llm_for_ticket(ticket, "Analyze: VPN down (again)", other_model) != first
+    agent.system_prompt = "Triage tickets tersely."
+    assert await agent.run_llm_for_ticket(ticket, "Analyze: VPN down (again)") != first
+    agent.system_prompt = "Triage tickets."
+    await asyncio.sleep(0.25)
+    assert await agent.run_llm_for_ticket(ticket, "Analyze: VPN down (again)") != first
+    assert cache.stats()["hits"] == 1
+    await agent.audit_logger.aclose()
+
+def test_semantic_index_grows_on_demand_up_to_capacity():
+    cache = SemanticCache(max_entries_per_agent=100)
+    cache.add("triage_agent", "first ticket", "first")
+    index = cache._indexes["triage_agent"]
+    assert index.vectors.shape[0] == 64
+    cache.add_many("triage_agent", [f"ticket {i}" for i in range(120)], [str(i) for i in range(120)])
+    assert index.vectors.shape[0] == 100 and index.size == 100
+    assert cache.stats()["evictions"] == 21
+    assert cache.lookup("triage_agent", "ticket 119")[0] == "119"
+
+@pytest.mark.asyncio
+async def test_generate_many_keeps_order_and_isolates_errors():
+    config = LLMConfig(provider=LLMProvider.FAKE, model="fake", extra_params={"latency": 0.01, "max_concurrent": 2})
+    client = LLMClient(config, LLMClientRegistry())
+    async def failing_generate(prompt, system_prompt=None, **kw):
+        if prompt == "bad":
+            raise ValueError("boom")
+        return await LLMClient.generate(client, prompt, system_prompt)
+    client.generate = failing_generate
+    results = await client.generate_many(["a", "bad", "c", "d", "e"], max_concurrency=4)
+    assert [r.index for r in results] == [0, 1, 2, 3, 4]
+    assert isinstance(results[1].error, ValueError)
+    assert [r.response.split("]: ")[1].split("\n")[0] for r in results if r.ok] == ["a", "c", "d", "e"]
+
+@pytest.mark.asyncio
+async def test_hedged_client_hedges_slow_primary_and_fails_over():
+    slow = LLMConfig(provider=LLMProvider.FAKE, model="slow", extra_params={"latency": 0.5})
+    fast = LLMConfig(provider=LLMProvider.FAKE, model="fast", extra_params={"latency": 0.01})
+    client = HedgedLLMClient([slow, fast], registry=LLMClientRegistry(), initial_hedge_delay=0.05)
+    info = {}
+    assert "[fast:" in await client.generate("hi", call_info=info)
+    assert info["provider_won"] == "fake:fast" and info["hedges"] == 1
+
+    broken = LLMConfig(provider=LLMProvider.FAKE, model="broken", extra_params={"latency": 0.01, "max_concurrent": 0})
+    client = HedgedLLMClient([broken, fast], registry=LLMClientRegistry(), initial_hedge_delay=5)
+    info = {}
+    assert "[fast:" in await client.generate("hi", call_info=info)
+    assert info["failovers"] == 1 and info["hedges"] == 0
+
+    client = HedgedLLMClient([broken, broken], registry=LLMClientRegistry(), initial_hedge_delay=5)
+    with pytest.raises(LLMError, match="All providers failed") as failed:
+        await client.generate("hi")
+    assert isinstance(failed.value.__cause__, LLMError)
+    with pytest.raises(LLMError, match="All providers failed"):
+        async for _ in client.generate_stream("hi"):
+            pass
+
+@pytest.mark.asyncio
+async def test_hedge_delay_does_not_shrink_while_the_slow_primary_keeps_losing():
+    fast = LLMConfig(provider=LLMProvider.FAKE, model="fast", extra_params={"latency": 0.01})
+    client = HedgedLLMClient([fast, fast], registry=LLMClientRegistry(), initial_hedge_delay=0.1, min_samples=4)
+    calls = 0
+    async def primary(prompt, system_prompt=None, call_info=None, priority=None):
+        nonlocal calls
+        calls += 1
+        # Every other call is slow, loses to the hedge and is cancelled
+        await asyncio.sleep(0.01 if calls % 2 else 1.0)
+        return "primary"
+    client.clients[0]._generate = primary
+    for i in range(12):
+        await client.generate(f"hi {i}")
+    assert client.hedges == 6
+    assert client.hedge_delay(0) >= 0.1
+
+@pytest.mark.asyncio
+async def test_tool_calls_fail_over_to_the_next_openai_provider(tmp_path):
+    from agents.base import BaseAgent
+    from utils.audit_logging import AuditLogger
+
+    models = []
+    class Completions:
+        async def create(self, **kwargs):
+            models.append(kwargs["model"])
+            if kwargs["model"] == "down":
+                raise RuntimeError("primary unavailable")
+            message = type("M", (), {"content": "ok", "tool_calls": None})()
+            return type("R", (), {"choices": [type("C", (), {"message": message})()]})()
+    sdk = type("SDK", (), {"chat": type("Chat", (), {"completions": Completions()})()})()
+    primary = LLMConfig(provider=LLMProvider.OPENAI, model="down")
+    local = LLMConfig(provider=LLMProvider.OLLAMA, model="llama3")
+    backup = LLMConfig(provider=LLMProvider.OPENAI, model="up")
+    registry = LLMClientRegistry()
+    registry._build = lambda config: (sdk, None)
+    agent = BaseAgent("agent", None, None, None, None, LLMConfig(provider=LLMProvider.FAKE, model="fake"), secret="s",
+                      audit_logger=AuditLogger(log_file=str(tmp_path / "audit.log"), to_stdout=False))
+    # As built from llm_fallback_configs=[local, backup], with the stand-in SDK
+    agent.llm_config = primary
+    agent.llm_client = HedgedLLMClient([primary, local, backup], registry=registry)
+    result = await agent.run_llm_with_tools("hi", available_tools=[])
+    assert result == {"response": "ok", "tool_calls": []}
+    # The non-tool-capable fallback is skipped
+    assert models == ["down", "up"]
+    await agent.audit_logger.aclose()
+
+@pytest.mark.asyncio
+async def test_scheduler_serves_by_priority_within_rate_limit():
+    scheduler = LLMScheduler(default_rpm=600, default_tpm=10**6)
+    config = LLMConfig(provider=LLMProvider.FAKE, model="fake")
+    lane = scheduler._lane(config)
+    lane.requests.level = 0  # Exhausted: one slot refills every 0.1s
+    order = []
+    async def call(name, priority):
+        await scheduler.acquire(config, tokens=10, priority=priority)
+        order.append(name)
+    await asyncio.gather(call("escalation", 8.0), call("triage", 3.0), call("security", 1.0))
+    assert order == ["security", "triage", "escalation"]
+    scheduler.update_from_headers(config, {"x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "5"})
+    stats = scheduler.stats()["fake:fake"]
+    assert stats["rpm"] == 60 and stats["granted"] == 3 and stats["queue_depth"] == 0
+
+@pytest.mark.asyncio
+async def test_claude_requests_mark_system_prompt_cacheable_and_report_usage():
+    usage = type("U", (), {"input_tokens": 20, "cache_read_input_tokens": 900, "cache_creation_input_tokens": 0})()
+    class Messages:
+        async def create(self, **kwargs):
+            self.kwargs = kwargs
+            return type("R", (), {"usage": usage, "content": [type("T", (), {"text": "ok"})()]})()
+    sdk = type("SDK", (), {"messages": Messages()})()
+    registry = LLMClientRegistry()
+    registry._build = lambda config: (sdk, None)
+    client = LLMClient(LLMConfig(provider=LLMProvider.CLAUDE, model="claude"), registry)
+    info = {}
+    assert await client.generate("ticket", "static system prompt", call_info=info) == "ok"
+    assert sdk.messages.kwargs["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert info["cached_input_tokens"] == 900 and info["uncached_input_tokens"] == 20
+
+def test_ticket_renderer_keeps_allowlisted_fields_within_budget():
+    renderer = TicketRenderer(fields=("subject", "priority", "description", "conversations"),
+                              max_tokens=120, description_tokens=40)
+    ticket = {
+        "id": 7, "subject": "VPN   down", "priority": 4, "requester_id": 123456, "custom_fields": {"cf_x": None},
+        "description": "word " * 400,
+        "conversations": [{"body_text": "first reply " * 50}, {"body_text": "latest update", "incoming": True}]
+    }
+    text, before, after = renderer.render_with_counts(ticket)
+    assert text.startswith("Subject: VPN down\nPriority: Urgent\nDescription: word")
+    assert "requester_id" not in text and "[...]" in text
+    assert text.endswith("- Requester: latest update")
+    assert after < before and renderer.stats()["tokens_saved"] == before - after
+
+@pytest.mark.asyncio
+async def test_transient_errors_retry_then_circuit_opens():
+    class Overloaded(Exception):
+        status_code = 529
+    failures = [Overloaded("overloaded")]
+    breaker = CircuitBreaker("fake", failure_threshold=2, recovery_timeout=60)
+    client = LLMClient(LLMConfig(provider=LLMProvider.FAKE, model="fake", extra_params={"latency": 0}),
+                       LLMClientRegistry(), retry_policy=RetryPolicy(max_attempts=3, base_delay=0, max_delay=0),
+                       breaker=breaker)
+    async def flaky_dispatch(prompt, system_prompt=None, call_info=None):
+        if failures:
+            raise failures.pop()
+        return "ok"
+    client._dispatch = flaky_dispatch
+    info = {}
+    assert await client.generate("p", call_info=info) == "ok"
+    assert info["retries"] == 1 and info["breaker_state"] == "closed"
+
+    failures.extend([Overloaded("down")] * 3)
+    with pytest.raises(LLMOverloadedError):
+        await client.generate("p2")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await client.generate("p3")
+
+@pytest.mark.asyncio
+async def test_rate_limits_back_off_without_opening_the_circuit():
+    breaker = CircuitBreaker("fake", failure_threshold=5, recovery_timeout=60)
+    client = LLMClient(LLMConfig(provider=LLMProvider.FAKE, model="fake", extra_params={"latency": 0}),
+                       LLMClientRegistry(), retry_policy=RetryPolicy(max_attempts=1), breaker=breaker)
+    rate_limited = 8
+    async def limited_dispatch(prompt, system_prompt=None, call_info=None):
+        nonlocal rate_limited
+        if rate_limited:
+            rate_limited -= 1
+            raise FakeRateLimitError("429 Too Many Requests (fake)")
+        return f"ok {prompt}"
+    client._dispatch = limited_dispatch
+    results = await client.generate_many([f"p{i}" for i in range(4)], max_concurrency=4)
+    assert [r.response for r in results] == [f"ok p{i}" for i in range(4)]
+    assert rate_limited == 0 and breaker.state == "closed" and breaker.times_opened == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_trial_frees_the_trial_slot():
+    breaker = CircuitBreaker("fake", failure_threshold=1, recovery_timeout=0)
+    client = LLMClient(LLMConfig(provider=LLMProvider.FAKE, model="fake", extra_params={"latency": 0}),
+                       LLMClientRegistry(), retry_policy=RetryPolicy(max_attempts=1), breaker=breaker)
+    async def slow_dispatch(prompt, system_prompt=None, call_info=None):
+        await asyncio.sleep(0 if prompt == "fast" else 10)
+        return "ok"
+    client._dispatch = slow_dispatch
+
+    # A cancelled trial (e.g. the losing request of a hedge) doesn't wedge the breaker half-open
+    breaker.record_failure(LLMOverloadedError("down"))
+    trial = asyncio.ensure_future(client.generate("slow"))
+    await asyncio.sleep(0.01)
+    assert breaker.state == "half_open" and breaker.half_open_calls == 1
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+    assert breaker.half_open_calls == 0
+    assert await client.generate("fast") == "ok" and breaker.state == "closed"
+
+    # Same for a stream the consumer stops reading before it starts
+    breaker.record_failure(LLMOverloadedError("down"))
+    async def stalled_stream(prompt, system_prompt=None, call_info=None):
+        await asyncio.sleep(10)
+        yield "never"
+    client._open_stream = stalled_stream
+    stream = client.generate_stream("slow")
+    reader = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0.01)
+    reader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await reader
+    await stream.aclose()
+    await asyncio.sleep(0.01)  # The shared provider stream is cancelled in its own task
+    assert breaker.state == "half_open" and breaker.half_open_calls == 0
+    assert await client.generate("fast") == "ok" and breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_cassette_records_real_calls_and_replays_byte_for_byte(tmp_path):
+    cassette = str(tmp_path / "session.jsonl")
+    real = LLMClient(LLMConfig(provider=LLMProvider.OPENAI, model="gpt-4"), make_registry())
+    async def provider_dispatch(prompt, system_prompt=None, call_info=None):
+        return "Category: Network\n  VPN gateway \u00e9chec \n"
+    real._dispatch = provider_dispatch
+    previous = set_cassette_recorder(Cassette(cassette))
+    try:
+        recorded = await real.generate("vpn down", "sys")
+    finally:
+        set_cassette_recorder(previous)
+
+    replay = LLMClient(LLMConfig(provider=LLMProvider.REPLAY, model="replay", extra_params={"cassette": cassette}),
+                       LLMClientRegistry())
+    assert await replay.generate("vpn down", "sys") == recorded
+    with pytest.raises(LLMBadRequestError):
+        await replay.generate("never recorded", "sys")
+
+@pytest.mark.asyncio
+async def test_fake_provider_injects_errors_deterministically():
+    params = {"ttft_median": 0.001, "server_error_rate": 0.5, "seed": 3}
+    outcomes = []
+    for _ in range(2):
+        backend = FakeLLMBackend(**params)
+        run = []
+        for i in range(20):
+            try:
+                await backend.generate(f"ticket {i}")
+                run.append("ok")
+            except FakeServerError:
+                run.append("5xx")
+        outcomes.append(run)
+    assert outcomes[0] == outcomes[1] and "5xx" in outcomes[0] and "ok" in outcomes[0]
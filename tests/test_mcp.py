@@ -0,0 +1,470 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from utils.http_transport import HTTPTransport
+from utils.mcp import IdempotencyJournal, MCPClient, MCPReadCache, MCPRetryPolicy, ResultRef, idempotency_key
+from utils.policy import OPAPolicyClient
+
+
+def mcp_handler(calls):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        calls.append(body)
+        params = body["params"]
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"result": {"operation": params["operation"], **params["arguments"]}})
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_mcp_client_reuses_pooled_transport():
+    calls = []
+    transport = HTTPTransport(transport=httpx.MockTransport(mcp_handler(calls)))
+    client = MCPClient(base_url="http://mcp.test", transport=transport)
+    results = await asyncio.gather(*(client.call_tool("freshdesk", "get_ticket", {"ticket_id": i}) for i in range(5)))
+    assert [r["ticket_id"] for r in results] == list(range(5))
+    assert transport.stats()["clients_created"] == 1
+    assert transport.stats()["requests"] == 5
+    await transport.aclose()
+
+
+def test_transport_is_closed_on_its_loop_before_moving_to_another():
+    calls = []
+    transport = HTTPTransport(transport=httpx.MockTransport(mcp_handler(calls)))
+    client = MCPClient(base_url="http://mcp.test", transport=transport)
+    first, second = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        first.run_until_complete(client.call_tool("freshdesk", "get_ticket", {"ticket_id": 1}))
+        pooled = transport._client
+        # Silently replacing the pool would leak its connections
+        with pytest.raises(RuntimeError, match="another event loop"):
+            second.run_until_complete(client.call_tool("freshdesk", "get_ticket", {"ticket_id": 2}))
+        first.run_until_complete(transport.aclose())
+        assert pooled.is_closed
+        second.run_until_complete(client.call_tool("freshdesk", "get_ticket", {"ticket_id": 3}))
+        second.run_until_complete(transport.aclose())
+    finally:
+        first.close()
+        second.close()
+    assert [call["params"]["arguments"]["ticket_id"] for call in calls] == [1, 3]
+    assert transport.stats()["clients_created"] == 2
+
+
+@pytest.mark.asyncio
+async def test_transport_caps_concurrent_requests_per_host():
+    active, peak = 0, 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return httpx.Response(200, json={})
+
+    transport = HTTPTransport(max_connections_per_host=2, transport=httpx.MockTransport(handler))
+    await asyncio.gather(*(transport.get(f"http://a.test/{i}") for i in range(6)),
+                         *(transport.get(f"http://b.test/{i}") for i in range(6)))
+    assert peak == 4  # two per host
+    warmed = await transport.warm_up(["http://a.test/mcp", "http://a.test/x", "http://b.test"])
+    assert warmed == {"http://a.test": True, "http://b.test": True}
+    await transport.aclose()
+
+
+@pytest.mark.asyncio
+async def test_opa_batch_query_falls_back_without_batch_rule():
+    requests = []
+
+    async def handler(request):
+        requests.append(request.url.path)
+        if request.url.path.endswith("/batch"):
+            return httpx.Response(404, json={"code": "undefined_document"})
+        body = json.loads(request.content)
+        return httpx.Response(200, json={"result": {"allow": body["input"]["action"] != "delete"}})
+
+    client = OPAPolicyClient(opa_url="http://opa.test/v1/data/agent/policy",
+                             transport=HTTPTransport(transport=httpx.MockTransport(handler)))
+    inputs = [{"agent_id": "a", "action": action, "resource": "r"} for action in ("read", "delete")]
+    assert [r["allow"] for r in await client.evaluate_many(inputs)] == [True, False]
+    assert [r["allow"] for r in await client.evaluate_many(inputs)] == [True, False]
+    # The batch rule is only tried once
+    assert requests.count("/v1/data/agent/policy/batch") == 1
+    assert requests.count("/v1/data/agent/policy") == 4
+
+
+def jsonrpc_handler(bodies, batches=True, reject_status=400):
+    """MCP stand-in; create_ticket returns a new id, add_note on ticket "bad" fails."""
+    def reply(params):
+        if params["operation"] == "create_ticket":
+            return {"result": {"id": "FD-1"}}
+        if params["arguments"].get("ticket_id") == "bad":
+            return {"error": "ticket not found"}
+        return {"result": {"operation": params["operation"], **params["arguments"]}}
+
+    async def handler(request):
+        body = json.loads(request.content)
+        bodies.append(body)
+        if isinstance(body, list):
+            if not batches:
+                return httpx.Response(reject_status, json={"error": "batch requests not supported"})
+            return httpx.Response(200, json=[{"jsonrpc": "2.0", "id": call["id"], **reply(call["params"])}
+                                             for call in body])
+        return httpx.Response(200, json=reply(body["params"]))
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_call_tools_batches_dependent_operations():
+    bodies = []
+    client = MCPClient(base_url="http://mcp.test",
+                       transport=HTTPTransport(transport=httpx.MockTransport(jsonrpc_handler(bodies))))
+    ticket_id = ResultRef(0, "id", default="T1")
+    results = await client.call_tools([
+        ("freshdesk", "create_ticket", {"subject": "VPN down"}),
+        ("freshdesk", "add_note", {"ticket_id": ticket_id, "note": "checked"}),
+        ("freshdesk", "assign_ticket", {"ticket_id": ticket_id, "assignee": "network_support_agent"}),
+    ])
+    assert [r.ok for r in results] == [True, True, True]
+    assert results[2].result == {"operation": "assign_ticket", "ticket_id": "FD-1", "assignee": "network_support_agent"}
+    # create_ticket alone, then both dependents in one JSON-RPC batch
+    assert len(bodies) == 2 and [call["id"] for call in bodies[1]] == [1, 2]
+    assert client.stats()["batch_requests"] == 1
+    # Batched writes carry their idempotency keys in _meta, next to untouched arguments
+    assert [call["params"]["_meta"]["idempotency_key"] for call in bodies[1]] == [
+        idempotency_key(None, "freshdesk", op, args) for op, args in (
+            ("add_note", {"ticket_id": "FD-1", "note": "checked"}),
+            ("assign_ticket", {"ticket_id": "FD-1", "assignee": "network_support_agent"})
+        )
+    ]
+    assert bodies[1][0]["params"]["arguments"] == {"ticket_id": "FD-1", "note": "checked"}
+
+
+@pytest.mark.asyncio
+async def test_call_tools_pipelines_without_batch_support_and_reports_errors():
+    bodies = []
+    client = MCPClient(base_url="http://mcp.test",
+                       transport=HTTPTransport(transport=httpx.MockTransport(jsonrpc_handler(bodies, batches=False))))
+    results = await client.call_tools([
+        ("freshdesk", "add_note", {"ticket_id": "bad", "note": "x"}),
+        ("freshdesk", "update_ticket_status", {"ticket_id": "T2", "status": "in_progress"}),
+        ("freshdesk", "add_note", {"ticket_id": ResultRef(0, "ticket_id"), "note": "y"}),
+    ])
+    assert [r.ok for r in results] == [False, True, False]
+    assert "ticket not found" in str(results[0].error)
+    assert "depends on failed operation 0" in str(results[2].error)
+    with pytest.raises(Exception):
+        results[0].unwrap()
+    # The rejected batch, then the two independent calls pipelined; the dependent one is never sent
+    assert len(bodies) == 3
+    assert client.stats()["batch_supported"] is False and client.stats()["pipelined_operations"] == 2
+
+
+@pytest.mark.asyncio
+async def test_call_tools_falls_back_when_the_proxy_rejects_list_bodies():
+    # A proxy whose schema expects one {"method": "call", ...} object answers a list body with 422
+    bodies = []
+    client = MCPClient(base_url="http://mcp.test", transport=HTTPTransport(
+        transport=httpx.MockTransport(jsonrpc_handler(bodies, batches=False, reject_status=422))))
+    writes = [
+        ("freshdesk", "add_note", {"ticket_id": "T1", "note": "checked"}),
+        ("freshdesk", "update_ticket_status", {"ticket_id": "T1", "status": "in_progress"}),
+    ]
+    assert all(r.ok for r in await client.call_tools(writes))
+    assert all(r.ok for r in await client.call_tools(writes))
+    # Only the first call tried a batch
+    assert [isinstance(body, list) for body in bodies] == [True, False, False, False, False]
+    assert client.stats()["batch_supported"] is False
+
+
+@pytest.mark.asyncio
+async def test_triage_agent_writes_one_audit_record_for_its_mcp_batch(tmp_path):
+    from agents.llm import LLMConfig, LLMProvider
+    from agents.triage import TriageAgent
+    from utils.audit_logging import AuditLogger
+
+    class Bus:
+        async def send_message(self, **kwargs):
+            return "sent"
+
+    bodies = []
+    client = MCPClient(base_url="http://mcp.test",
+                       transport=HTTPTransport(transport=httpx.MockTransport(jsonrpc_handler(bodies))))
+    log_file = str(tmp_path / "audit.log")
+    audit = AuditLogger(log_file=log_file, to_stdout=False)
+    agent = TriageAgent("triage_agent", None, Bus(), client, None, LLMConfig(provider=LLMProvider.FAKE, model="fake"),
+                        secret="s", audit_logger=audit)
+
+    class Msg:
+        pass
+    msg = Msg(); msg.payload = Msg(); msg.payload.data = {"ticket": {"id": "T7", "description": "software crash"}}
+    result = await agent.receive_message(msg)
+    await audit.aclose()
+    assert result["assign_result"]["ticket_id"] == "FD-1"
+    assert len(bodies) == 2
+    with open(log_file) as f:
+        records = [json.loads(line) for line in f if '"call_mcp_tools"' in line]
+    # create_ticket runs alongside the analysis; note and assignment share one batch
+    assert len(records) == 1
+    details = records[0]["details"]
+    assert [op["action"] for op in details["operations"]] == ["freshdesk.add_note", "freshdesk.assign_ticket"]
+    assert details["succeeded"] == 2 and details["failed"] == 0 and details["ticket_id"] == "FD-1"
+
+
+def freshdesk_handler(calls, state):
+    """Stand-in Freshdesk tool whose ticket status changes on update_ticket_status."""
+    async def handler(request):
+        params = json.loads(request.content)["params"]
+        calls.append(params["operation"])
+        arguments = params["arguments"]
+        if params["operation"] == "get_ticket":
+            result = {"id": arguments["ticket_id"], "status": state.get(arguments["ticket_id"], "open")}
+        elif params["operation"] == "list_tickets":
+            result = {"tickets": [{"id": t} for t, status in sorted(state.items()) if status == "open"]}
+        else:
+            state[arguments["ticket_id"]] = arguments.get("status", state.get(arguments["ticket_id"]))
+            result = {"ok": True}
+        return httpx.Response(200, json={"result": result})
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_read_cache_serves_reads_and_invalidates_on_writes_to_the_same_ticket():
+    calls, state = [], {"T1": "open", "T2": "open"}
+    cache = MCPReadCache()
+    client = MCPClient(base_url="http://mcp.test", cache=cache,
+                       transport=HTTPTransport(transport=httpx.MockTransport(freshdesk_handler(calls, state))))
+    for _ in range(3):
+        assert (await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T1"}))["status"] == "open"
+        await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T2"})
+        assert len((await client.call_tool("freshdesk", "list_tickets", {"status": "open"}))["tickets"]) == 2
+    assert calls == ["get_ticket", "get_ticket", "list_tickets"]
+
+    await client.call_tool("freshdesk", "update_ticket_status", {"ticket_id": "T1", "status": "closed"})
+    assert (await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T1"}))["status"] == "closed"
+    assert len((await client.call_tool("freshdesk", "list_tickets", {"status": "open"}))["tickets"]) == 1
+    await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T2"})  # other tickets stay cached
+    assert calls[3:] == ["update_ticket_status", "get_ticket", "list_tickets"]
+
+    stats = client.stats()["cache"]["operations"]
+    assert stats["get_ticket"]["hits"] == 5 and stats["get_ticket"]["misses"] == 3
+    assert stats["get_ticket"]["invalidated"] == 1 and stats["list_tickets"]["invalidated"] == 1
+    assert client.stats()["cache"]["saved_round_trips"] == 7
+
+
+@pytest.mark.asyncio
+async def test_read_cache_serves_stale_lookups_while_revalidating():
+    calls, state = [], {"T1": "open"}
+    handler = freshdesk_handler(calls, state)
+    cache = MCPReadCache(ttls={"get_ticket": 0.05}, stale_ttls={"get_ticket": 10})
+    client = MCPClient(base_url="http://mcp.test", cache=cache,
+                       transport=HTTPTransport(transport=httpx.MockTransport(handler)))
+    await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T1"})
+    state["T1"] = "pending"  # changed outside the agents, so nothing invalidates it
+    await asyncio.sleep(0.06)
+    # Expired: the stale value comes back at once and a refresh goes out in the background
+    assert (await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T1"}))["status"] == "open"
+    assert (await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T1"}))["status"] == "open"
+    await asyncio.sleep(0.01)
+    assert (await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T1"}))["status"] == "pending"
+    assert calls == ["get_ticket", "get_ticket"]
+    assert cache.stats()["operations"]["get_ticket"]["stale_hits"] == 2
+    await client.aclose()
+
+
+def flaky_handler(state):
+    """
+    MCP stand-in that fails the next requests as scripted in state["failures"]
+    ("connect", "429", "503", or "applied-502": apply the write, then fail)
+    and, like the real proxy, applies each idempotency key only once.
+    """
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        state["requests"] += 1
+        failure = state["failures"].pop(0) if state["failures"] else None
+        if failure == "connect":
+            raise httpx.ConnectError("connection refused", request=request)
+        if failure == "429":
+            return httpx.Response(429, headers={"Retry-After": "0"}, json={"error": "rate limited"})
+        if failure == "503":
+            return httpx.Response(503, json={"error": "unavailable"})
+        params = body["params"]
+        key = request.headers.get("Idempotency-Key")
+        if params["operation"] == "add_note":
+            assert set(params) == {"name", "operation", "arguments"}
+            state["keys"].add(key)
+            if key not in state["applied"]:
+                state["notes"].append(params["arguments"]["note"])
+                state["applied"][key] = {"id": len(state["notes"])}
+            result = state["applied"][key]
+        else:
+            result = {"id": params["arguments"]["ticket_id"]}
+        if failure == "applied-502":
+            return httpx.Response(502, json={"error": "bad gateway"})
+        return httpx.Response(200, json={"result": result})
+    return handler
+
+
+def flaky_client(state, journal=None, max_attempts=5):
+    return MCPClient(base_url="http://mcp.test", batch=False, journal=journal,
+                     transport=HTTPTransport(transport=httpx.MockTransport(flaky_handler(state))),
+                     retry_policy=MCPRetryPolicy(max_attempts=max_attempts, base_delay=0, max_delay=0.01))
+
+
+def flaky_state(*failures):
+    return {"failures": list(failures), "requests": 0, "keys": set(), "applied": {}, "notes": []}
+
+
+@pytest.mark.asyncio
+async def test_writes_are_retried_with_one_idempotency_key_and_applied_once():
+    state = flaky_state("connect", "503", "applied-502", "429")
+    client = flaky_client(state)
+    note = {"ticket_id": "T1", "note": "checked VPN logs"}
+    assert await client.call_tool("freshdesk", "add_note", note, agent_id="triage_agent") == {"id": 1}
+    assert state["requests"] == 5
+    assert state["notes"] == ["checked VPN logs"]
+    assert state["keys"] == {idempotency_key("triage_agent", "freshdesk", "add_note", note)}
+    assert client.stats()["retries"] == 4
+
+    # The key depends on the agent and the write, not on the attempt or argument order
+    same = idempotency_key("triage_agent", "freshdesk", "add_note", {"note": "checked VPN logs", "ticket_id": "T1"})
+    assert same in state["keys"]
+    assert idempotency_key("security_agent", "freshdesk", "add_note", note) not in state["keys"]
+
+    # Reads are retried too; errors that are not transient are not
+    state["failures"] = ["503"]
+    assert await client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T2"}) == {"id": "T2"}
+
+    async def bad_request(request):
+        return httpx.Response(400, json={"error": "bad"})
+    client._transport = HTTPTransport(transport=httpx.MockTransport(bad_request))
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.call_tool("freshdesk", "add_note", note, agent_id="triage_agent")
+    assert client.stats()["retries"] == 5
+
+
+@pytest.mark.asyncio
+async def test_journal_keeps_replayed_writes_from_being_reissued(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    state = flaky_state()
+    client = flaky_client(state, IdempotencyJournal(path))
+    note = {"ticket_id": "T1", "note": "escalated"}
+    await client.call_tool("freshdesk", "add_note", note, agent_id="triage_agent")
+
+    # Proxy down for the next write: it stays in doubt in the journal
+    state["failures"] = ["503"] * 5
+    pending = {"ticket_id": "T2", "note": "restarted router"}
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.call_tool("freshdesk", "add_note", pending, agent_id="triage_agent")
+    assert client.stats()["retries_exhausted"] == 1
+
+    # After a "crash", a new process replays both tickets
+    journal = IdempotencyJournal(path)
+    assert journal.pending() == [idempotency_key("triage_agent", "freshdesk", "add_note", pending)]
+    requests = state["requests"]
+    replay = flaky_client(state, journal, max_attempts=2)
+    results = await replay.call_tools([
+        ("freshdesk", "add_note", note),
+        ("freshdesk", "add_note", pending),
+    ], agent_id="triage_agent")
+    assert [r.unwrap() for r in results] == [{"id": 1}, {"id": 2}]
+    # Only the write that never succeeded is sent again
+    assert state["requests"] == requests + 1
+    assert state["notes"] == ["escalated", "restarted router"]
+    assert journal.pending() == []
+    assert replay.stats()["journal"] == {"completed": 2, "pending": 0, "replayed": 1}
+
+
+class ChunkedBody(httpx.AsyncByteStream):
+    def __init__(self, body: bytes, chunk_size: int, delay: float, log, page):
+        self.body, self.chunk_size, self.delay, self.log, self.page = body, chunk_size, delay, log, page
+
+    async def __aiter__(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            await asyncio.sleep(self.delay)
+            yield self.body[start:start + self.chunk_size]
+        self.log.append(("sent", self.page))
+
+
+def paged_handler(log, pages=3, per_page=4, failures=()):
+    """list_tickets stand-in: cursor paging, each page streamed in small slow chunks."""
+    failures = list(failures)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        arguments = json.loads(request.content)["params"]["arguments"]
+        page = int(arguments.get("cursor", "0"))
+        log.append(("requested", page))
+        if failures and failures[0] == page:
+            failures.pop(0)
+            return httpx.Response(503, json={"error": "unavailable"})
+        tickets = [{"id": page * per_page + i, "subject": "[x]\"tickets\": ["} for i in range(arguments["per_page"])]
+        result = {"tickets": tickets}
+        if page + 1 < pages:
+            result["next_cursor"] = str(page + 1)
+        body = json.dumps({"result": result}).encode()
+        return httpx.Response(200, stream=ChunkedBody(body, 16, 0.001, log, page))
+    return handler
+
+
+@pytest.mark.asyncio
+async def test_iter_tool_streams_pages_and_prefetches_the_next_one():
+    log = []
+    client = MCPClient(base_url="http://mcp.test", retry_policy=MCPRetryPolicy(base_delay=0, max_delay=0.01),
+                       transport=HTTPTransport(transport=httpx.MockTransport(paged_handler(log, failures=[1]))))
+    seen = []
+    async for ticket in client.iter_tool("freshdesk", "list_tickets", {"status": "open"}, page_size=4):
+        if not seen:
+            # The first ticket is available before its page has finished arriving
+            assert ("sent", 0) not in log
+        seen.append(ticket["id"])
+        if ticket["id"] == 0:
+            # Keep the consumer busy on the first page: the next page is fetched meanwhile
+            await asyncio.sleep(0.2)
+            assert ("requested", 1) in log
+    assert seen == list(range(12))
+    assert log.count(("requested", 1)) == 2  # 503 retried
+    stats = client.stats()
+    assert stats["pages"] == 3 and stats["streamed_items"] == 12 and stats["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_iter_tool_stops_paging_when_the_consumer_stops():
+    log = []
+    client = MCPClient(base_url="http://mcp.test",
+                       transport=HTTPTransport(transport=httpx.MockTransport(paged_handler(log, pages=50))))
+    tickets = client.iter_tool("freshdesk", "list_tickets", page_size=4)
+    async for ticket in tickets:
+        if ticket["id"] == 5:
+            break
+    await tickets.aclose()
+    await asyncio.sleep(0.05)
+    assert max(page for event, page in log if event == "requested") <= 2
+
+    async def error(request):
+        return httpx.Response(200, json={"error": "no such tool"})
+    client._transport = HTTPTransport(transport=httpx.MockTransport(error))
+    with pytest.raises(Exception, match="MCP error: no such tool"):
+        async for _ in client.iter_tool("freshdesk", "list_tickets"):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_journal_only_dedupes_within_its_window(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    state = flaky_state()
+    client = flaky_client(state, IdempotencyJournal(path, ttl=0.1))
+    reassign = ("freshdesk", "add_note", {"ticket_id": "T1", "note": "reassigned to senior_tech_support"})
+    await client.call_tool(*reassign, agent_id="escalation_manager")
+    await client.call_tool(*reassign, agent_id="escalation_manager")
+    assert state["requests"] == 1
+
+    # Later, the same write is a deliberate repeat, not a replay: it is sent again
+    await asyncio.sleep(0.15)
+    await client.call_tool(*reassign, agent_id="escalation_manager")
+    assert state["requests"] == 2
+    # A restart inside the window still doesn't repeat it, while expired entries aren't loaded
+    assert IdempotencyJournal(path, ttl=0.1).lookup(idempotency_key("escalation_manager", *reassign))[0]
+    await asyncio.sleep(0.15)
+    assert IdempotencyJournal(path, ttl=0.1).stats()["completed"] == 0
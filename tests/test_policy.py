@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from utils.policy import OPAPolicyClient, PolicyDecisionCache, input_key
+from utils.policy_engine import LocalPolicyEngine, compare_decisions, recorded_inputs
+
+
+class FakeOPA:
+    """Stands in for OPAPolicyClient._query: allows everything except 'delete'."""
+
+    def __init__(self, revision="r1", latency=0.01, headers=None):
+        self.revision = revision
+        self.latency = latency
+        self.headers = headers or {}
+        self.calls = 0
+
+    async def __call__(self, input_data):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        result = {"allow": input_data.get("action") != "delete"}
+        body = {"result": result, "provenance": {"bundles": {"agent": {"revision": self.revision}}}}
+        return result, body, self.headers
+
+
+def make_client(opa, **cache_kw):
+    client = OPAPolicyClient(cache=PolicyDecisionCache(**cache_kw))
+    client._query = opa
+    return client
+
+
+def test_input_key_is_canonical():
+    assert input_key({"a": 1, "b": {"c": 2, "d": 3}}) == input_key({"b": {"d": 3, "c": 2}, "a": 1})
+    assert input_key({"a": 1}) != input_key({"a": 2})
+
+
+@pytest.mark.asyncio
+async def test_policy_cache_hits_and_coalesces():
+    opa = FakeOPA()
+    client = make_client(opa)
+    request = {"agent_id": "triage_agent", "action": "create_ticket", "resource": "freshdesk"}
+    results = await asyncio.gather(*(client.evaluate(dict(request)) for _ in range(10)))
+    assert all(r["allow"] for r in results)
+    assert opa.calls == 1
+    await client.evaluate(request)
+    stats = client.stats()
+    assert stats["misses"] == 1 and stats["coalesced"] == 9 and stats["hits"] == 1
+    assert stats["saved_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_cancelling_one_caller_leaves_the_shared_query_to_the_others():
+    opa = FakeOPA(latency=0.05)
+    client = make_client(opa)
+    request = {"agent_id": "triage_agent", "action": "create_ticket", "resource": "freshdesk"}
+    leader = asyncio.ensure_future(client.evaluate(request))
+    await asyncio.sleep(0.01)
+    follower = asyncio.ensure_future(client.evaluate(dict(request)))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert (await follower)["allow"]
+    assert leader.cancelled() and opa.calls == 1
+    assert client.stats()["coalesced"] == 1
+    # The abandoned caller's query still filled the cache
+    assert (await client.evaluate(request))["allow"] and opa.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_policy_cache_ttls_hints_and_revision_invalidation():
+    opa = FakeOPA(latency=0)
+    client = make_client(opa, ttl=60, negative_ttl=0)
+    deny = {"agent_id": "triage_agent", "action": "delete", "resource": "freshdesk"}
+    allow = {"agent_id": "triage_agent", "action": "read", "resource": "freshdesk"}
+    for _ in range(3):
+        assert not (await client.evaluate(deny))["allow"]
+    assert opa.calls == 3  # negative_ttl=0: denials are never cached
+
+    await client.evaluate(allow)
+    await client.evaluate(allow)
+    assert opa.calls == 4
+    opa.revision = "r2"
+    await client.evaluate(deny)  # a miss observes the new bundle revision
+    await client.evaluate(allow)
+    assert opa.calls == 6
+    assert client.stats()["invalidations"] == 1
+
+    opa.headers = {"cache-control": "no-store"}
+    other = dict(allow, resource="jira")
+    await client.evaluate(other)
+    await client.evaluate(other)
+    assert opa.calls == 8
+
+
+@pytest.mark.asyncio
+async def test_cached_hits_notice_a_new_bundle_revision():
+    opa = FakeOPA(latency=0)
+    client = make_client(opa, ttl=60, revision_check_interval=0.05)
+    request = {"agent_id": "triage_agent", "action": "read", "resource": "freshdesk"}
+    other = dict(request, resource="jira")
+    await client.evaluate(request)
+    await client.evaluate(other)
+    for _ in range(5):
+        await client.evaluate(request)
+    assert opa.calls == 2  # Within the interval, hits stay off the wire
+
+    opa.revision = "r2"
+    await asyncio.sleep(0.06)
+    assert (await client.evaluate(request))["allow"]  # Served from cache; re-checks in the background
+    await asyncio.sleep(0.01)
+    stats = client.stats()
+    assert opa.calls == 3 and stats["revision"] == "agent@r2"
+    assert stats["invalidations"] == 1 and stats["revision_checks"] == 1
+    # Decisions from the old revision are gone long before their TTL; the re-checked one is current
+    await client.evaluate(request)
+    await client.evaluate(other)
+    assert opa.calls == 4 and client.stats()["misses"] == 3
+
+
+BUNDLE = {
+    "revision": "r1",
+    "default": {"allow": False},
+    "rules": [
+        {"agent_id": "*", "action": "delete", "resource": "*", "allow": False},
+        {"agent_id": "*", "action": "export_*", "resource": "*", "remote": True},
+        {"agent_id": ["triage_agent", "security_agent"], "action": "*", "resource": "freshdesk", "allow": True},
+        {"agent_id": "*", "action": "execute_stage", "resource": "*",
+         "context": {"workflow_id": ["ticket_triage_workflow"]}, "allow": True}
+    ]
+}
+
+
+@pytest.mark.asyncio
+async def test_local_policy_engine_decides_in_process_and_falls_back(tmp_path):
+    bundle_path = tmp_path / "policy.json"
+    bundle_path.write_text(json.dumps(BUNDLE))
+    opa = FakeOPA(latency=0)
+    client = OPAPolicyClient(local=LocalPolicyEngine(str(bundle_path), sync_interval=0.01))
+    client._query = opa
+
+    assert (await client.evaluate({"agent_id": "triage_agent", "action": "add_note", "resource": "freshdesk"}))["allow"]
+    assert not (await client.evaluate({"agent_id": "network_support_agent", "action": "add_note", "resource": "freshdesk"}))["allow"]
+    stage = {"agent_id": "tech_support_agent", "action": "execute_stage", "resource": "assign"}
+    assert (await client.evaluate(dict(stage, context={"workflow_id": "ticket_triage_workflow"})))["allow"]
+    assert not (await client.evaluate(dict(stage, context={"workflow_id": "other"})))["allow"]
+    assert opa.calls == 0
+
+    # "remote" rules go to OPA
+    assert (await client.evaluate({"agent_id": "triage_agent", "action": "export_data", "resource": "crm"}))["allow"]
+    assert opa.calls == 1
+
+    # Bundle changes are picked up by the background sync
+    bundle_path.write_text(json.dumps(dict(BUNDLE, revision="r2", default={"allow": True})))
+    os.utime(bundle_path, (0, 0))  # make the mtime change visible within the test
+    await asyncio.sleep(0.05)
+    assert client.local.revision == "r2"
+    assert (await client.evaluate({"agent_id": "network_support_agent", "action": "x", "resource": "jira"}))["allow"]
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_policy_parity_harness_on_recorded_audit_log(tmp_path):
+    audit_log = tmp_path / "audit.log"
+    events = [
+        {"event_type": "policy_decision", "agent_id": "triage_agent", "action": "add_note",
+         "details": {"resource": "freshdesk", "context": {}}},
+        {"event_type": "policy_decision", "agent_id": "triage_agent", "action": "delete",
+         "details": {"resource": "freshdesk", "context": {}}},
+        {"event_type": "policy_decision", "agent_id": "network_support_agent", "action": "read",
+         "details": {"resource": "jira", "context": {}}},
+        {"event_type": "mcp_call", "agent_id": "triage_agent", "action": "add_note", "details": {}},
+    ]
+    audit_log.write_text("\n".join("[AUDIT] " + json.dumps(e) for e in events) + "\n")
+    engine = LocalPolicyEngine(str(tmp_path / "missing.json"))
+    engine.load(BUNDLE)
+
+    opa = FakeOPA(latency=0)
+
+    async def evaluate(input_data):
+        return (await opa(input_data))[0]
+
+    report = await compare_decisions(engine, evaluate, recorded_inputs(str(audit_log)))
+    assert report["compared"] == 3
+    # The fake OPA allows network_support_agent/read; the bundle denies it by default
+    assert len(report["mismatches"]) == 1
+    assert report["mismatches"][0]["input"]["agent_id"] == "network_support_agent"
+
+
+class FakeBatchOPA(FakeOPA):
+    """Also answers batch queries, counting round trips."""
+
+    async def batch(self, inputs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        results = [{"allow": i.get("action") != "delete"} for i in inputs]
+        return results, {"result": results, "provenance": {"bundles": {"agent": {"revision": self.revision}}}}, {}
+
+
+@pytest.mark.asyncio
+async def test_evaluate_many_uses_one_query_and_the_cache():
+    opa = FakeBatchOPA()
+    client = make_client(opa)
+    client._query_many = opa.batch
+    plan = [{"agent_id": "triage_agent", "action": action, "resource": "freshdesk"}
+            for action in ("create_ticket", "add_note", "delete", "add_note")]
+    results = await client.evaluate_many(plan)
+    assert [r["allow"] for r in results] == [True, True, False, True]
+    assert opa.calls == 1
+    # Allowed and denied decisions (for negative_ttl) are both served from cache now
+    await client.evaluate_many(plan)
+    assert opa.calls == 1
+    assert client.stats()["misses"] == 3
+
+
+@pytest.mark.asyncio
+async def test_cancelling_a_batch_caller_leaves_its_query_to_the_others():
+    opa = FakeBatchOPA(latency=0.05)
+    client = make_client(opa)
+    client._query_many = opa.batch
+    plan = [{"agent_id": "triage_agent", "action": action, "resource": "freshdesk"} for action in ("read", "delete")]
+    leader = asyncio.ensure_future(client.evaluate_many(plan))
+    await asyncio.sleep(0.01)
+    single = asyncio.ensure_future(client.evaluate(dict(plan[1])))
+    batch = asyncio.ensure_future(client.evaluate_many(list(reversed(plan))))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert not (await single)["allow"]
+    assert [r["allow"] for r in await batch] == [False, True]
+    assert leader.cancelled() and opa.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_authorize_many_writes_one_aggregated_audit_record(tmp_path):
+    from agents.llm import LLMConfig, LLMProvider
+    from agents.triage import TriageAgent
+    from utils.audit_logging import AuditLogger
+
+    opa = FakeBatchOPA(latency=0)
+    client = OPAPolicyClient()
+    client._query_many = opa.batch
+    log_file = str(tmp_path / "audit.log")
+    audit = AuditLogger(log_file=log_file, to_stdout=False)
+    agent = TriageAgent("triage_agent", None, None, None, client, LLMConfig(provider=LLMProvider.FAKE, model="fake"),
+                        secret="s", audit_logger=audit)
+    allowed = await agent.authorize_many([
+        ("create_ticket", "freshdesk", {"ticket_id": "T1"}),
+        ("delete", "freshdesk", {"ticket_id": "T1"}),
+        ("send_message", "tech_support_agent", {"ticket_id": "T1"}),
+    ])
+    await audit.aclose()
+    assert allowed == [True, False, True]
+    assert opa.calls == 1
+    with open(log_file) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 1
+    details = records[0]["details"]
+    assert records[0]["action"] == "authorize_many"
+    assert details["denied"] == 1 and details["ticket_id"] == "T1"
+    assert not details["policy_result"]["allow"]
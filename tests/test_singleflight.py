@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from utils.http_transport import HTTPTransport
+from utils.mcp import MCPClient
+from utils.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    executions = 0
+
+    async def fetch(value):
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.02)
+        return value
+
+    results = await asyncio.gather(*(flight.do(("ticket", i % 2), lambda i=i: fetch(i % 2)) for i in range(10)))
+    assert results == [i % 2 for i in range(10)]
+    assert executions == 2
+    stats = flight.stats()
+    assert stats["coalesced"] == 8 and stats["coalescing_ratio"] == 0.8 and stats["in_flight"] == 0
+    # Once finished, the next call executes again
+    assert await flight.do(("ticket", 0), lambda: fetch(5)) == 5
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = False
+
+    async def slow():
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.sleep(0.05)
+            return "done"
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    first = asyncio.ensure_future(flight.do("k", slow))
+    await started.wait()
+    second = asyncio.ensure_future(flight.do("k", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done" and not cancelled
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+    # When every caller gives up, the shared call is cancelled too
+    started.clear()
+    only = asyncio.ensure_future(flight.do("k2", slow))
+    await started.wait()
+    only.cancel()
+    await asyncio.sleep(0.01)
+    assert cancelled and flight.stats()["abandoned"] == 1 and not flight.in_flight("k2")
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("proxy down")
+
+    results = await asyncio.gather(*(flight.do("k", boom) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.stats()["executions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_mcp_client_coalesces_reads_but_not_writes():
+    operations = []
+
+    async def handler(request):
+        operations.append(json.loads(request.content)["params"]["operation"])
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={"result": {"ok": True}})
+
+    client = MCPClient(base_url="http://mcp.test", single_flight=SingleFlight("mcp"),
+                       transport=HTTPTransport(transport=httpx.MockTransport(handler)))
+    await asyncio.gather(*(client.call_tool("freshdesk", "get_ticket", {"ticket_id": "T1"}) for _ in range(5)),
+                         *(client.call_tool("freshdesk", "add_note", {"ticket_id": "T1", "note": "x"}) for _ in range(2)))
+    assert operations.count("get_ticket") == 1 and operations.count("add_note") == 2
+    assert client.stats()["single_flight"]["coalesced"] == 4
+
+
+@pytest.mark.asyncio
+async def test_llm_client_coalesces_identical_generations():
+    from agents.llm import LLMClient, LLMConfig, LLMProvider
+
+    config = LLMConfig(provider=LLMProvider.FAKE, model="fake-sf", extra_params={"latency": 0.02})
+    client = LLMClient(config, single_flight=SingleFlight("llm"))
+    infos = [{} for _ in range(4)]
+    responses = await asyncio.gather(*(client.generate("Reset VPN token", "sys", call_info=info) for info in infos))
+    assert len(set(responses)) == 1
+    assert client._client.calls == 1
+    assert sum(1 for info in infos if info.get("coalesced")) == 3
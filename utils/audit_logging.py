@@ -1,13 +1,91 @@
 import os
+import sys
 import json
 import asyncio
+import logging
 from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .audit_policy import AuditPolicy
+from .audit_store import SegmentedAuditStore
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_LEVELS = ("none", "flush", "fsync")
+
 
 class AuditLogger:
-    def __init__(self, log_file: str = None, to_stdout: bool = True):
+    """
+    Append-only JSON-lines audit log with group commit.
+
+    log_audit_event only serializes the entry and puts it on a bounded
+    in-memory queue. A background task collects queued entries into batches
+    (up to batch_size, or whatever arrives within flush_interval seconds)
+    and writes each batch with a single write on a worker thread, keeping
+    file and terminal I/O off the event loop. Durability per batch:
+    "none" (left in the file buffer), "flush" (handed to the OS) or
+    "fsync" (on disk before the batch counts as written).
+
+    With a store (or AUDIT_LOG_DIR set), batches go to a rotating,
+    compressed and indexed SegmentedAuditStore instead of a single
+    log_file.
+
+    An AuditPolicy can sample events per type, keep full traces only for
+    slow or failed tickets (see end_trace) and cap large payloads.
+
+    When the queue is full, callers wait (overflow="block") or the event
+    is counted and discarded (overflow="drop"). Call flush() to wait for
+    everything logged so far, and aclose() on shutdown to drain the queue
+    and close the file.
+    """
+
+    def __init__(
+        self,
+        log_file: str = None,
+        to_stdout: bool = True,
+        durability: str = None,
+        batch_size: int = 512,
+        flush_interval: float = 0.05,
+        max_queue: int = 10000,
+        overflow: str = "block",
+        store: Optional[SegmentedAuditStore] = None,
+        policy: Optional[AuditPolicy] = None
+    ):
+        if store is None and os.getenv("AUDIT_LOG_DIR"):
+            store = SegmentedAuditStore()
+        self.store = store
+        self.policy = policy
+        # Out-of-line payloads waiting to be written ahead of the batch that references them
+        self._blobs: List[Any] = []
         self.log_file = log_file or os.getenv("AUDIT_LOG_FILE", "audit.log")
         self.to_stdout = to_stdout
-        self._lock = asyncio.Lock()
+        self.durability = durability or os.getenv("AUDIT_DURABILITY", "flush")
+        if self.durability not in DURABILITY_LEVELS:
+            raise ValueError(f"durability must be one of {DURABILITY_LEVELS}, got {self.durability!r}")
+        if overflow not in ("block", "drop"):
+            raise ValueError(f"overflow must be 'block' or 'drop', got {overflow!r}")
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self._file = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.events_logged = 0
+        self.events_written = 0
+        self.events_dropped = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    def _ensure_writer(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._writer is None or self._writer.done():
+            # First use, or the previous event loop has gone away
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._writer = loop.create_task(self._run(self._queue))
+        return self._queue
 
     async def log_audit_event(self, event_type: str, agent_id: str, action: str, details: dict):
         entry = {
@@ -17,10 +95,131 @@ class AuditLogger:
             "action": action,
             "details": details
         }
+        if self.policy is None:
+            await self._enqueue(entry)
+            return
+        for admitted in self.policy.admit(entry):
+            await self._enqueue(admitted)
+
+    async def end_trace(self, ticket_id: Any, duration_ms: Optional[float] = None, failed: bool = False):
+        """
+        Mark a ticket as done. With tail-based retention, its sampled-out
+        events are written now if it failed or took at least the policy's
+        slow_ticket_ms, and discarded otherwise.
+        """
+        if self.policy is None:
+            return
+        for entry in self.policy.end_trace(ticket_id, duration_ms, failed):
+            await self._enqueue(entry)
+
+    async def _enqueue(self, entry: Dict[str, Any]):
+        if self.policy is not None:
+            entry, blobs = self.policy.cap(entry)
+            self._blobs.extend(blobs)
+        # Serialize now so later mutation of details by the caller can't leak into the log
         line = json.dumps(entry)
-        async with self._lock:
-            if self.log_file:
-                with open(self.log_file, "a") as f:
-                    f.write(line + "\n")
-            if self.to_stdout:
-                print("[AUDIT]", line) 
\ No newline at end of file
+        queue = self._ensure_writer()
+        if self.overflow == "drop":
+            try:
+                queue.put_nowait(line)
+            except asyncio.QueueFull:
+                self.events_dropped += 1
+                return
+        else:
+            await queue.put(line)
+        self.events_logged += 1
+
+    async def _run(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            batch: List[str] = []
+            markers: List[asyncio.Future] = []
+            deadline = loop.time() + self.flush_interval
+            while True:
+                if isinstance(item, asyncio.Future):
+                    # flush() marker: commit what we have now
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+            if batch:
+                blobs, self._blobs = self._blobs, []
+                try:
+                    await asyncio.to_thread(self._write_batch, batch, blobs)
+                    self.events_written += len(batch)
+                    self.batches += 1
+                except Exception as e:
+                    self.write_errors += 1
+                    logger.error(f"Failed to write {len(batch)} audit events: {e}")
+            for marker in markers:
+                if not marker.done():
+                    marker.set_result(None)
+
+    def _write_batch(self, batch: List[str], blobs: List[Any] = ()):
+        for digest, data in blobs:
+            self.policy.blob_store.put(digest, data)
+        if self.store is not None:
+            self.store.append(batch)
+            if self.durability != "none":
+                self.store.flush(fsync=self.durability == "fsync")
+        elif self.log_file:
+            data = "\n".join(batch) + "\n"
+            if self._file is None:
+                self._file = open(self.log_file, "a", encoding="utf-8")
+            self._file.write(data)
+            if self.durability != "none":
+                self._file.flush()
+            if self.durability == "fsync":
+                os.fsync(self._file.fileno())
+        if self.to_stdout:
+            sys.stdout.write("".join(f"[AUDIT] {line}\n" for line in batch))
+            sys.stdout.flush()
+
+    async def flush(self):
+        """Wait until every event logged so far has been written."""
+        if self._writer is None or self._writer.done() or self._loop is not asyncio.get_running_loop():
+            return
+        marker = self._loop.create_future()
+        await self._queue.put(marker)
+        await marker
+
+    async def aclose(self):
+        """Drain queued events, stop the writer and close the file."""
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+        if self.store is not None:
+            await asyncio.to_thread(self.store.close)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "events_logged": self.events_logged,
+            "events_written": self.events_written,
+            "events_dropped": self.events_dropped,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "avg_batch_size": round(self.events_written / self.batches, 1) if self.batches else 0.0,
+            "write_errors": self.write_errors,
+            "durability": self.durability,
+            **({"policy": self.policy.stats()} if self.policy is not None else {})
+        }
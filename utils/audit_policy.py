@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import random
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .audit_store import event_ticket_id
+
+# Kept in place of an oversized value so readers can see what was there
+PREVIEW_CHARS = 200
+
+
+class BlobStore:
+    """
+    Content-addressed store for oversized audit payloads.
+
+    Blobs live at <directory>/<sha256[:2]>/<sha256>, so identical payloads
+    (the same list_tickets response logged by several agents) are stored once.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.getenv("AUDIT_BLOB_DIR", "audit_blobs")
+        self._known: set = set()
+        self.blobs_written = 0
+        self.bytes_written = 0
+        self.duplicates = 0
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, digest: str, data: bytes):
+        """Write a blob unless it is already stored; blocking, called from the audit writer thread."""
+        if digest in self._known:
+            self.duplicates += 1
+            return
+        path = self.path(digest)
+        if os.path.exists(path):
+            self.duplicates += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            self.blobs_written += 1
+            self.bytes_written += len(data)
+        self._known.add(digest)
+
+    def get(self, digest: str) -> Any:
+        """Load a stored payload back as the JSON value it replaced."""
+        with open(self.path(digest), "rb") as f:
+            return json.loads(f.read())
+
+
+def is_error_or_denial(entry: Dict[str, Any]) -> bool:
+    """Events that are never sampled out: errors, and policy decisions that did not allow."""
+    details = entry.get("details")
+    details = details if isinstance(details, dict) else {}
+    if "error" in (entry.get("event_type") or "") or details.get("error"):
+        return True
+    if entry.get("event_type") == "policy_decision":
+        result = details.get("policy_result")
+        return not (isinstance(result, dict) and result.get("allow"))
+    return False
+
+
+class AuditPolicy:
+    """
+    What AuditLogger keeps, and how much of each event.
+
+    Sampling: each event type is kept with probability sample_rates[type]
+    (default_sample_rate otherwise). Events for the same ticket and type
+    get the same decision, so sampled tickets keep coherent traces. Errors
+    and denials are always kept.
+
+    Tail-based retention: when slow_ticket_ms is set, sampled-out events
+    that belong to a ticket are buffered instead of dropped. If the ticket
+    later records an error or denial, or end_trace() reports it failed or
+    slower than slow_ticket_ms, the buffered events are written after all.
+
+    Payload caps: when an event's details exceed max_payload_bytes, every
+    value larger than max_field_bytes is replaced by a preview plus its
+    sha256; with a blob store, the full value is kept there out of line.
+    """
+
+    def __init__(
+        self,
+        sample_rates: Optional[Dict[str, float]] = None,
+        default_sample_rate: float = 1.0,
+        max_payload_bytes: Optional[int] = 16384,
+        max_field_bytes: int = 2048,
+        blob_store: Optional[BlobStore] = None,
+        slow_ticket_ms: Optional[float] = None,
+        max_traces: int = 1000,
+        max_trace_events: int = 200,
+        seed: Optional[int] = None
+    ):
+        self.sample_rates = dict(sample_rates or {})
+        self.default_sample_rate = default_sample_rate
+        self.max_payload_bytes = max_payload_bytes
+        self.max_field_bytes = max_field_bytes
+        self.blob_store = blob_store
+        self.slow_ticket_ms = slow_ticket_ms
+        self.max_traces = max_traces
+        self.max_trace_events = max_trace_events
+        self.rng = random.Random(seed)
+        # ticket id -> buffered (sampled-out) entries; None once the ticket is known to be kept
+        self._traces: "OrderedDict[str, Optional[List[Dict[str, Any]]]]" = OrderedDict()
+        self.kept = 0
+        self.sampled_out = 0
+        self.tail_kept = 0
+        self.capped = 0
+        self.bytes_capped = 0
+
+    @classmethod
+    def from_env(cls) -> "AuditPolicy":
+        """
+        Build a policy from AUDIT_SAMPLE_RATES ("policy_decision=0.1,mcp_call=0.5"),
+        AUDIT_MAX_PAYLOAD_BYTES, AUDIT_BLOB_DIR and AUDIT_SLOW_TICKET_MS.
+        """
+        rates = {}
+        for pair in filter(None, os.getenv("AUDIT_SAMPLE_RATES", "").split(",")):
+            event_type, _, rate = pair.partition("=")
+            rates[event_type.strip()] = float(rate)
+        max_payload = os.getenv("AUDIT_MAX_PAYLOAD_BYTES")
+        slow = os.getenv("AUDIT_SLOW_TICKET_MS")
+        return cls(
+            sample_rates=rates,
+            max_payload_bytes=int(max_payload) if max_payload else 16384,
+            blob_store=BlobStore() if os.getenv("AUDIT_BLOB_DIR") else None,
+            slow_ticket_ms=float(slow) if slow else None
+        )
+
+    # -- sampling -------------------------------------------------------------
+
+    def _sampled_in(self, event_type: str, ticket_id: Optional[str]) -> bool:
+        rate = self.sample_rates.get(event_type, self.default_sample_rate)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        if ticket_id is None:
+            return self.rng.random() < rate
+        return zlib.crc32(f"{event_type}:{ticket_id}".encode("utf-8")) / 0xFFFFFFFF < rate
+
+    def admit(self, entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Entries to write now for a newly logged event (possibly none, possibly buffered ones too)."""
+        ticket_id = event_ticket_id(entry)
+        if is_error_or_denial(entry):
+            self.kept += 1
+            return self._release(ticket_id) + [entry]
+        if ticket_id is not None and ticket_id in self._traces and self._traces[ticket_id] is None:
+            # Ticket already marked as worth keeping in full
+            self._traces.move_to_end(ticket_id)
+            self.kept += 1
+            return [entry]
+        if self._sampled_in(entry.get("event_type"), ticket_id):
+            self.kept += 1
+            return [entry]
+        if self.slow_ticket_ms is not None and ticket_id is not None:
+            buffered = self._traces.setdefault(ticket_id, [])
+            self._traces.move_to_end(ticket_id)
+            if len(buffered) < self.max_trace_events:
+                buffered.append(entry)
+            else:
+                self.sampled_out += 1
+            while len(self._traces) > self.max_traces:
+                _, evicted = self._traces.popitem(last=False)
+                self.sampled_out += len(evicted or ())
+            return []
+        self.sampled_out += 1
+        return []
+
+    def _release(self, ticket_id: Optional[str]) -> List[Dict[str, Any]]:
+        if ticket_id is None or self.slow_ticket_ms is None:
+            return []
+        buffered = self._traces.get(ticket_id) or []
+        self._traces[ticket_id] = None
+        self._traces.move_to_end(ticket_id)
+        while len(self._traces) > self.max_traces:
+            _, evicted = self._traces.popitem(last=False)
+            self.sampled_out += len(evicted or ())
+        self.tail_kept += len(buffered)
+        return buffered
+
+    def end_trace(self, ticket_id: Any, duration_ms: Optional[float] = None, failed: bool = False) -> List[Dict[str, Any]]:
+        """Close a ticket's trace; returns its buffered entries if it turned out slow or failed."""
+        ticket_id = str(ticket_id)
+        slow = duration_ms is not None and self.slow_ticket_ms is not None and duration_ms >= self.slow_ticket_ms
+        if failed or slow:
+            released = self._release(ticket_id)
+        else:
+            released = []
+            self.sampled_out += len(self._traces.get(ticket_id) or ())
+        self._traces.pop(ticket_id, None)
+        return released
+
+    # -- payload caps ------------------------------------------------------------
+
+    def cap(self, entry: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Tuple[str, bytes]]]:
+        """Return the entry with oversized detail values replaced, plus blobs to store for them."""
+        details = entry.get("details")
+        if self.max_payload_bytes is None or not isinstance(details, dict):
+            return entry, []
+        encoded = json.dumps(details).encode("utf-8")
+        if len(encoded) <= self.max_payload_bytes:
+            return entry, []
+        blobs: List[Tuple[str, bytes]] = []
+        capped = self._cap_value(details, blobs)
+        if len(json.dumps(capped).encode("utf-8")) > self.max_payload_bytes:
+            # Many small fields: fall back to capping details as a whole
+            capped = self._placeholder(encoded, details, blobs)
+        self.capped += 1
+        self.bytes_capped += len(encoded)
+        return dict(entry, details=capped), blobs
+
+    def _cap_value(self, value: Any, blobs: List[Tuple[str, bytes]]) -> Any:
+        encoded = json.dumps(value).encode("utf-8")
+        if len(encoded) <= self.max_field_bytes:
+            return value
+        if isinstance(value, dict):
+            return {k: self._cap_value(v, blobs) for k, v in value.items()}
+        return self._placeholder(encoded, value, blobs)
+
+    def _placeholder(self, encoded: bytes, value: Any, blobs: List[Tuple[str, bytes]]) -> Dict[str, Any]:
+        digest = hashlib.sha256(encoded).hexdigest()
+        preview = value if isinstance(value, str) else encoded.decode("utf-8")
+        placeholder = {"sha256": digest, "bytes": len(encoded), "preview": preview[:PREVIEW_CHARS]}
+        if self.blob_store is not None:
+            placeholder["blob"] = digest
+            blobs.append((digest, encoded))
+        else:
+            placeholder["truncated"] = True
+        return placeholder
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "kept": self.kept,
+            "sampled_out": self.sampled_out,
+            "tail_kept": self.tail_kept,
+            "buffered_traces": sum(1 for trace in self._traces.values() if trace),
+            "capped": self.capped,
+            "bytes_capped": self.bytes_capped
+        }
+        if self.blob_store is not None:
+            stats.update(
+                blobs_written=self.blob_store.blobs_written,
+                blob_bytes=self.blob_store.bytes_written,
+                blob_duplicates=self.blob_store.duplicates
+            )
+        return stats
@@ -0,0 +1,403 @@
+"""
+Segmented audit log storage.
+
+Events are appended to a plain JSON-lines active segment. When it reaches
+max_segment_bytes or max_segment_age it is sealed: rewritten as
+independently compressed blocks (zstd frames or gzip members, so the file
+still decompresses with zstd -d / zcat) plus a sidecar index recording each
+block's offset, time range and the agent_id, event_type and ticket id values
+it contains. Queries consult the indexes and decompress only the matching
+blocks of the matching segments, read through mmap.
+
+    python -m utils.audit_store audit/ --agent security_agent --ticket 42 --since 2026-10-17
+"""
+import argparse
+import gzip
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_RE = re.compile(r"^audit-(\d{8})\.jsonl(\.gz|\.zst)?$")
+INDEXED_FIELDS = ("agent_id", "event_type", "ticket_id")
+
+TimeBound = Optional[Union[str, datetime]]
+
+
+def event_ticket_id(entry: Dict[str, Any]) -> Optional[str]:
+    """Ticket id an audit event refers to, from its details, MCP arguments or policy context."""
+    details = entry.get("details")
+    if not isinstance(details, dict):
+        return None
+    for source in (details, details.get("arguments"), details.get("context")):
+        if isinstance(source, dict) and source.get("ticket_id") is not None:
+            return str(source["ticket_id"])
+    ticket = details.get("ticket")
+    if isinstance(ticket, dict) and ticket.get("id") is not None:
+        return str(ticket["id"])
+    arguments = details.get("arguments")
+    if isinstance(arguments, dict) and arguments.get("id") is not None:
+        # create_ticket passes the ticket itself as arguments
+        return str(arguments["id"])
+    return None
+
+
+def _codec(name: str):
+    """(file suffix, block compressor) for a codec name."""
+    if name == "zstd":
+        if zstandard is None:
+            raise ImportError("zstandard library not installed. Run: pip install zstandard")
+        return ".zst", zstandard.ZstdCompressor(level=10).compress
+    if name == "gzip":
+        return ".gz", lambda data: gzip.compress(data, compresslevel=6)
+    raise ValueError(f"Unknown audit compression {name!r}")
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("zstandard library not installed. Run: pip install zstandard")
+        # decompressobj copes with frames written without a content size
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def _bound(value: TimeBound) -> Optional[str]:
+    # Audit timestamps are ISO-8601 strings, which compare correctly as text
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class SegmentedAuditStore:
+    """
+    Rotating, compressed, indexed audit storage in one directory.
+
+    append() and flush() are called from AuditLogger's writer thread;
+    query() may run concurrently from any thread or another process (it
+    only sees events that have been flushed); open readers elsewhere with
+    read_only=True so they never seal or append.
+    """
+
+    def __init__(
+        self,
+        directory: str = None,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        max_segment_age: float = 3600.0,
+        compression: Optional[str] = None,
+        block_bytes: int = 64 * 1024,
+        retention_segments: Optional[int] = None,
+        read_only: bool = False
+    ):
+        self.directory = directory or os.getenv("AUDIT_LOG_DIR", "audit")
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.compression = compression or ("zstd" if zstandard is not None else "gzip")
+        _codec(self.compression)
+        self.block_bytes = block_bytes
+        self.retention_segments = retention_segments
+        self._lock = threading.RLock()
+        self._indexes: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._active = None
+        self._active_path: Optional[str] = None
+        self._active_size = 0
+        self._active_opened = 0.0
+        self.segments_sealed = 0
+        if not read_only:
+            os.makedirs(self.directory, exist_ok=True)
+            self._recover()
+
+    # -- layout ------------------------------------------------------------
+
+    def _segments(self) -> List[Tuple[int, str, Optional[str]]]:
+        """(sequence, file name, compression suffix) for every segment, oldest first."""
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_RE.match(name)
+            if match:
+                found.append((int(match.group(1)), name, match.group(2)))
+        return sorted(found)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _index_name(seq: int) -> str:
+        return f"audit-{seq:08d}.idx.json"
+
+    def _recover(self):
+        """Seal plain segments left by an earlier process, except the newest, which stays active."""
+        plain = [(seq, name) for seq, name, suffix in self._segments() if suffix is None]
+        for seq, name in plain[:-1]:
+            self._seal(seq, self._path(name))
+        if plain:
+            self._open_active(plain[-1][0])
+
+    def _open_active(self, seq: int):
+        self._active_path = self._path(f"audit-{seq:08d}.jsonl")
+        self._active = open(self._active_path, "ab")
+        self._active_size = self._active.tell()
+        self._active_opened = time.monotonic()
+
+    # -- writing -------------------------------------------------------------
+
+    def append(self, lines: List[str]):
+        """Append serialized events (one JSON object per string), rotating first if due."""
+        data = "".join(line + "\n" for line in lines).encode("utf-8")
+        with self._lock:
+            if self._active is not None and self._active_size and (
+                self._active_size + len(data) > self.max_segment_bytes
+                or time.monotonic() - self._active_opened >= self.max_segment_age
+            ):
+                self.rotate()
+            if self._active is None:
+                segments = self._segments()
+                self._open_active(segments[-1][0] + 1 if segments else 1)
+            self._active.write(data)
+            self._active_size += len(data)
+
+    def flush(self, fsync: bool = False):
+        with self._lock:
+            if self._active is not None:
+                self._active.flush()
+                if fsync:
+                    os.fsync(self._active.fileno())
+
+    def rotate(self):
+        """Seal the active segment; the next append starts a new one."""
+        with self._lock:
+            if self._active is None:
+                return
+            self._active.close()
+            path, self._active, self._active_path = self._active_path, None, None
+            seq = int(SEGMENT_RE.match(os.path.basename(path)).group(1))
+            if self._active_size:
+                self._seal(seq, path)
+            else:
+                os.remove(path)
+            self._apply_retention()
+
+    def _seal(self, seq: int, path: str):
+        suffix, compress = _codec(self.compression)
+        blocks: List[List[Any]] = []
+        postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in INDEXED_FIELDS}
+        events, offset = 0, 0
+        sealed_path = path + suffix
+        with open(path, "rb") as src, open(sealed_path + ".tmp", "wb") as out:
+            pending: List[bytes] = []
+            pending_size = 0
+            meta = {"min_ts": None, "max_ts": None, "events": 0}
+
+            def emit():
+                nonlocal offset, pending, pending_size, meta
+                chunk = compress(b"".join(pending))
+                out.write(chunk)
+                blocks.append([offset, len(chunk), meta["min_ts"], meta["max_ts"], meta["events"]])
+                offset += len(chunk)
+                pending, pending_size = [], 0
+                meta = {"min_ts": None, "max_ts": None, "events": 0}
+
+            for raw in src:
+                if not raw.strip():
+                    continue
+                if not raw.endswith(b"\n"):
+                    # Torn final write from a crash
+                    raw += b"\n"
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    continue
+                block_id = len(blocks)
+                ts = entry.get("timestamp")
+                if ts:
+                    meta["min_ts"] = ts if meta["min_ts"] is None else min(meta["min_ts"], ts)
+                    meta["max_ts"] = ts if meta["max_ts"] is None else max(meta["max_ts"], ts)
+                values = {"agent_id": entry.get("agent_id"), "event_type": entry.get("event_type"),
+                          "ticket_id": event_ticket_id(entry)}
+                for field, value in values.items():
+                    if value is not None:
+                        ids = postings[field].setdefault(str(value), [])
+                        if not ids or ids[-1] != block_id:
+                            ids.append(block_id)
+                pending.append(raw)
+                pending_size += len(raw)
+                meta["events"] += 1
+                events += 1
+                if pending_size >= self.block_bytes:
+                    emit()
+            if pending:
+                emit()
+            out.flush()
+            os.fsync(out.fileno())
+
+        index = {
+            "segment": os.path.basename(sealed_path),
+            "codec": self.compression,
+            "events": events,
+            "min_ts": min((b[2] for b in blocks if b[2]), default=None),
+            "max_ts": max((b[3] for b in blocks if b[3]), default=None),
+            "blocks": blocks,
+            **postings
+        }
+        index_path = self._path(self._index_name(seq))
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(sealed_path + ".tmp", sealed_path)
+        os.replace(index_path + ".tmp", index_path)
+        os.remove(path)
+        self.segments_sealed += 1
+
+    def _apply_retention(self):
+        if not self.retention_segments:
+            return
+        sealed = [(seq, name) for seq, name, suffix in self._segments() if suffix is not None]
+        for seq, name in sealed[:-self.retention_segments]:
+            for path in (self._path(name), self._path(self._index_name(seq))):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._indexes.pop(self._path(self._index_name(seq)), None)
+
+    def close(self):
+        """Close the active segment; it is resumed (or sealed) by the next store on this directory."""
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+    # -- reading -------------------------------------------------------------
+
+    def _index(self, seq: int) -> Optional[Dict[str, Any]]:
+        path = self._path(self._index_name(seq))
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = self._indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, encoding="utf-8") as f:
+                cached = (mtime, json.load(f))
+            self._indexes[path] = cached
+        return cached[1]
+
+    @staticmethod
+    def _matches(entry: Dict[str, Any], since, until, filters: Dict[str, str]) -> bool:
+        ts = entry.get("timestamp") or ""
+        if since and ts < since or until and ts > until:
+            return False
+        for field, value in filters.items():
+            actual = event_ticket_id(entry) if field == "ticket_id" else entry.get(field)
+            if actual is None or str(actual) != value:
+                return False
+        return True
+
+    def _candidate_blocks(self, index: Dict[str, Any], since, until, filters: Dict[str, str]) -> List[int]:
+        if since and index["max_ts"] and index["max_ts"] < since or until and index["min_ts"] and index["min_ts"] > until:
+            return []
+        candidates = None
+        for field, value in filters.items():
+            ids = set(index.get(field, {}).get(value, ()))
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+        blocks = index["blocks"]
+        return [
+            i for i in (sorted(candidates) if candidates is not None else range(len(blocks)))
+            if not (since and blocks[i][3] and blocks[i][3] < since or until and blocks[i][2] and blocks[i][2] > until)
+        ]
+
+    def query(
+        self,
+        since: TimeBound = None,
+        until: TimeBound = None,
+        agent_id: Optional[str] = None,
+        event_type: Optional[str] = None,
+        ticket_id: Optional[Any] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield matching events, oldest first. Sealed segments are narrowed through their indexes."""
+        since, until = _bound(since), _bound(until)
+        filters = {field: str(value) for field, value in
+                   (("agent_id", agent_id), ("event_type", event_type), ("ticket_id", ticket_id)) if value is not None}
+        self.flush()
+        returned = 0
+        for seq, name, suffix in self._segments():
+            if suffix is None:
+                entries = self._scan_plain(self._path(name))
+            else:
+                index = self._index(seq)
+                if index is None:
+                    continue
+                entries = self._read_blocks(self._path(name), index, self._candidate_blocks(index, since, until, filters))
+            for entry in entries:
+                if self._matches(entry, since, until, filters):
+                    yield entry
+                    returned += 1
+                    if limit is not None and returned >= limit:
+                        return
+
+    def _read_blocks(self, path: str, index: Dict[str, Any], block_ids: List[int]) -> Iterator[Dict[str, Any]]:
+        if not block_ids:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            for i in block_ids:
+                offset, length = index["blocks"][i][:2]
+                for line in _decompress(index["codec"], view[offset:offset + length]).splitlines():
+                    yield json.loads(line)
+
+    @staticmethod
+    def _scan_plain(path: str) -> Iterator[Dict[str, Any]]:
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            for line in iter(view.readline, b""):
+                if line.endswith(b"\n"):
+                    yield json.loads(line)
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self._segments()
+        sealed = [self._index(seq) for seq, _, suffix in segments if suffix is not None]
+        return {
+            "segments": len(segments),
+            "sealed_segments": len(sealed),
+            "sealed_events": sum(index["events"] for index in sealed if index),
+            "active_bytes": self._active_size if self._active is not None else 0,
+            "bytes_on_disk": sum(os.path.getsize(self._path(name)) for _, name, _ in segments),
+            "compression": self.compression
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Query a segmented audit log directory")
+    parser.add_argument("directory", nargs="?", default=os.getenv("AUDIT_LOG_DIR", "audit"))
+    parser.add_argument("--since", help="ISO timestamp (UTC), inclusive")
+    parser.add_argument("--until", help="ISO timestamp (UTC), inclusive")
+    parser.add_argument("--agent", dest="agent_id")
+    parser.add_argument("--type", dest="event_type")
+    parser.add_argument("--ticket", dest="ticket_id")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--stats", action="store_true", help="print storage stats instead of events")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    store = SegmentedAuditStore(args.directory, read_only=True)
+    try:
+        if args.stats:
+            print(json.dumps(store.stats(), indent=2))
+            return
+        for entry in store.query(args.since, args.until, args.agent_id, args.event_type, args.ticket_id, args.limit):
+            sys.stdout.write(json.dumps(entry) + "\n")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(str(url))
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class HTTPTransport:
+    """
+    Long-lived pooled HTTP client shared by MCPClient, OPAPolicyClient and
+    the policy bundle sync.
+
+    Connections are kept alive and reused across calls instead of paying
+    a new pool, DNS lookup and TCP/TLS handshake per request. Timeouts are
+    split into connect/read/write/pool, max_connections_per_host caps
+    concurrent requests to any one origin, and http2=True negotiates
+    HTTP/2 (needs the h2 package). Call warm_up() at startup and aclose()
+    on shutdown.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_connections_per_host: Optional[int] = None,
+        http2: Optional[bool] = None,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        write_timeout: float = 30.0,
+        pool_timeout: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout)
+        self.max_connections_per_host = max_connections_per_host
+        self.http2 = http2 if http2 is not None else os.getenv("HTTP2_ENABLED", "").lower() in ("1", "true", "yes")
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                raise ImportError("h2 library not installed. Run: pip install httpx[http2]")
+        # Injected transport (e.g. httpx.MockTransport in tests)
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.clients_created = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The pooled client, created on first use. httpx pools are bound to
+        one event loop, so a transport used on another loop has to be
+        aclose()d on its old loop first.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is not None and not self._client.is_closed and self._loop is not loop:
+            # Replacing it here would leak its pooled connections: they can only be closed on their own loop
+            raise RuntimeError("HTTPTransport is in use on another event loop; aclose() it there before reusing it")
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self.limits, timeout=self.timeout, http2=self.http2, transport=self.transport
+            )
+            self._loop = loop
+            self._host_slots = {}
+            self.clients_created += 1
+        return self._client
+
+    def _slot(self, url: str) -> Optional[asyncio.Semaphore]:
+        if not self.max_connections_per_host:
+            return None
+        origin = _origin(url)
+        slot = self._host_slots.get(origin)
+        if slot is None:
+            slot = asyncio.Semaphore(self.max_connections_per_host)
+            self._host_slots[origin] = slot
+        return slot
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        client = self.client
+        slot = self._slot(url)
+        started = time.perf_counter()
+        try:
+            if slot is None:
+                return await client.request(method, url, **kwargs)
+            async with slot:
+                return await client.request(method, url, **kwargs)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.requests += 1
+            self.total_time += time.perf_counter() - started
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Like request(), but the body is read by the caller (aiter_bytes/aiter_text) inside the block."""
+        client = self.client
+        slot = self._slot(url)
+        started = time.perf_counter()
+        try:
+            if slot is None:
+                async with client.stream(method, url, **kwargs) as response:
+                    yield response
+            else:
+                async with slot:
+                    async with client.stream(method, url, **kwargs) as response:
+                        yield response
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.requests += 1
+            self.total_time += time.perf_counter() - started
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def warm_up(self, urls: Iterable[str]) -> Dict[str, bool]:
+        """Open a pooled connection to each URL's origin ahead of the first real call."""
+        async def touch(origin: str) -> bool:
+            try:
+                await self.client.request("HEAD", origin)
+                return True
+            except httpx.HTTPError:
+                return False
+
+        origins = sorted({_origin(url) for url in urls})
+        results = await asyncio.gather(*(touch(origin) for origin in origins))
+        return dict(zip(origins, results))
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_time / self.requests * 1000, 2) if self.requests else 0.0,
+            "clients_created": self.clients_created,
+            "http2": self.http2
+        }
+
+
+_transport: Optional[HTTPTransport] = None
+
+def get_transport() -> HTTPTransport:
+    """Return the process-wide HTTP transport, creating a default one on first use."""
+    global _transport
+    if _transport is None:
+        _transport = HTTPTransport()
+    return _transport
+
+def set_transport(transport: Optional[HTTPTransport]) -> Optional[HTTPTransport]:
+    """Install (or with None, reset to default) the process-wide HTTP transport; returns the previous one."""
+    global _transport
+    previous, _transport = _transport, transport
+    return previous
@@ -1,27 +1,964 @@
+import asyncio
+import email.utils
+import hashlib
+import json
+import logging
 import os
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, Any, AsyncIterator, List, Optional, Sequence, Set, Tuple, Union
+
 import httpx
-from typing import Dict, Any
+
+from .http_transport import HTTPTransport, get_transport
+from .singleflight import SingleFlight, get_single_flight
+
+logger = logging.getLogger(__name__)
+
+# (tool_name, operation, arguments) as passed to call_tool
+ToolOperation = Tuple[str, str, Dict[str, Any]]
+
+
+class ResultRef:
+    """
+    Placeholder in call_tools arguments for (part of) the result of an
+    earlier operation in the same batch, e.g. the id create_ticket returned:
+
+        ResultRef(0, "id", default=ticket["id"])
+
+    key may be a sequence of keys for nested values; default is used when
+    the result has no such key.
+    """
+
+    def __init__(self, index: int, key: Union[str, Sequence[str], None] = None, default: Any = None):
+        self.index = index
+        self.keys = [] if key is None else [key] if isinstance(key, str) else list(key)
+        self.default = default
+
+    def resolve(self, result: Any) -> Any:
+        for key in self.keys:
+            if not isinstance(result, dict) or result.get(key) is None:
+                return self.default
+            result = result[key]
+        return result
+
+    def __repr__(self):
+        return f"ResultRef({self.index}, {self.keys!r})"
+
+
+def _refs(value: Any) -> Set[int]:
+    """Indexes of the operations a value's ResultRefs point at."""
+    if isinstance(value, ResultRef):
+        return {value.index}
+    if isinstance(value, dict):
+        return set().union(*(_refs(v) for v in value.values()))
+    if isinstance(value, (list, tuple)):
+        return set().union(*(_refs(v) for v in value))
+    return set()
+
+
+def _substitute(value: Any, results: List["ToolResult"]) -> Any:
+    if isinstance(value, ResultRef):
+        return value.resolve(results[value.index].result)
+    if isinstance(value, dict):
+        return {k: _substitute(v, results) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_substitute(v, results) for v in value)
+    return value
+
+
+@dataclass
+class ToolResult:
+    """Outcome of one operation in a call_tools batch"""
+    index: int
+    tool_name: str
+    operation: str
+    arguments: Dict[str, Any]
+    result: Any = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def unwrap(self) -> Any:
+        """The result, or raise the operation's error."""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+# Freshdesk operations that only read; anything else is treated as a write
+READ_OPERATIONS = {
+    "freshdesk": {
+        "list_tickets", "get_ticket", "search_tickets", "filter_tickets", "list_conversations",
+        "get_contact", "list_contacts", "search_contacts", "get_agent", "list_agents", "list_groups"
+    }
+}
+# Seconds a read result is served as fresh, by operation
+DEFAULT_TTLS = {
+    "list_tickets": 5.0, "search_tickets": 5.0, "filter_tickets": 5.0,
+    "get_ticket": 30.0, "list_conversations": 30.0,
+    "get_contact": 300.0, "list_contacts": 60.0, "search_contacts": 60.0,
+    "get_agent": 600.0, "list_agents": 600.0, "list_groups": 600.0
+}
+# Further seconds a hot lookup may be served stale while it is refreshed in the background
+DEFAULT_STALE_TTLS = {"get_ticket": 60.0, "get_contact": 600.0, "get_agent": 600.0}
+
+_COLLECTION_PREFIXES = ("list_", "search_", "filter_")
+
+
+def _tags(operation: str, arguments: Any, result: Any = None) -> Set[str]:
+    """Tickets/contacts an operation touches (from its arguments, and a lookup's result)."""
+    tags: Set[str] = set()
+    arguments = arguments if isinstance(arguments, dict) else {}
+    if arguments.get("ticket_id") is not None:
+        tags.add(f"ticket:{arguments['ticket_id']}")
+    for key in ("contact_id", "requester_id"):
+        if arguments.get(key) is not None:
+            tags.add(f"contact:{arguments[key]}")
+    if arguments.get("id") is not None and ("ticket" in operation or "contact" in operation):
+        tags.add(f"{'contact' if 'contact' in operation else 'ticket'}:{arguments['id']}")
+    if isinstance(result, dict) and result.get("id") is not None and operation in ("get_ticket", "get_contact"):
+        tags.add(f"{operation[4:]}:{result['id']}")
+    return tags
+
+
+class MCPReadCache:
+    """
+    Read-through cache for MCP read operations.
+
+    Results of read operations (READ_OPERATIONS) are cached by tool,
+    operation and canonical arguments for a per-operation TTL. A write
+    drops every cached read that touches the same ticket or contact, and
+    every list/search result of that tool, since the write may change
+    which items they contain. Lookups with a stale TTL keep being served
+    for that long after they expire while one background call refreshes
+    them (stale-while-revalidate).
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        stale_ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 30.0,
+        read_operations: Optional[Dict[str, Set[str]]] = None,
+        max_entries: int = 10000
+    ):
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.stale_ttls = dict(DEFAULT_STALE_TTLS, **(stale_ttls or {}))
+        self.default_ttl = default_ttl
+        self.read_operations = read_operations if read_operations is not None else READ_OPERATIONS
+        self.max_entries = max_entries
+        # key -> (fresh until, stale until, operation, tags, result)
+        self._entries: "OrderedDict[str, Tuple[float, float, str, Set[str], Any]]" = OrderedDict()
+        self._by_tag: Dict[str, Set[str]] = {}
+        # Bumped by every invalidation, so a read that raced a write isn't stored
+        self.generation = 0
+        self._ops: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def from_env(cls) -> "MCPReadCache":
+        """Build a cache with TTL overrides from MCP_CACHE_TTLS ("list_tickets=10,get_ticket=60")."""
+        ttls = {}
+        for pair in filter(None, os.getenv("MCP_CACHE_TTLS", "").split(",")):
+            operation, _, ttl = pair.partition("=")
+            ttls[operation.strip()] = float(ttl)
+        return cls(ttls=ttls)
+
+    def is_read(self, tool_name: str, operation: str) -> bool:
+        return operation in self.read_operations.get(tool_name, ())
+
+    def key(self, tool_name: str, operation: str, arguments: Any) -> str:
+        return json.dumps([tool_name, operation, arguments], sort_keys=True, separators=(",", ":"), default=str)
+
+    def _op(self, operation: str) -> Dict[str, float]:
+        stats = self._ops.get(operation)
+        if stats is None:
+            stats = self._ops[operation] = {"hits": 0, "stale_hits": 0, "misses": 0, "invalidated": 0, "miss_time": 0.0}
+        return stats
+
+    def get(self, key: str, operation: str) -> Tuple[Any, Optional[str]]:
+        """(result, "fresh" | "stale") for a cached read, or (None, None) on a miss."""
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            fresh_until, stale_until, _, _, result = entry
+            if now < fresh_until:
+                self._entries.move_to_end(key)
+                self._op(operation)["hits"] += 1
+                return result, "fresh"
+            if now < stale_until:
+                self._entries.move_to_end(key)
+                self._op(operation)["stale_hits"] += 1
+                return result, "stale"
+            self._remove(key)
+        self._op(operation)["misses"] += 1
+        return None, None
+
+    def put(self, key: str, tool_name: str, operation: str, arguments: Any, result: Any,
+            generation: Optional[int] = None):
+        """Cache a read result, unless an invalidation happened since `generation` was taken."""
+        if generation is not None and generation != self.generation:
+            return
+        ttl = self.ttls.get(operation, self.default_ttl)
+        if ttl <= 0:
+            return
+        self._remove(key)
+        now = time.monotonic()
+        tags = _tags(operation, arguments, result)
+        if operation.startswith(_COLLECTION_PREFIXES):
+            tags.add(f"{tool_name}:collections")
+        self._entries[key] = (now + ttl, now + ttl + self.stale_ttls.get(operation, 0.0), operation, tags, result)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def record_miss_time(self, operation: str, seconds: float):
+        self._op(operation)["miss_time"] += seconds
+
+    def _remove(self, key: str) -> Optional[str]:
+        """Drop an entry; returns its operation, or None if it wasn't cached."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        for tag in entry[3]:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+        return entry[2]
+
+    def invalidate_write(self, tool_name: str, operation: str, arguments: Any) -> int:
+        """Drop cached reads a write may have changed; returns how many were dropped."""
+        self.generation += 1
+        keys: Set[str] = set()
+        for tag in _tags(operation, arguments) | {f"{tool_name}:collections"}:
+            keys.update(self._by_tag.get(tag, ()))
+        for key in keys:
+            self._op(self._remove(key))["invalidated"] += 1
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_tag.clear()
+        self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        operations = {}
+        for operation, op in sorted(self._ops.items()):
+            served = op["hits"] + op["stale_hits"]
+            lookups = served + op["misses"]
+            avg_miss = op["miss_time"] / op["misses"] if op["misses"] else 0.0
+            operations[operation] = {
+                "hits": op["hits"],
+                "stale_hits": op["stale_hits"],
+                "misses": op["misses"],
+                "invalidated": op["invalidated"],
+                "hit_rate": served / lookups if lookups else 0.0,
+                # Every hit (fresh or stale) is a proxy round trip not made on the request path
+                "saved_round_trips": served,
+                "saved_ms": round(served * avg_miss * 1000, 2)
+            }
+        return {
+            "entries": len(self._entries),
+            "saved_round_trips": sum(op["saved_round_trips"] for op in operations.values()),
+            "operations": operations
+        }
+
+
+def _ticket_id(arguments: Any) -> Any:
+    if not isinstance(arguments, dict):
+        return None
+    return arguments.get("ticket_id", arguments.get("id"))
+
+
+def idempotency_key(agent_id: Optional[str], tool_name: str, operation: str, arguments: Any) -> str:
+    """Deterministic key of a write: the same agent repeating the same write on the same ticket gets the same key."""
+    material = json.dumps(
+        [agent_id, _ticket_id(arguments), tool_name, operation, arguments],
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class MCPError(Exception):
+    """Error reported by the MCP proxy or tool (the call reached it and failed)."""
+
+
+class MCPRetryPolicy:
+    """
+    Retries of MCP calls that failed on the way (connection errors,
+    timeouts, 429, 5xx), with decorrelated jitter between base_delay and
+    max_delay. A Retry-After from the proxy takes precedence when longer.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.2, max_delay: float = 5.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def next_delay(self, previous: Optional[float], retry_after: Optional[float] = None) -> float:
+        delay = min(self.max_delay, random.uniform(self.base_delay, (previous or self.base_delay) * 3))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def retryable(self, error: BaseException) -> Tuple[bool, Optional[float]]:
+        """(retry?, Retry-After seconds) for a failed attempt."""
+        if isinstance(error, httpx.TransportError):
+            return True, None
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code in self.RETRY_STATUSES:
+            value = error.response.headers.get("retry-after")
+            if value is None:
+                return True, None
+            try:
+                return True, float(value)
+            except ValueError:
+                parsed = email.utils.parsedate_to_datetime(value)
+                return True, max(0.0, parsed.timestamp() - time.time()) if parsed else None
+        return False, None
+
+
+class IdempotencyJournal:
+    """
+    Local append-only journal (JSON lines) of MCP writes by idempotency key.
+
+    A write is recorded as pending before it is sent and as done with its
+    result once the proxy confirms it, so after a crash a replayed ticket
+    gets the recorded result for writes that already went through instead
+    of issuing them again. Writes still pending after a crash are re-sent
+    with the same key, for the proxy to deduplicate.
+
+    Entries only dedupe for ttl seconds (MCP_JOURNAL_TTL, default 15
+    minutes): long enough to cover a restart, short enough that a later,
+    deliberate repeat of the same write (e.g. reassigning a ticket back
+    after someone else moved it) is sent again. At most max_entries
+    completed writes are remembered.
+    """
+
+    def __init__(self, path: str = None, ttl: Optional[float] = None, max_entries: int = 100000,
+                 fsync: bool = False):
+        self.path = path or os.getenv("MCP_JOURNAL_PATH", "mcp_journal.jsonl")
+        self.ttl = ttl if ttl is not None else float(os.getenv("MCP_JOURNAL_TTL", 900))
+        self.max_entries = max_entries
+        self.fsync = fsync
+        # key -> (completed at, result) and key -> sent at, oldest first
+        self._done: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._pending: "OrderedDict[str, float]" = OrderedDict()
+        self.replayed = 0
+        lines = self._load()
+        self._expire()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if lines > 2 * max(self.max_entries, len(self._done) + len(self._pending)):
+            self.compact()
+
+    def _load(self) -> int:
+        lines = 0
+        if not os.path.exists(self.path):
+            return lines
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-append
+                    continue
+                key = record.get("key")
+                ts = record.get("ts") or 0.0
+                if record.get("status") == "done":
+                    self._pending.pop(key, None)
+                    self._done.pop(key, None)
+                    self._done[key] = (ts, record.get("result"))
+                else:
+                    self._pending.pop(key, None)
+                    self._pending[key] = ts
+        return lines
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._done and next(iter(self._done.values()))[0] <= cutoff:
+            self._done.popitem(last=False)
+        while self._pending and next(iter(self._pending.values())) <= cutoff:
+            self._pending.popitem(last=False)
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    def _append(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """(True, result) if the write with this key succeeded within the last ttl seconds."""
+        self._expire()
+        if key in self._done:
+            self.replayed += 1
+            return True, self._done[key][1]
+        return False, None
+
+    def begin(self, key: str, tool_name: str, operation: str):
+        if key not in self._pending:
+            self._pending[key] = time.time()
+            self._append({"key": key, "status": "pending", "action": f"{tool_name}.{operation}",
+                          "ts": self._pending[key]})
+
+    def complete(self, key: str, result: Any):
+        self._pending.pop(key, None)
+        self._done.pop(key, None)
+        self._done[key] = (time.time(), result)
+        self._expire()
+        self._append({"key": key, "status": "done", "result": result, "ts": self._done[key][0]})
+
+    def pending(self) -> List[str]:
+        """Keys of writes sent within the last ttl seconds but never confirmed (in doubt after a crash)."""
+        self._expire()
+        return sorted(self._pending)
+
+    def compact(self):
+        """Rewrite the journal with only the entries still remembered."""
+        self._expire()
+        self._file.close()
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            for key, ts in self._pending.items():
+                f.write(json.dumps({"key": key, "status": "pending", "ts": ts}) + "\n")
+            for key, (ts, result) in self._done.items():
+                f.write(json.dumps({"key": key, "status": "done", "result": result, "ts": ts}, default=str) + "\n")
+        os.replace(self.path + ".tmp", self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self._file.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"completed": len(self._done), "pending": len(self._pending), "replayed": self.replayed}
+
+
+class _PageError:
+    """Error of iter_tool's page fetcher, handed to the consumer in order."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class _ItemStream:
+    """
+    Incremental parser for an MCP response of the form
+    {"result": {<items_key>: [...], ...}}: feed() returns the items of the
+    array as soon as their text has arrived, and close() parses everything
+    else (cursor, error), with the array left empty.
+    """
+
+    _SKIP = " \t\r\n,"
+
+    def __init__(self, items_key: str):
+        self.path = ["result", items_key]
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        # Response text outside the items array
+        self._rest: List[str] = []
+        # [container, current key, expecting a key] per open object/array
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        self._in_items = False
+
+    def feed(self, text: str) -> List[Any]:
+        buffer = self._buffer + text
+        items = []
+        pos = 0
+        while pos < len(buffer):
+            if self._in_items:
+                while pos < len(buffer) and buffer[pos] in self._SKIP:
+                    pos += 1
+                if pos == len(buffer):
+                    break
+                if buffer[pos] == "]":
+                    self._in_items = False
+                    self._rest.append("]")
+                    pos += 1
+                    continue
+                try:
+                    item, end = self._decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    break
+                if end == len(buffer):
+                    # Could be a number cut off mid-way; wait for the delimiter
+                    break
+                items.append(item)
+                pos = end
+                continue
+
+            char = buffer[pos]
+            pos += 1
+            self._rest.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._stack and self._stack[-1][0] == "{" and self._stack[-1][2]:
+                        self._stack[-1][1] = "".join(self._string)
+                    continue
+                self._string.append(char)
+            elif char == '"':
+                self._in_string = True
+                self._string = []
+            elif char == "{":
+                self._stack.append(["{", None, True])
+            elif char == "[":
+                if [key for _, key, _ in self._stack] == self.path:
+                    self._in_items = True
+                else:
+                    self._stack.append(["[", None, False])
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+            elif char == ":" and self._stack:
+                self._stack[-1][2] = False
+            elif char == "," and self._stack and self._stack[-1][0] == "{":
+                self._stack[-1][2] = True
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self) -> Dict[str, Any]:
+        if self._in_items or self._buffer.strip():
+            raise ValueError("MCP response ended in the middle of the item list")
+        data = json.loads("".join(self._rest))
+        if not isinstance(data, dict):
+            raise ValueError("MCP response is not a JSON object")
+        return data
+
 
 class MCPClient:
-    def __init__(self, base_url: str = None, token: str = None):
+    """
+    Client for the MCP proxy.
+
+    call_tools runs an ordered batch of operations in as few round trips
+    as their ResultRef dependencies allow: every operation whose inputs are
+    ready is sent together as one JSON-RPC batch, or, if the proxy does not
+    accept batches, as concurrent requests pipelined over the pooled
+    transport. Operations within one round trip are not ordered relative
+    to each other.
+
+    With a cache, read operations are answered from it when possible and
+    writes invalidate the reads they affect. Concurrent identical reads
+    that do go to the proxy share one request (single_flight, by default
+    the process-wide "mcp" one); writes are never coalesced.
+
+    Every write carries a deterministic idempotency key (agent, ticket,
+    operation, argument hash; the Idempotency-Key header, or params._meta
+    in a JSON-RPC batch) so calls that failed on the way (connection
+    errors, 429, 5xx) can be retried under retry_policy without the proxy
+    applying them twice. With a journal, writes that already succeeded,
+    e.g. before a crash, are answered from it instead of being re-sent.
+    """
+
+    def __init__(self, base_url: str = None, token: str = None, transport: Optional[HTTPTransport] = None,
+                 batch: bool = True, cache: Optional[MCPReadCache] = None,
+                 single_flight: Optional[SingleFlight] = None, retry_policy: Optional[MCPRetryPolicy] = None,
+                 journal: Optional[IdempotencyJournal] = None):
         self.base_url = base_url or os.getenv("MCP_PROXY_URL", "http://localhost:3000")
         self.token = token or os.getenv("AGENT_JWT_TOKEN", "dummy-token")
+        # None means the process-wide pooled transport
+        self._transport = transport
+        # batch=False always pipelines instead of trying JSON-RPC batches
+        self._batch_supported = batch
+        self.cache = cache
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.single_flight = single_flight or get_single_flight("mcp")
+        # Bumped after every write, so reads issued after it don't join reads started before it
+        self._writes = 0
+        self.retry_policy = retry_policy or MCPRetryPolicy()
+        self.journal = journal
+        self.retries = 0
+        self.retries_exhausted = 0
+        self.pages = 0
+        self.streamed_items = 0
+        self.batch_requests = 0
+        self.batched_operations = 0
+        self.pipelined_operations = 0
 
-    async def call_tool(self, tool_name: str, operation: str, arguments: Dict[str, Any]) -> Any:
-        url = f"{self.base_url}/mcp/tools/call"
-        payload = {
-            "method": "call",
-            "params": {
-                "name": tool_name,
-                "operation": operation,
-                "arguments": arguments
-            }
+    @property
+    def transport(self) -> HTTPTransport:
+        return self._transport or get_transport()
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/mcp/tools/call"
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def is_read(self, tool_name: str, operation: str) -> bool:
+        if self.cache is not None:
+            return self.cache.is_read(tool_name, operation)
+        return operation in READ_OPERATIONS.get(tool_name, ())
+
+    async def call_tool(self, tool_name: str, operation: str, arguments: Dict[str, Any],
+                        agent_id: Optional[str] = None) -> Any:
+        """Run one operation; agent_id scopes the idempotency key of writes."""
+        cache = self.cache
+        if not self.is_read(tool_name, operation):
+            return await self._write(tool_name, operation, arguments, agent_id)
+
+        if cache is None:
+            key = json.dumps([tool_name, operation, arguments], sort_keys=True, separators=(",", ":"), default=str)
+            read = partial(self._call, tool_name, operation, arguments)
+        else:
+            key = cache.key(tool_name, operation, arguments)
+            result, state = cache.get(key, operation)
+            if state == "stale":
+                self._revalidate(key, tool_name, operation, arguments)
+            if state is not None:
+                return result
+            read = partial(self._read, key, tool_name, operation, arguments)
+        return await self.single_flight.do((self.base_url, self._writes, key), read)
+
+    async def _write(self, tool_name: str, operation: str, arguments: Dict[str, Any], agent_id: Optional[str]) -> Any:
+        key = idempotency_key(agent_id, tool_name, operation, arguments)
+        if self.journal is not None:
+            done, result = self.journal.lookup(key)
+            if done:
+                return result
+            self.journal.begin(key, tool_name, operation)
+        try:
+            result = await self._call(tool_name, operation, arguments, idempotency_key=key)
+        finally:
+            self._writes += 1
+            if self.cache is not None:
+                # Even a failed write may have been applied
+                self.cache.invalidate_write(tool_name, operation, arguments)
+        if self.journal is not None:
+            self.journal.complete(key, result)
+        return result
+
+    async def _read(self, key: str, tool_name: str, operation: str, arguments: Dict[str, Any]) -> Any:
+        generation = self.cache.generation
+        started = time.perf_counter()
+        result = await self._call(tool_name, operation, arguments)
+        self.cache.record_miss_time(operation, time.perf_counter() - started)
+        self.cache.put(key, tool_name, operation, arguments, result, generation)
+        return result
+
+    def _revalidate(self, key: str, tool_name: str, operation: str, arguments: Dict[str, Any]):
+        """Refresh a stale entry in the background (one refresh per key at a time)."""
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                generation = self.cache.generation
+                result = await self._call(tool_name, operation, arguments)
+                self.cache.put(key, tool_name, operation, arguments, result, generation)
+            except Exception:
+                # Keep serving the stale value; the next lookup after it expires goes to the proxy
+                pass
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.get_running_loop().create_task(refresh())
+
+    async def _call(self, tool_name: str, operation: str, arguments: Dict[str, Any],
+                    idempotency_key: Optional[str] = None) -> Any:
+        params = {
+            "name": tool_name,
+            "operation": operation,
+            "arguments": arguments
         }
-        headers = {"Authorization": f"Bearer {self.token}"}
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+        headers = self.headers
+        if idempotency_key is not None:
+            # A header, so the tool's arguments reach the server unchanged
+            headers = {**headers, "Idempotency-Key": idempotency_key}
+        response = await self._post({"method": "call", "params": params}, headers)
+        response.raise_for_status()
+        data = response.json()
+        if "error" in data and data["error"]:
+            raise MCPError(f"MCP error: {data['error']}")
+        return data.get("result")
+
+    async def _post(self, payload: Any, headers: Dict[str, str]) -> httpx.Response:
+        """POST to the proxy, retrying connection errors, 429 and 5xx under retry_policy."""
+        policy = self.retry_policy
+        delay = None
+        for attempt in range(1, policy.max_attempts + 1):
+            try:
+                response = await self.transport.post(self.url, json=payload, headers=headers)
+                if response.status_code in policy.RETRY_STATUSES:
+                    response.raise_for_status()
+                return response
+            except Exception as e:
+                retry, retry_after = policy.retryable(e)
+                if not retry:
+                    raise
+                if attempt == policy.max_attempts:
+                    self.retries_exhausted += 1
+                    raise
+                delay = policy.next_delay(delay, retry_after)
+                self.retries += 1
+                logger.warning(f"MCP call failed ({e!r}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def iter_tool(self, tool_name: str, operation: str, arguments: Optional[Dict[str, Any]] = None,
+                        items_key: str = "tickets", page_size: Optional[int] = 100,
+                        page_size_param: str = "per_page", cursor_param: str = "cursor",
+                        cursor_key: str = "next_cursor") -> AsyncIterator[Any]:
+        """
+        Yield the items (result[items_key]) of a paged list operation one
+        at a time, following result[cursor_key] into cursor_param until a
+        page comes back without a cursor.
+
+        Items are parsed as their part of the response arrives, and the
+        next page is requested as soon as the current one has been read,
+        while the consumer is still working through it; at most about one
+        page of parsed items is held ahead of the consumer. Pages bypass the
+        read cache and single flight.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=page_size or 100)
+        finished = object()
+
+        async def produce():
+            page_arguments = dict(arguments or {})
+            if page_size:
+                page_arguments[page_size_param] = page_size
+            try:
+                while True:
+                    result = await self._stream_page(tool_name, operation, page_arguments, items_key, queue)
+                    cursor = result.get(cursor_key) if isinstance(result, dict) else None
+                    if not cursor:
+                        break
+                    page_arguments = {**page_arguments, cursor_param: cursor}
+                await queue.put(finished)
+            except Exception as e:
+                await queue.put(_PageError(e))
+
+        producer = asyncio.get_running_loop().create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    return
+                if isinstance(item, _PageError):
+                    raise item.error
+                yield item
+        finally:
+            # Consumer stopped early (break, error, cancellation): stop paging
+            producer.cancel()
+
+    async def _stream_page(self, tool_name: str, operation: str, arguments: Dict[str, Any],
+                           items_key: str, queue: asyncio.Queue) -> Any:
+        """Put one page's items on queue as they are parsed; returns the rest of the result."""
+        payload = {"method": "call", "params": {"name": tool_name, "operation": operation, "arguments": arguments}}
+        policy = self.retry_policy
+        delay = None
+        # Items already handed on, skipped if the page has to be requested again
+        delivered = 0
+        for attempt in range(1, policy.max_attempts + 1):
+            parser = _ItemStream(items_key)
+            skip = delivered
+            try:
+                async with self.transport.stream("POST", self.url, json=payload, headers=self.headers) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_text():
+                        for item in parser.feed(chunk):
+                            if skip:
+                                skip -= 1
+                                continue
+                            await queue.put(item)
+                            delivered += 1
+                            self.streamed_items += 1
+                data = parser.close()
+                break
+            except Exception as e:
+                retry, retry_after = policy.retryable(e)
+                if not retry:
+                    raise
+                if attempt == policy.max_attempts:
+                    self.retries_exhausted += 1
+                    raise
+                delay = policy.next_delay(delay, retry_after)
+                self.retries += 1
+                logger.warning(f"MCP page request failed ({e!r}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        self.pages += 1
+        if "error" in data and data["error"]:
+            raise MCPError(f"MCP error: {data['error']}")
+        return data.get("result")
+
+    async def call_tools(self, operations: Sequence[ToolOperation], agent_id: Optional[str] = None) -> List[ToolResult]:
+        """
+        Run (tool_name, operation, arguments) operations, where arguments may
+        hold ResultRefs to earlier operations. Returns one ToolResult per
+        operation, in order; failures are reported per operation (and fail
+        the operations that depend on them) rather than raised.
+        """
+        results: List[ToolResult] = []
+        depends: List[Set[int]] = []
+        for i, (tool_name, operation, arguments) in enumerate(operations):
+            refs = _refs(arguments)
+            if any(ref < 0 or ref >= i for ref in refs):
+                raise ValueError(f"Operation {i} ({tool_name}.{operation}) may only refer to earlier operations")
+            results.append(ToolResult(i, tool_name, operation, arguments))
+            depends.append(refs)
+
+        pending = list(range(len(results)))
+        while pending:
+            ready = [i for i in pending if all(ref not in pending for ref in depends[i])]
+            pending = [i for i in pending if i not in ready]
+            wave = []
+            for i in ready:
+                failed = [ref for ref in sorted(depends[i]) if not results[ref].ok]
+                if failed:
+                    results[i].error = MCPError(f"MCP error: depends on failed operation {failed[0]}")
+                    continue
+                results[i].arguments = _substitute(results[i].arguments, results)
+                wave.append(results[i])
+            if wave:
+                await self._send(wave, agent_id)
+        return results
+
+    async def _send(self, wave: List[ToolResult], agent_id: Optional[str] = None):
+        """One round trip for operations with no unresolved dependencies."""
+        if self.cache is not None and len(wave) > 1 and self._batch_supported:
+            # Answer cached reads locally; the rest go out as one batch below
+            pending = []
+            for item in wave:
+                if self.cache.is_read(item.tool_name, item.operation):
+                    key = self.cache.key(item.tool_name, item.operation, item.arguments)
+                    result, state = self.cache.get(key, item.operation)
+                    if state == "stale":
+                        self._revalidate(key, item.tool_name, item.operation, item.arguments)
+                    if state is not None:
+                        item.result = result
+                        continue
+                pending.append(item)
+            if len(pending) < len(wave):
+                if pending:
+                    await self._send(pending, agent_id)
+                return
+        if len(wave) > 1 and self._batch_supported:
+            try:
+                if await self._send_batch(wave, agent_id):
+                    return
+            except Exception as e:
+                for item in wave:
+                    item.error = e
+                return
+
+        async def one(item: ToolResult):
+            try:
+                item.result = await self.call_tool(item.tool_name, item.operation, item.arguments, agent_id)
+            except Exception as e:
+                item.error = e
+
+        if len(wave) > 1:
+            self.pipelined_operations += len(wave)
+        await asyncio.gather(*(one(item) for item in wave))
+
+    async def _send_batch(self, wave: List[ToolResult], agent_id: Optional[str] = None) -> bool:
+        """Send the wave as a JSON-RPC batch; False if the proxy does not support batches."""
+        keys: Dict[int, str] = {}
+        for item in wave:
+            if not self.is_read(item.tool_name, item.operation):
+                keys[item.index] = idempotency_key(agent_id, item.tool_name, item.operation, item.arguments)
+        if self.journal is not None:
+            for item in wave:
+                if item.index in keys:
+                    done, result = self.journal.lookup(keys[item.index])
+                    if done:
+                        item.result = result
+                        del keys[item.index]
+            unsent = [item for item in wave if item.index in keys or self.is_read(item.tool_name, item.operation)]
+            if len(unsent) < len(wave):
+                if unsent:
+                    await self._send(unsent, agent_id)
+                return True
+            for item in wave:
+                if item.index in keys:
+                    self.journal.begin(keys[item.index], item.tool_name, item.operation)
+        payload = []
+        for item in wave:
+            params = {"name": item.tool_name, "operation": item.operation, "arguments": item.arguments}
+            if item.index in keys:
+                # One request carries many keys, so each goes in the call's reserved _meta field
+                params["_meta"] = {"idempotency_key": keys[item.index]}
+            payload.append({"jsonrpc": "2.0", "id": item.index, "method": "call", "params": params})
+        # Writes in the wave bump the generation, so reads sent alongside them aren't cached
+        generation = self.cache.generation if self.cache is not None else None
+        try:
+            response = await self._post(payload, self.headers)
+        finally:
+            self._invalidate_writes(wave)
+        status = response.status_code
+        if status == 501 or (400 <= status < 500 and status not in (401, 403, 429)):
+            # Proxy rejects a list body (e.g. 422 from a schema that expects one call): pipeline instead
+            self._batch_supported = False
+            return False
+        response.raise_for_status()
+        try:
             data = response.json()
-            if "error" in data and data["error"]:
-                raise Exception(f"MCP error: {data['error']}")
-            return data.get("result") 
\ No newline at end of file
+        except ValueError:
+            data = None
+        replies = {reply.get("id"): reply for reply in data if isinstance(reply, dict)} if isinstance(data, list) else {}
+        if not all(item.index in replies for item in wave):
+            # Answered as a single call, or replies missing: fall back to pipelining
+            self._batch_supported = False
+            return False
+        for item in wave:
+            reply = replies[item.index]
+            if reply.get("error"):
+                item.error = MCPError(f"MCP error: {reply['error']}")
+            else:
+                item.result = reply.get("result")
+                if self.journal is not None and item.index in keys:
+                    self.journal.complete(keys[item.index], item.result)
+                if self.cache is not None and self.cache.is_read(item.tool_name, item.operation):
+                    key = self.cache.key(item.tool_name, item.operation, item.arguments)
+                    self.cache.put(key, item.tool_name, item.operation, item.arguments, item.result, generation)
+        self.batch_requests += 1
+        self.batched_operations += len(wave)
+        return True
+
+    def _invalidate_writes(self, wave: List[ToolResult]):
+        for item in wave:
+            if not self.is_read(item.tool_name, item.operation):
+                self._writes += 1
+                if self.cache is not None:
+                    self.cache.invalidate_write(item.tool_name, item.operation, item.arguments)
+
+    async def aclose(self):
+        """Cancel background cache refreshes."""
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        self._refreshing.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "batch_requests": self.batch_requests,
+            "batched_operations": self.batched_operations,
+            "pipelined_operations": self.pipelined_operations,
+            "batch_supported": self._batch_supported,
+            "retries": self.retries,
+            "retries_exhausted": self.retries_exhausted,
+            "pages": self.pages,
+            "streamed_items": self.streamed_items
+        }
+        if self.journal is not None:
+            stats["journal"] = self.journal.stats()
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        stats["single_flight"] = self.single_flight.stats()
+        return stats
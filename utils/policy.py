@@ -1,12 +1,325 @@
-import httpx
-from typing import Dict, Any
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from .http_transport import HTTPTransport, get_transport
+from .policy_engine import LocalPolicyEngine
+
+
+def input_key(input_data: Dict[str, Any]) -> str:
+    """Canonical hash of a policy input document (key order and whitespace independent)."""
+    material = json.dumps(input_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _bundle_revision(body: Dict[str, Any]) -> Optional[str]:
+    """Bundle revision(s) from an OPA response requested with provenance=true."""
+    bundles = (body.get("provenance") or {}).get("bundles") or {}
+    if not bundles:
+        return (body.get("provenance") or {}).get("revision")
+    return ",".join(f"{name}@{info.get('revision')}" for name, info in sorted(bundles.items()))
+
+
+def _cache_hint(result: Dict[str, Any], headers) -> Optional[float]:
+    """TTL requested by the policy (result.cache_ttl) or OPA's Cache-Control; 0 means do not cache."""
+    if isinstance(result, dict) and result.get("cache_ttl") is not None:
+        try:
+            return max(0.0, float(result["cache_ttl"]))
+        except (TypeError, ValueError):
+            pass
+    control = (headers or {}).get("cache-control") or ""
+    if "no-store" in control or "no-cache" in control:
+        return 0.0
+    match = re.search(r"max-age=(\d+)", control)
+    return float(match.group(1)) if match else None
+
+
+class PolicyDecisionCache:
+    """
+    TTL cache of OPA decisions keyed by input_key().
+
+    Allowed decisions live for `ttl` seconds and denials for `negative_ttl`
+    (short, so newly granted permissions show up quickly) unless the
+    response carries a cache hint. Every entry remembers the bundle
+    revision it was decided under; seeing a new revision drops them all.
+    So that a new revision is noticed while everything is served from
+    cache, a hit re-asks OPA in the background once revision_check_interval
+    seconds have passed without any OPA response.
+    """
+
+    def __init__(self, ttl: float = 60.0, negative_ttl: float = 5.0, max_entries: int = 10000,
+                 revision_check_interval: Optional[float] = 10.0):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.revision_check_interval = revision_check_interval
+        self.revision: Optional[str] = None
+        self.revision_checked_at = time.monotonic()
+        self._entries: "OrderedDict[str, Tuple[float, Optional[str], Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.revision_checks = 0
+        self.miss_latency = 0.0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, revision, result = entry
+        if expires <= time.monotonic() or revision != self.revision:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: Dict[str, Any], hint: Optional[float] = None):
+        ttl = hint if hint is not None else (self.ttl if result.get("allow") else self.negative_ttl)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, self.revision, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def revision_check_due(self) -> bool:
+        """True (once per interval) when the bundle revision should be re-checked with OPA."""
+        now = time.monotonic()
+        if self.revision_check_interval is None or now - self.revision_checked_at < self.revision_check_interval:
+            return False
+        self.revision_checked_at = now
+        self.revision_checks += 1
+        return True
+
+    def observe_revision(self, revision: Optional[str]):
+        """Drop every cached decision when the policy bundle revision changes."""
+        self.revision_checked_at = time.monotonic()
+        if revision is not None and revision != self.revision:
+            if self.revision is not None:
+                self.invalidate()
+            self.revision = revision
+
+    def invalidate(self):
+        self._entries.clear()
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        avg_miss = self.miss_latency / self.misses if self.misses else 0.0
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / (lookups + self.coalesced) if lookups + self.coalesced else 0.0,
+            "avg_miss_ms": round(avg_miss * 1000, 2),
+            # Each hit or coalesced call would otherwise have paid an OPA round trip
+            "saved_ms": round((self.hits + self.coalesced) * avg_miss * 1000, 2),
+            "invalidations": self.invalidations,
+            "revision_checks": self.revision_checks,
+            "revision": self.revision
+        }
+
 
 class OPAPolicyClient:
-    def __init__(self, opa_url: str = "http://localhost:8181/v1/data/agent/policy"):
+    """
+    Policy decisions from OPA over HTTP, optionally cached, and optionally
+    answered in process by a LocalPolicyEngine first; inputs the local
+    bundle can't decide still go to OPA.
+
+    evaluate_many sends several inputs as one query to batch_url, which is
+    expected to evaluate {"input": {"batch": [...]}} into a list of results
+    in input order, e.g. in Rego:
+
+        batch := [decision(x) | some x in input.batch]
+
+    If the policy has no batch rule, the inputs are evaluated concurrently
+    one by one instead.
+    """
+
+    def __init__(self, opa_url: str = "http://localhost:8181/v1/data/agent/policy",
+                 cache: Optional[PolicyDecisionCache] = None, local: Optional[LocalPolicyEngine] = None,
+                 batch_url: Optional[str] = None, transport: Optional[HTTPTransport] = None):
         self.opa_url = opa_url
+        self.batch_url = batch_url or f"{opa_url.rstrip('/')}/batch"
+        self.cache = cache
+        self.local = local
+        self._transport = transport
+        # Decision per input key of queries on the wire, shared by every caller asking for that key
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._queries: Set[asyncio.Task] = set()
+        self._batch_supported = True
+        self.batch_queries = 0
+        self.batched_inputs = 0
+
+    @property
+    def transport(self) -> HTTPTransport:
+        return self._transport or get_transport()
 
     async def evaluate(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(self.opa_url, json={"input": input_data})
-            response.raise_for_status()
-            return response.json().get("result", {}) 
\ No newline at end of file
+        if self.local is not None:
+            self.local.start()
+            decision = self.local.decide(input_data)
+            if decision is not None:
+                return decision
+        return await self._evaluate_remote(input_data)
+
+    async def _evaluate_remote(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        if self.cache is None:
+            return (await self._query(input_data))[0]
+
+        key = input_key(input_data)
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.hits += 1
+            self._check_revision(key, input_data)
+            return result
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            # An identical evaluation is already on the wire; share its answer
+            self.cache.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.cache.misses += 1
+        return await asyncio.shield(self._start_query({key: input_data})[key])
+
+    def _check_revision(self, key: str, input_data: Dict[str, Any]):
+        """Re-ask OPA for a cache hit in the background when a bundle revision check is due."""
+        if self.cache.revision_check_due() and key not in self._in_flight:
+            self._start_query({key: input_data}, count_latency=False)
+
+    def _start_query(self, missing: Dict[str, Dict[str, Any]], count_latency: bool = True) -> Dict[str, asyncio.Future]:
+        """
+        Query OPA for the inputs in missing (by key) and cache the answers,
+        in a task of its own: a caller that is cancelled only stops waiting,
+        without cancelling the query for others sharing it. Returns the
+        future of each key's decision.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {key: loop.create_future() for key in missing}
+        self._in_flight.update(futures)
+
+        async def query():
+            started = time.perf_counter()
+            try:
+                results, body, headers = await self._query_many(list(missing.values()))
+                if count_latency:
+                    # One round trip for all misses, so avg_miss_ms stays a per-input cost
+                    self.cache.miss_latency += time.perf_counter() - started
+                self.cache.observe_revision(_bundle_revision(body))
+                for key, result in zip(missing, results):
+                    self.cache.put(key, result, _cache_hint(result, headers))
+                    futures[key].set_result(result)
+            except asyncio.CancelledError:
+                for future in futures.values():
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in futures.values():
+                    future.set_exception(e)
+                    # Mark retrieved so an error nobody awaited isn't reported as unhandled
+                    future.exception()
+            finally:
+                for key, future in futures.items():
+                    if self._in_flight.get(key) is future:
+                        del self._in_flight[key]
+
+        task = loop.create_task(query())
+        self._queries.add(task)
+        task.add_done_callback(self._queries.discard)
+        return futures
+
+    async def evaluate_many(self, inputs: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Decide several inputs, sending everything not answered locally or from cache in one OPA query."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(inputs)
+        remote: List[int] = []
+        for i, input_data in enumerate(inputs):
+            if self.local is not None:
+                self.local.start()
+                results[i] = self.local.decide(input_data)
+            if results[i] is None:
+                remote.append(i)
+        if remote:
+            decided = await self._evaluate_remote_many([inputs[i] for i in remote])
+            for i, result in zip(remote, decided):
+                results[i] = result
+        return results
+
+    async def _evaluate_remote_many(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.cache is None:
+            return (await self._query_many(inputs))[0]
+
+        keys = [input_key(input_data) for input_data in inputs]
+        answers: Dict[str, Any] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        missing: Dict[str, Dict[str, Any]] = {}
+        for key, input_data in zip(keys, inputs):
+            if key in answers or key in waiting or key in missing:
+                continue
+            result = self.cache.get(key)
+            if result is not None:
+                self.cache.hits += 1
+                self._check_revision(key, input_data)
+                answers[key] = result
+            elif key in self._in_flight:
+                self.cache.coalesced += 1
+                waiting[key] = self._in_flight[key]
+            else:
+                self.cache.misses += 1
+                missing[key] = input_data
+
+        if missing:
+            waiting.update(self._start_query(missing))
+        for key, future in waiting.items():
+            answers[key] = await asyncio.shield(future)
+        return [answers[key] for key in keys]
+
+    async def _query_many(self, inputs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Any]:
+        """One OPA query for several inputs; returns (results in input order, body, headers)."""
+        if len(inputs) == 1:
+            result, body, headers = await self._query(inputs[0])
+            return [result], body, headers
+        if self._batch_supported:
+            params = {"provenance": "true"} if self.cache is not None else None
+            response = await self.transport.post(self.batch_url, json={"input": {"batch": inputs}}, params=params)
+            if response.status_code != 404:
+                response.raise_for_status()
+                body = response.json()
+                results = body.get("result")
+                if isinstance(results, dict):
+                    results = results.get("decisions")
+                if isinstance(results, list) and len(results) == len(inputs):
+                    self.batch_queries += 1
+                    self.batched_inputs += len(inputs)
+                    return results, body, response.headers
+            # No batch rule in the loaded policy (404, or undefined result)
+            self._batch_supported = False
+        answers = await asyncio.gather(*(self._query(input_data) for input_data in inputs))
+        return [answer[0] for answer in answers], answers[-1][1], answers[-1][2]
+
+    async def _query(self, input_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], Any]:
+        """POST one input to OPA; returns (result, full response body, response headers)."""
+        params = {"provenance": "true"} if self.cache is not None else None
+        response = await self.transport.post(self.opa_url, json={"input": input_data}, params=params)
+        response.raise_for_status()
+        body = response.json()
+        return body.get("result", {}), body, response.headers
+
+    async def aclose(self):
+        """Stop background bundle sync and any OPA queries still in flight."""
+        for task in list(self._queries):
+            task.cancel()
+        if self.local is not None:
+            await self.local.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats() if self.cache is not None else {}
+        stats.update(batch_queries=self.batch_queries, batched_inputs=self.batched_inputs)
+        if self.local is not None:
+            stats["local"] = self.local.stats()
+        return stats
@@ -0,0 +1,301 @@
+"""
+In-process policy evaluation for OPAPolicyClient.
+
+Policies are shipped as a JSON decision-table bundle:
+
+    {
+      "revision": "2026-10-18.1",
+      "default": {"allow": false},
+      "rules": [
+        {"agent_id": "security_agent", "action": "*", "resource": "*", "allow": true},
+        {"agent_id": ["triage_agent", "tech_support_agent"], "action": ["create_ticket", "add_note"],
+         "resource": "freshdesk", "allow": true},
+        {"agent_id": "*", "action": "execute_stage", "resource": "escalate",
+         "context": {"workflow_id": "security_incident_workflow"}, "allow": true},
+        {"agent_id": "*", "action": "export_data", "resource": "*", "remote": true}
+      ]
+    }
+
+agent_id/action/resource match exactly, by glob, by list or "*"; "context"
+entries must equal (or be one of) the input's context values. The first
+matching rule decides. "remote": true rules, and inputs no rule matches
+when the bundle has no "default", are left to the HTTP OPA path.
+
+Parity harness (local vs remote decisions on recorded inputs, e.g. the
+policy_decision events of an audit log):
+
+    python -m utils.policy_engine parity --bundle policy.json --inputs audit.log
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .http_transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+# Sentinel: the local engine has no answer and the remote OPA must decide
+REMOTE = None
+
+
+def _matcher(value: Any):
+    """Compile one rule field into a predicate over the input value."""
+    if value is None or value == "*":
+        return None
+    values = [value] if isinstance(value, str) else list(value)
+    exact = {v for v in values if not any(c in v for c in "*?[")}
+    patterns = [v for v in values if v not in exact]
+
+    def match(actual: Any) -> bool:
+        actual = "" if actual is None else str(actual)
+        return actual in exact or any(fnmatch.fnmatchcase(actual, p) for p in patterns)
+    return match
+
+
+class _Rule:
+    __slots__ = ("agent_id", "action", "resource", "context", "result", "remote")
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.agent_id = _matcher(spec.get("agent_id"))
+        self.action = _matcher(spec.get("action"))
+        self.resource = _matcher(spec.get("resource"))
+        self.context = {
+            key: (lambda actual, v=value: actual in v) if isinstance(value, list) else (lambda actual, v=value: actual == v)
+            for key, value in (spec.get("context") or {}).items()
+        }
+        self.remote = bool(spec.get("remote"))
+        self.result = spec.get("result") or {"allow": bool(spec.get("allow", False))}
+
+    def matches_target(self, agent_id: str, action: str, resource: str) -> bool:
+        return all(m is None or m(v) for m, v in ((self.agent_id, agent_id), (self.action, action), (self.resource, resource)))
+
+    def matches_context(self, context: Dict[str, Any]) -> bool:
+        return all(check(context.get(key)) for key, check in self.context.items())
+
+
+class CompiledPolicy:
+    """
+    A loaded bundle. Rules are filtered per (agent_id, action, resource) once
+    and memoized, so a decision is a dict lookup plus any context checks.
+    """
+
+    def __init__(self, bundle: Dict[str, Any], max_table_entries: int = 50000):
+        self.revision = bundle.get("revision")
+        self.default = bundle.get("default")
+        self.rules = [_Rule(spec) for spec in bundle.get("rules", [])]
+        self.max_table_entries = max_table_entries
+        self._table: Dict[Tuple[str, str, str], List[_Rule]] = {}
+
+    def candidates(self, agent_id: str, action: str, resource: str) -> List[_Rule]:
+        key = (agent_id, action, resource)
+        rules = self._table.get(key)
+        if rules is None:
+            rules = [rule for rule in self.rules if rule.matches_target(agent_id, action, resource)]
+            if len(self._table) >= self.max_table_entries:
+                self._table.clear()
+            self._table[key] = rules
+        return rules
+
+    def decide(self, input_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Decision for input_data, or REMOTE when the HTTP OPA path has to answer."""
+        context = input_data.get("context") or {}
+        for rule in self.candidates(str(input_data.get("agent_id")), str(input_data.get("action")),
+                                    str(input_data.get("resource"))):
+            if rule.matches_context(context):
+                return REMOTE if rule.remote else rule.result
+        return self.default
+
+
+class LocalPolicyEngine:
+    """
+    Evaluates the JSON decision-table bundle at `bundle` (a file path or an
+    http(s) URL) in process, re-syncing it every sync_interval seconds in
+    the background. A failed sync keeps the last good bundle.
+    """
+
+    def __init__(self, bundle: str = None, sync_interval: float = 30.0):
+        self.bundle = bundle or os.getenv("POLICY_BUNDLE", "policy_bundle.json")
+        self.sync_interval = sync_interval
+        self.policy: Optional[CompiledPolicy] = None
+        self._etag: Optional[str] = None
+        self._mtime: Optional[float] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self.local_decisions = 0
+        self.remote_fallbacks = 0
+        self.syncs = 0
+        self.sync_errors = 0
+        if not self._is_url() and os.path.exists(self.bundle):
+            self._load_file()
+
+    def _is_url(self) -> bool:
+        return self.bundle.startswith(("http://", "https://"))
+
+    def load(self, bundle: Dict[str, Any]):
+        """Install a bundle document (replaces the compiled policy atomically)."""
+        self.policy = CompiledPolicy(bundle)
+        self.syncs += 1
+
+    def _load_file(self) -> bool:
+        mtime = os.path.getmtime(self.bundle)
+        if mtime == self._mtime:
+            return False
+        with open(self.bundle, encoding="utf-8") as f:
+            self.load(json.load(f))
+        self._mtime = mtime
+        return True
+
+    async def sync(self) -> bool:
+        """Reload the bundle if it changed; returns True when a new one was installed."""
+        try:
+            if not self._is_url():
+                return await asyncio.to_thread(self._load_file)
+            headers = {"If-None-Match": self._etag} if self._etag else {}
+            response = await get_transport().get(self.bundle, headers=headers)
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+            bundle = response.json()
+            if self.policy is not None and bundle.get("revision") == self.policy.revision:
+                return False
+            self.load(bundle)
+            self._etag = response.headers.get("etag")
+            return True
+        except Exception as e:
+            self.sync_errors += 1
+            logger.error(f"Policy bundle sync from {self.bundle} failed: {e}")
+            return False
+
+    async def _sync_loop(self):
+        while True:
+            await self.sync()
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self):
+        """Start background bundle sync on the running loop (idempotent)."""
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop())
+
+    async def aclose(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+
+    def decide(self, input_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        decision = self.policy.decide(input_data) if self.policy is not None else REMOTE
+        if decision is REMOTE:
+            self.remote_fallbacks += 1
+        else:
+            self.local_decisions += 1
+        return decision
+
+    @property
+    def revision(self) -> Optional[str]:
+        return self.policy.revision if self.policy is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "revision": self.revision,
+            "rules": len(self.policy.rules) if self.policy is not None else 0,
+            "local_decisions": self.local_decisions,
+            "remote_fallbacks": self.remote_fallbacks,
+            "syncs": self.syncs,
+            "sync_errors": self.sync_errors
+        }
+
+
+# -- parity harness ---------------------------------------------------------------
+
+def recorded_inputs(path: str) -> Iterable[Dict[str, Any]]:
+    """
+    Policy inputs from a JSON-lines file: either raw input documents or
+    audit log policy_decision events (rebuilt into the input authorize sent).
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("[AUDIT] "):
+                line = line[len("[AUDIT] "):]
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("event_type") == "policy_decision":
+                details = record.get("details") or {}
+                # authorize_many writes one record holding every decision of the batch
+                for decision in details.get("decisions") or [dict(details, action=record.get("action"))]:
+                    yield {"agent_id": record.get("agent_id"), "action": decision.get("action"),
+                           "resource": decision.get("resource"), "context": decision.get("context") or {}}
+            elif "event_type" not in record:
+                yield record.get("input", record)
+
+
+async def compare_decisions(engine: LocalPolicyEngine, remote, inputs: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Decide every input locally and through `remote` (an async callable
+    returning the OPA result, e.g. OPAPolicyClient(...).evaluate) and
+    report where the allow decisions differ.
+    """
+    compared, fallbacks, local_time = 0, 0, 0.0
+    mismatches: List[Dict[str, Any]] = []
+    seen = set()
+    for input_data in inputs:
+        key = json.dumps(input_data, sort_keys=True, default=str)
+        if key in seen:
+            continue
+        seen.add(key)
+        started = time.perf_counter()
+        local = engine.policy.decide(input_data) if engine.policy is not None else REMOTE
+        local_time += time.perf_counter() - started
+        if local is REMOTE:
+            fallbacks += 1
+            continue
+        expected = await remote(input_data)
+        compared += 1
+        if bool(local.get("allow")) != bool((expected or {}).get("allow")):
+            mismatches.append({"input": input_data, "local": local, "remote": expected})
+    decided = len(seen) - fallbacks
+    return {
+        "inputs": len(seen),
+        "compared": compared,
+        "remote_only": fallbacks,
+        "mismatches": mismatches,
+        "parity": (compared - len(mismatches)) / compared if compared else 1.0,
+        "local_us_per_decision": round(local_time / decided * 1e6, 2) if decided else 0.0
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local policy engine tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    parity = sub.add_parser("parity", help="compare local and remote OPA decisions on recorded inputs")
+    parity.add_argument("--bundle", default=os.getenv("POLICY_BUNDLE", "policy_bundle.json"))
+    parity.add_argument("--inputs", required=True, help="JSON lines of inputs, or an audit log")
+    parity.add_argument("--opa-url", default="http://localhost:8181/v1/data/agent/policy")
+    args = parser.parse_args(argv)
+
+    from .policy import OPAPolicyClient
+
+    async def run():
+        engine = LocalPolicyEngine(args.bundle)
+        await engine.sync()
+        if engine.policy is None:
+            parser.error(f"could not load policy bundle {args.bundle}")
+        report = await compare_decisions(engine, OPAPolicyClient(args.opa_url).evaluate, recorded_inputs(args.inputs))
+        print(json.dumps(report, indent=2, default=str))
+        return report
+
+    report = asyncio.run(run())
+    sys.exit(1 if report["mismatches"] else 0)
+
+
+if __name__ == "__main__":
+    main()
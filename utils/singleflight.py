@@ -0,0 +1,94 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is in
+    flight, later callers with the same key wait for its result instead of
+    starting their own.
+
+    The shared call runs as its own task, so a caller that is cancelled
+    only stops waiting; the call keeps going for the others and is
+    cancelled only when every caller has given up.
+    """
+
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self.max_waiters = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of fn() for key, shared with any identical call already in flight."""
+        self.calls += 1
+        task = self._calls.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        self._waiters[key] += 1
+        self.max_waiters = max(self.max_waiters, self._waiters[key])
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._calls.get(key) is task and self._waiters[key] == 1:
+                # Last one waiting: nobody wants the result any more
+                self.abandoned += 1
+                task.cancel()
+            raise
+        finally:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            # Mark retrieved so an error whose callers all left isn't reported as unhandled
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            # Share of calls answered by another caller's request
+            "coalescing_ratio": self.coalesced / self.calls if self.calls else 0.0,
+            "in_flight": len(self._calls),
+            "max_waiters": self.max_waiters,
+            "abandoned": self.abandoned
+        }
+
+
+_flights: Dict[str, SingleFlight] = {}
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Return the process-wide SingleFlight for name (e.g. "mcp", "llm"), creating it on first use."""
+    flight = _flights.get(name)
+    if flight is None:
+        flight = _flights[name] = SingleFlight(name)
+    return flight
+
+def set_single_flight(name: str, flight: Optional[SingleFlight]) -> Optional[SingleFlight]:
+    """Install (or with None, reset to default) the process-wide SingleFlight for name; returns the previous one."""
+    previous = _flights.pop(name, None)
+    if flight is not None:
+        _flights[name] = flight
+    return previous
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    """stats() of every process-wide SingleFlight, by name."""
+    return {name: flight.stats() for name, flight in sorted(_flights.items())}